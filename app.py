@@ -8,18 +8,25 @@
 import streamlit as st
 import os
 import pandas as pd
-import openpyxl
-from openpyxl import load_workbook
-from openpyxl.styles import Alignment
-from openpyxl.utils import column_index_from_string
 from datetime import datetime
-import tempfile
-import shutil
-from copy import copy
-import zipfile
+import json
 from io import BytesIO
-import hashlib
-import re
+
+from si_batch import FileJob, run_batch
+from si_cache import DEFAULT_CACHE_MAX_MB, DEFAULT_PARSED_CACHE_MB, ParsedWorkbookCache, ResultCache, cache_key
+from si_engine import GROUP_COLUMNS, SIOptions
+from si_export import EXPORT_FORMATS
+from si_jobs import JOB_DONE, JOB_QUEUED, JOB_RUNNING, JobRunner, JobStore, job_progress
+from si_package import OrderedArchiver, ZipPackager
+from si_preflight import preflight
+from si_trace import NULL_TRACER, Tracer, trace_rows
+from si_upload import UploadIntake, UploadRejected
+
+
+@st.cache_resource
+def get_job_runner():
+    """后台任务执行器，整个 Streamlit 进程共用一个"""
+    return JobRunner(JobStore()).start()
 
 
 class SIGeneratorWeb:
@@ -51,10 +58,188 @@ class SIGeneratorWeb:
             st.header("Settings")
             group_column = st.selectbox(
                 "Group by Column",
-                ["O", "P", "Q", "R", "S", "T"],
+                list(GROUP_COLUMNS),
                 index=0,
                 help="Select the column to group data by"
             )
+            with st.expander("Grouping"):
+                extra_key_columns = st.text_input(
+                    "Additional Key Columns",
+                    value="",
+                    help="Comma-separated header names or column letters combined with the group column into one key"
+                )
+                key_case = st.selectbox(
+                    "Key Case",
+                    ["keep", "upper", "lower"],
+                    help="Group keys that only differ in case together"
+                )
+                collapse_spaces = st.checkbox("Collapse spaces in keys", value=False)
+                normalize_numbers = st.checkbox(
+                    "Normalize numeric keys",
+                    value=False,
+                    help="1001, 1001.0 and \"1,001\" become the same key"
+                )
+                group_order = st.selectbox(
+                    "Group Order",
+                    ["first", "key", "size"],
+                    format_func={"first": "As in the sheet", "key": "By key", "size": "Largest first"}.get
+                )
+                group_descending = st.checkbox("Reverse group order", value=False)
+                row_order = st.text_input(
+                    "Sort Rows By",
+                    value="",
+                    help="Comma-separated header names or column letters; rows keep sheet order when empty"
+                )
+                row_descending = st.checkbox("Sort rows descending", value=False)
+
+            engine_label = st.selectbox(
+                "Rendering Engine",
+                ["Fast (XML patch)", "openpyxl"],
+                index=0,
+                help="Fast mode patches the template XML directly and falls back to openpyxl when needed"
+            )
+            workers = st.number_input(
+                "Parallel Workers",
+                min_value=1,
+                max_value=os.cpu_count() or 1,
+                value=1,
+                help="Number of processes generating SI files of one workbook in parallel"
+            )
+            file_concurrency = st.number_input(
+                "Concurrent Files",
+                min_value=1,
+                max_value=os.cpu_count() or 1,
+                value=1,
+                help="Number of uploaded files processed at the same time"
+            )
+            memory_budget_mb = st.number_input(
+                "Memory Budget (MB)",
+                min_value=256,
+                value=2048,
+                step=256,
+                help="Files are only started concurrently while their estimated memory fits in this budget"
+            )
+            memory_limit_mb = st.number_input(
+                "Memory Limit (MB)",
+                min_value=0,
+                value=0,
+                step=256,
+                help="0 = unlimited. Otherwise a file that would push memory past this limit fails with a "
+                     "message instead of crashing"
+            )
+            with st.expander("Upload Limits"):
+                max_file_mb = st.number_input(
+                    "Max File Size (MB)",
+                    min_value=0,
+                    value=0,
+                    step=50,
+                    help="0 = unlimited. Larger uploads are rejected before they are parsed"
+                )
+                max_batch_mb = st.number_input(
+                    "Max Batch Size (MB)",
+                    min_value=0,
+                    value=0,
+                    step=100,
+                    help="0 = unlimited. Uploads beyond this total are rejected before they are parsed"
+                )
+            with st.expander("Consolidated Split"):
+                consolidated_max_sheets = st.number_input(
+                    "Sheets per File",
+                    min_value=0,
+                    value=0,
+                    step=50,
+                    help="0 = one consolidated file. Otherwise it is split into numbered parts of at most this many sheets"
+                )
+                consolidated_max_mb = st.number_input(
+                    "MB per File",
+                    min_value=0,
+                    value=0,
+                    step=10,
+                    help="0 = no size limit. Otherwise a new numbered part starts before a file would grow past this size"
+                )
+            with st.expander("Compression"):
+                archive_compresslevel = st.selectbox(
+                    "ZIP compression",
+                    [None, 1, 6, 9],
+                    format_func=lambda level: "Store xlsx as-is (fastest)" if level is None else f"Deflate level {level}",
+                    help="xlsx files are already compressed; deflating them again mostly costs time"
+                )
+                xlsx_compresslevel = st.selectbox(
+                    "xlsx compression",
+                    [None, 1, 6, 9],
+                    format_func=lambda level: "Default" if level is None else f"Deflate level {level}",
+                    help="Lower levels save faster, higher levels give smaller SI files"
+                )
+            with st.expander("Result Cache"):
+                use_cache = st.checkbox(
+                    "Reuse previous results",
+                    value=True,
+                    help="Files that were already processed with the same settings are not generated again"
+                )
+                cache_max_mb = st.number_input(
+                    "Cache Size (MB)",
+                    min_value=64,
+                    value=DEFAULT_CACHE_MAX_MB,
+                    step=64,
+                    help="Least recently used results are removed once the cache grows beyond this size"
+                )
+                parsed_cache_mb = st.number_input(
+                    "Parsed Workbook Memory (MB)",
+                    min_value=0,
+                    value=DEFAULT_PARSED_CACHE_MB,
+                    step=128,
+                    help="Parsed uploads are kept in memory so changing settings does not read them again"
+                )
+                parsed_cache = self.get_parsed_cache()
+                parsed_cache.resize(parsed_cache_mb)
+                if st.button("Clear Parsed Workbooks", use_container_width=True):
+                    parsed_cache.clear()
+                # 上传列表清空后不再保留解析结果
+                if not uploaded_files:
+                    parsed_cache.clear()
+            incremental = st.checkbox(
+                "Only regenerate changed groups",
+                value=True,
+                help="When saving next to the input files, groups whose rows did not change keep their existing SI files"
+            )
+            exports = st.multiselect(
+                "Data Exports",
+                EXPORT_FORMATS,
+                default=[],
+                help="Also write the grouped data as CSV, JSON Lines and/or a columnar file (Parquet when pyarrow "
+                     "is installed), with a manifest mapping every group to its SI file"
+            )
+            trace = st.checkbox(
+                "Performance trace",
+                value=False,
+                help="Show time and memory spent in each processing stage, downloadable as JSON"
+            )
+            key_columns = [group_column] + [ref.strip() for ref in extra_key_columns.split(",") if ref.strip()]
+            options = SIOptions(
+                key_columns if len(key_columns) > 1 else group_column,
+                engine="xml" if engine_label.startswith("Fast") else "openpyxl",
+                workers=workers,
+                file_concurrency=file_concurrency,
+                memory_budget_mb=memory_budget_mb,
+                xlsx_compresslevel=xlsx_compresslevel,
+                archive_compresslevel=archive_compresslevel,
+                cache_max_mb=cache_max_mb if use_cache else 0,
+                incremental=incremental,
+                trace=trace,
+                memory_limit_mb=memory_limit_mb,
+                consolidated_max_sheets=consolidated_max_sheets,
+                consolidated_max_mb=consolidated_max_mb,
+                exports=exports,
+                grouping={
+                    "case": key_case,
+                    "collapse_spaces": collapse_spaces,
+                    "numbers": normalize_numbers,
+                    "group_order": group_order,
+                    "descending": group_descending,
+                    "row_order": [ref.strip() for ref in row_order.split(",") if ref.strip()],
+                    "row_descending": row_descending,
+                }
+            )
 
             # 添加输出目录选择
             output_option = st.radio(
@@ -62,12 +247,21 @@ class SIGeneratorWeb:
                 ["Same as input files", "Download only"],
                 help="Choose where to save the generated files"
             )
+            run_in_background = st.checkbox(
+                "Run in background",
+                value=False,
+                help="Process as a background job that keeps running after a page refresh; results are downloaded when ready"
+            )
 
             if st.button("Generate SI Files", type="primary", use_container_width=True):
-                if uploaded_files:
-                    self.process_files(uploaded_files, group_column, output_option)
-                else:
+                if not uploaded_files:
                     st.error("Please upload at least one Excel file")
+                elif run_in_background:
+                    self.submit_job(uploaded_files, options, UploadIntake(max_file_mb, max_batch_mb))
+                else:
+                    self.process_files(uploaded_files, options, output_option, UploadIntake(max_file_mb, max_batch_mb))
+
+        self.show_jobs()
 
         # Main area for instructions
         st.markdown("""
@@ -92,104 +286,268 @@ class SIGeneratorWeb:
         - All files will be saved in a folder next to your original file
         """)
 
-    def process_files(self, uploaded_files, group_column, output_option):
+    @staticmethod
+    def receive_uploads(uploaded_files, intake, log_container):
+        """Spool the uploads through ``intake``; rejected files are reported and left out"""
+        uploads = []
+        for uploaded_file in uploaded_files:
+            try:
+                uploads.append(intake.receive(uploaded_file.name, uploaded_file))
+            except UploadRejected as e:
+                log_container.error(f"❌ Rejected {uploaded_file.name}: {e}")
+        spooled = sum(1 for upload in uploads if not upload.in_memory)
+        if spooled:
+            log_container.info(f"💽 {spooled} large upload(s) spooled to disk")
+        return uploads
+
+    def process_files(self, uploaded_files, options, output_option, intake):
         progress_bar = st.progress(0)
         status_text = st.empty()
         log_container = st.container()
 
-        total_files = len(uploaded_files)
         processed_files = 0
+        download_only = output_option == "Download only"
 
-        # 如果选择"Download only"，我们仍然需要临时目录
-        if output_option == "Download only":
-            # Create a ZIP file to store all results
-            zip_buffer = BytesIO()
-            with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-
-                for i, uploaded_file in enumerate(uploaded_files):
-                    progress = i / total_files
-                    progress_bar.progress(progress)
-                    status_text.text(f"Processing {i + 1}/{total_files}: {uploaded_file.name}")
-
-                    try:
-                        # Process single file - 下载模式下使用临时目录
-                        result_files = self.process_single_file_download(uploaded_file, group_column, log_container)
-
-                        # Add files to ZIP
-                        for file_path in result_files:
-                            zip_file.write(file_path, os.path.basename(file_path))
-
-                        processed_files += 1
-                        log_container.success(f"✅ Successfully processed: {uploaded_file.name}")
-
-                    except Exception as e:
-                        log_container.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
-                        continue
-
-                progress_bar.progress(1.0)
-                status_text.text("Processing completed!")
-
-            # Provide download link
-            if processed_files > 0:
-                zip_buffer.seek(0)
-                st.download_button(
-                    label="📥 Download All SI Files",
-                    data=zip_buffer,
-                    file_name=f"SI_Files_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
-                    mime="application/zip",
-                    use_container_width=True
+        save_dir = None
+        if not download_only:
+            save_dir = self.get_save_directory()
+            if not os.access(save_dir, os.W_OK):
+                log_container.warning(
+                    f"⚠️ Cannot access original file location, using download mode instead: {save_dir}"
                 )
+                download_only = True
+                save_dir = None
 
-                st.success(f"🎉 Successfully processed {processed_files}/{total_files} files!")
+        # 分块接收上传：小文件留在内存，大文件转存到磁盘，超限的文件不再解析
+        jobs = [
+            FileJob(upload.name, upload, save_dir, keep_parsed=True)
+            for upload in self.receive_uploads(uploaded_files, intake, log_container)
+        ]
+        # 被拒绝的上传不计入进度
+        total_files = len(jobs)
+        if not jobs:
+            st.error("No upload was accepted")
+            return
+
+        # 同一会话中已解析过的文件直接复用，已移除的上传不再保留
+        parsed_cache = self.get_parsed_cache()
+        parsed_cache.retain({job.digest for job in jobs})
+        for job in jobs:
+            job.parsed = parsed_cache.get(job.digest)
+        reused_parsed = sum(1 for job in jobs if job.parsed is not None)
+
+        cache = None
+        if options.cache_max_mb:
+            try:
+                cache = ResultCache(max_mb=options.cache_max_mb)
+            except OSError as e:
+                log_container.warning(f"⚠️ Result cache unavailable, processing without it: {e}")
+
+        if options.preflight:
+            self.show_preflight(jobs, options, cache, log_container)
+
+        packager = ZipPackager(options.archive_compresslevel) if download_only else None
+        # 逐个处理时每个SI生成后立即写入 ZIP；并发时按上传顺序写入
+        streaming = packager is not None and options.file_concurrency <= 1
+        archiver = OrderedArchiver(packager) if packager is not None and not streaming else None
+
+        status_text.text(f"Processing {total_files} files...")
+        completed = 0
+        batch = run_batch(
+            jobs, options, options.file_concurrency, options.memory_budget, packager if streaming else None, cache
+        )
+        traces = []
+        for index, result in batch:
+            completed += 1
+            progress_bar.progress(completed / total_files)
+            status_text.text(f"Processed {completed}/{total_files}: {result.name}")
+
+            if result.parsed is not None:
+                parsed_cache.put(jobs[index].digest, result.parsed)
+                result.parsed = None
+
+            result.replay_log(log_container)
+            if result.error:
+                log_container.error(f"❌ Error processing {result.name}: {result.error}")
             else:
-                st.error("No files were successfully processed.")
-
-        else:  # Same as input files
-            for i, uploaded_file in enumerate(uploaded_files):
-                progress = i / total_files
-                progress_bar.progress(progress)
-                status_text.text(f"Processing {i + 1}/{total_files}: {uploaded_file.name}")
-
-                try:
-                    # Process single file - 保存到原始文件目录
-                    result_files = self.process_single_file_local(uploaded_file, group_column, log_container)
-
-                    processed_files += 1
-                    log_container.success(f"✅ Successfully processed: {uploaded_file.name}")
-
-                    # 显示保存路径
-                    if result_files:
-                        first_file_dir = os.path.dirname(result_files[0])
-                        log_container.info(f"   📁 Files saved to: {first_file_dir}")
-
-                except Exception as e:
-                    log_container.error(f"❌ Error processing {uploaded_file.name}: {str(e)}")
-                    continue
-
-            progress_bar.progress(1.0)
-            status_text.text("Processing completed!")
+                processed_files += 1
+                log_container.success(f"✅ Successfully processed: {result.name}")
+
+                # 显示保存路径
+                if not download_only and result.result_files:
+                    first_file_dir = os.path.dirname(result.result_files[0].path)
+                    log_container.info(f"   📁 Files saved to: {first_file_dir}")
+
+            # 缓存命中的文件没有追踪数据
+            if result.trace is not None:
+                traces.append(result.trace)
+                log_container.caption(f"⏱️ {result.name}: {result.trace['total_wall_ms'] / 1000:.2f}s")
+                log_container.dataframe(pd.DataFrame(trace_rows(result.trace)), hide_index=True)
+
+            # 按上传顺序写入 ZIP，保证输出顺序稳定
+            if archiver is not None:
+                archiver.add(index, result.result_files)
+
+        # 处理完即删除转存的上传
+        for job in jobs:
+            job.release()
+
+        progress_bar.progress(1.0)
+        status_text.text("Processing completed!")
+        if cache is not None:
+            log_container.info(f"♻️ Result cache: {cache.hits} hit(s), {cache.misses} miss(es)")
+        if reused_parsed:
+            log_container.info(f"⚡ Reused {reused_parsed} parsed workbook(s) from this session")
+
+        if processed_files == 0:
+            st.error("No files were successfully processed.")
+            return
+
+        # Provide download link
+        batch_tracer = Tracer("batch") if options.trace else NULL_TRACER
+        if download_only:
+            with batch_tracer.stage("zip_finalize"):
+                archive = packager.getvalue()
+            st.download_button(
+                label="📥 Download All SI Files",
+                data=archive,
+                file_name=f"SI_Files_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip",
+                mime="application/zip",
+                use_container_width=True
+            )
 
-            if processed_files > 0:
-                st.success(f"🎉 Successfully processed {processed_files}/{total_files} files!")
-                st.info("💡 Generated files have been saved in the same folders as your original Excel files.")
-            else:
-                st.error("No files were successfully processed.")
+        if options.trace:
+            st.download_button(
+                label="📈 Download Trace JSON",
+                data=json.dumps({"files": traces, "batch": batch_tracer.to_dict()}, ensure_ascii=False, indent=2),
+                file_name=f"SI_Trace_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
+                mime="application/json",
+                use_container_width=True
+            )
 
-    def process_single_file_download(self, uploaded_file, group_column, log_container):
-        """处理文件并返回文件路径（下载模式）"""
-        # 创建临时目录
-        with tempfile.TemporaryDirectory() as temp_dir:
-            return self._process_single_file(uploaded_file, group_column, log_container, temp_dir)
+        st.success(f"🎉 Successfully processed {processed_files}/{total_files} files!")
+        if not download_only:
+            st.info("💡 Generated files have been saved in the same folders as your original Excel files.")
+
+    def show_preflight(self, jobs, options, cache, log_container):
+        """Check the uploads that will be processed and show what each will produce.
+
+        Like run_batch, duplicates and uploads with a cached result are not
+        checked; parsed workbooks of this session are grouped without reading
+        the upload again.
+        """
+        rows = []
+        checked = []
+        seen = set()
+        for job in jobs:
+            key = cache_key(job.digest, job.name, options)
+            if key in seen:
+                rows.append({"File": job.name, "Status": "Duplicate upload"})
+                continue
+            seen.add(key)
+            if cache is not None and key in cache:
+                rows.append({"File": job.name, "Status": "Cached result"})
+                continue
+            job.preflight = report = preflight(job.upload, job.name, options, parsed=job.parsed)
+            checked.append(job)
+            rows.append({
+                "File": job.name,
+                "Status": "OK" if report.ok else "; ".join(report.errors),
+                "Rows": report.rows,
+                "Groups": report.groups,
+                "Largest Group": report.largest_group,
+                "Missing Headers": ", ".join(report.missing_headers),
+                "Est. Output (MB)": round(report.estimated_bytes / 1024 / 1024, 1),
+                "Est. Time (s)": round(report.estimated_seconds, 1),
+            })
+        accepted = [job.preflight for job in checked if job.preflight.ok]
+        log_container.caption(
+            f"🧭 Pre-flight: {len(accepted)}/{len(checked)} files accepted, about "
+            f"{sum(report.estimated_seconds for report in accepted):.0f}s of work"
+        )
+        log_container.dataframe(pd.DataFrame(rows), hide_index=True, use_container_width=True)
+
+    def get_job_ids(self):
+        """IDs of this session's background jobs, also kept in the URL to survive a refresh"""
+        if "job_ids" not in st.session_state:
+            st.session_state["job_ids"] = list(st.experimental_get_query_params().get("job", []))
+        return st.session_state["job_ids"]
+
+    def submit_job(self, uploaded_files, options, intake):
+        uploads = self.receive_uploads(uploaded_files, intake, st)
+        if not uploads:
+            return
+        runner = get_job_runner()
+        job_id = runner.store.submit([(upload.name, upload) for upload in uploads], options)
+        for upload in uploads:
+            upload.discard()
+        runner.wake()
+
+        job_ids = self.get_job_ids()
+        job_ids.append(job_id)
+        st.experimental_set_query_params(job=job_ids)
+        st.success(f"📨 Submitted background job {job_id} with {len(uploads)} files")
+
+    def show_jobs(self):
+        job_ids = self.get_job_ids()
+        if not job_ids:
+            return
+
+        store = get_job_runner().store
+        st.subheader("🗂️ Background Jobs")
+        st.button("🔄 Refresh Status")
+        for job_id in reversed(job_ids):
+            try:
+                state = store.status(job_id)
+            except KeyError:
+                st.warning(f"⚠️ Job {job_id} no longer exists")
+                continue
+
+            finished, total = job_progress(state)
+            active = state["status"] in (JOB_QUEUED, JOB_RUNNING)
+            with st.expander(f"{job_id}: {state['status']} ({finished}/{total} files)", expanded=active):
+                st.progress(finished / total if total else 1.0)
+                st.dataframe(pd.DataFrame([
+                    {
+                        "File": entry["name"],
+                        "Status": entry["status"],
+                        "SI Files": len(entry["files"]),
+                        "Error": entry["error"] or "",
+                    }
+                    for entry in state["files"]
+                ]), use_container_width=True)
+                if state["error"]:
+                    st.error(f"❌ {state['error']}")
+
+                result_path = store.result_path(job_id)
+                if state["status"] == JOB_DONE and result_path:
+                    with open(result_path, 'rb') as f:
+                        st.download_button(
+                            label="📥 Download All SI Files",
+                            data=f.read(),
+                            file_name=f"SI_Files_{job_id}.zip",
+                            mime="application/zip",
+                            key=f"download_{job_id}",
+                            use_container_width=True
+                        )
+                elif active and any(entry["status"] == JOB_DONE for entry in state["files"]):
+                    # 已完成文件的部分结果
+                    partial = BytesIO()
+                    store.write_archive(job_id, partial, state)
+                    st.download_button(
+                        label="📥 Download Finished Files So Far",
+                        data=partial.getvalue(),
+                        file_name=f"SI_Files_{job_id}_partial.zip",
+                        mime="application/zip",
+                        key=f"partial_{job_id}",
+                        use_container_width=True
+                    )
 
-    def process_single_file_local(self, uploaded_file, group_column, log_container):
-        """处理文件并保存到原始文件目录"""
-        # 获取用户桌面路径作为默认保存位置
-        try:
-            save_dir = self.get_save_directory()
-            return self._process_single_file(uploaded_file, group_column, log_container, save_dir)
-        except Exception as e:
-            log_container.warning(f"⚠️ Cannot access original file location, using download mode instead: {str(e)}")
-            return self.process_single_file_download(uploaded_file, group_column, log_container)
+    def get_parsed_cache(self):
+        """Parsed uploads kept across reruns of this session"""
+        if "parsed_workbooks" not in st.session_state:
+            st.session_state["parsed_workbooks"] = ParsedWorkbookCache()
+        return st.session_state["parsed_workbooks"]
 
     def get_save_directory(self):
         """获取保存目录"""
@@ -203,249 +561,6 @@ class SIGeneratorWeb:
         except:
             return os.getcwd()
 
-    def _process_single_file(self, uploaded_file, group_column, log_container, base_dir):
-        """处理单个文件的通用逻辑"""
-        # 创建临时文件来处理上传的内容
-        temp_file_path = os.path.join(base_dir, f"temp_{uploaded_file.name}")
-        with open(temp_file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-
-        try:
-            # Load workbook
-            workbook = load_workbook(temp_file_path, data_only=True)
-
-            # Check required sheets
-            if 'No SI Order' not in workbook.sheetnames:
-                raise Exception("'No SI Order' sheet not found")
-
-            if 'SI Template' not in workbook.sheetnames:
-                raise Exception("'SI Template' sheet not found")
-
-            # Get data from sheets
-            order_sheet = workbook['No SI Order']
-            template_sheet = workbook['SI Template']
-
-            # Group data
-            grouped_data = self.group_data_by_column(order_sheet, group_column)
-
-            if not grouped_data:
-                raise Exception(f"No valid data found in column {group_column}")
-
-            log_container.info(f"📁 {uploaded_file.name}: Found {len(grouped_data)} groups")
-
-            # 创建输出目录 - 使用完整的原始文件名
-            file_base_name = os.path.splitext(uploaded_file.name)[0]
-            output_folder = os.path.join(base_dir, f"SI_Output_{file_base_name}")
-            os.makedirs(output_folder, exist_ok=True)
-
-            result_files = []
-            si_count = 0
-
-            # Create consolidated workbook
-            consolidated_wb = openpyxl.Workbook()
-            consolidated_wb.remove(consolidated_wb.active)
-
-            for group_key, rows in grouped_data.items():
-                try:
-                    # Create individual SI file
-                    individual_si_path = self.create_individual_si(
-                        group_key, rows, order_sheet, template_sheet, output_folder, uploaded_file.name
-                    )
-                    result_files.append(individual_si_path)
-
-                    # Add to consolidated workbook
-                    self.add_to_consolidated_workbook(
-                        group_key, rows, order_sheet, template_sheet, consolidated_wb
-                    )
-
-                    si_count += 1
-                    log_container.info(f"   ✅ Created SI for group: {group_key}")
-
-                except Exception as e:
-                    log_container.warning(f"   ⚠️ Skipped group {group_key}: {str(e)}")
-                    continue
-
-            # Save consolidated workbook - 使用完整文件名
-            if si_count > 0:
-                consolidated_filename = f"Consolidated_SI_{file_base_name}.xlsx"
-                consolidated_path = os.path.join(output_folder, consolidated_filename)
-                consolidated_wb.save(consolidated_path)
-                result_files.append(consolidated_path)
-
-            return result_files
-
-        finally:
-            # 清理临时文件
-            if os.path.exists(temp_file_path):
-                os.remove(temp_file_path)
-
-    def group_data_by_column(self, sheet, column_letter):
-        """Group data by specified column"""
-        grouped_data = {}
-
-        try:
-            col_idx = column_index_from_string(column_letter)
-
-            for row in range(2, sheet.max_row + 1):
-                cell_value = sheet.cell(row=row, column=col_idx).value
-                if cell_value and str(cell_value).strip():
-                    key = str(cell_value).strip()
-                    if key not in grouped_data:
-                        grouped_data[key] = []
-                    grouped_data[key].append(row)
-
-        except Exception as e:
-            raise Exception(f"Error grouping data: {str(e)}")
-
-        return grouped_data
-
-    def copy_sheet_with_formatting(self, source_sheet, target_sheet):
-        """Copy entire sheet with all formatting"""
-        try:
-            # Copy column dimensions
-            for col_letter, col_dim in source_sheet.column_dimensions.items():
-                target_sheet.column_dimensions[col_letter].width = col_dim.width
-                if col_dim.hidden:
-                    target_sheet.column_dimensions[col_letter].hidden = True
-
-            # Copy row dimensions
-            for row_num, row_dim in source_sheet.row_dimensions.items():
-                target_sheet.row_dimensions[row_num].height = row_dim.height
-                if row_dim.hidden:
-                    target_sheet.row_dimensions[row_num].hidden = True
-
-            # Copy merged cells
-            for merged_range in source_sheet.merged_cells.ranges:
-                target_sheet.merge_cells(str(merged_range))
-
-            # Copy all cells with formatting
-            for row in source_sheet.iter_rows():
-                for cell in row:
-                    new_cell = target_sheet.cell(row=cell.row, column=cell.column, value=cell.value)
-
-                    if cell.has_style:
-                        new_cell.font = copy(cell.font)
-                        new_cell.border = copy(cell.border)
-                        new_cell.fill = copy(cell.fill)
-                        new_cell.number_format = cell.number_format
-                        new_cell.protection = copy(cell.protection)
-                        new_cell.alignment = copy(cell.alignment)
-
-                    if cell.hyperlink:
-                        new_cell.hyperlink = cell.hyperlink
-                        new_cell.style = "Hyperlink"
-
-            target_sheet.page_setup = copy(source_sheet.page_setup)
-
-            if hasattr(source_sheet, 'print_options'):
-                target_sheet.print_options = copy(source_sheet.print_options)
-
-        except Exception as e:
-            raise Exception(f"Error copying sheet formatting: {str(e)}")
-
-    def create_individual_si(self, group_key, rows, order_sheet, template_sheet, output_folder, original_filename):
-        """Create individual SI Excel file for a group"""
-        si_wb = openpyxl.Workbook()
-        si_wb.remove(si_wb.active)
-
-        si_sheet = si_wb.create_sheet(title="SI")
-        self.copy_sheet_with_formatting(template_sheet, si_sheet)
-
-        # Fill specific information
-        self.fill_specific_info(order_sheet, si_sheet, rows[0])
-
-        # Fill table data
-        self.fill_table_data(order_sheet, si_sheet, rows)
-
-        # 使用完整的原始文件名，不再截断
-        safe_group_key = self.create_safe_filename(group_key)
-        file_base_name = os.path.splitext(original_filename)[0]  # 不再限制长度
-
-        # 使用完整的文件名格式
-        si_filename = f"SI_{safe_group_key}_{file_base_name}.xlsx"
-        si_path = os.path.join(output_folder, si_filename)
-
-        si_wb.save(si_path)
-
-        return si_path
-
-    def create_safe_filename(self, text):
-        """创建安全的文件名，移除特殊字符但保持完整内容"""
-        # 只移除Windows不允许的特殊字符，保持其他内容完整
-        safe_text = re.sub(r'[<>:"/\\|?*]', '', text)
-        safe_text = re.sub(r'\s+', ' ', safe_text.strip())  # 保留空格，不替换为下划线
-        return safe_text  # 不再限制长度
-
-    def fill_specific_info(self, order_sheet, si_sheet, first_data_row):
-        """Fill specific information into SI template"""
-        field_mapping = [
-            ("Destination Port", "B1"),
-            ("Customer Name", "B2"),
-            ("Payment Term", "B3"),
-            ("Transport Mode", "B5"),
-            ("Incoterm", "B6"),
-            ("Forwarder Name", "B13"),
-            ("Forwarder Contact Person", "B14"),
-            ("Forwarder Telephone No", "B15"),
-            ("Forwarder E-Mail", "B16")
-        ]
-
-        for field_name, cell_address in field_mapping:
-            col_idx = self.find_column_index(order_sheet, field_name)
-            if col_idx:
-                value = order_sheet.cell(row=first_data_row, column=col_idx).value
-                si_sheet[cell_address].value = value
-
-    def fill_table_data(self, order_sheet, si_sheet, data_rows):
-        """Fill table data starting from row 19"""
-        columns_to_copy = [
-            "Order Nbr", "Total Qty", "Shipment Wt", "Volumetric Wt",
-            "Age (Days)", "PO Nbr", "Sales Rep Name"
-        ]
-
-        start_row = 19
-
-        for i, source_row in enumerate(data_rows):
-            target_row = start_row + i
-
-            if target_row > si_sheet.max_row:
-                for col in range(1, len(columns_to_copy) + 1):
-                    source_cell = si_sheet.cell(row=target_row - 1, column=col)
-                    target_cell = si_sheet.cell(row=target_row, column=col)
-
-                    if source_cell.has_style:
-                        target_cell.font = copy(source_cell.font)
-                        target_cell.border = copy(source_cell.border)
-                        target_cell.fill = copy(source_cell.fill)
-                        target_cell.number_format = source_cell.number_format
-                        target_cell.protection = copy(source_cell.protection)
-                        target_cell.alignment = copy(source_cell.alignment)
-
-            for col_idx, column_name in enumerate(columns_to_copy, 1):
-                source_col_idx = self.find_column_index(order_sheet, column_name)
-                if source_col_idx:
-                    value = order_sheet.cell(row=source_row, column=source_col_idx).value
-                    si_sheet.cell(row=target_row, column=col_idx).value = value
-
-    def add_to_consolidated_workbook(self, group_key, rows, order_sheet, template_sheet, consolidated_wb):
-        """Add SI data to consolidated workbook"""
-        # 使用完整的组名作为工作表名称
-        safe_sheet_name = "".join(c for c in str(group_key) if c.isalnum() or c in (' ', '-', '_')).rstrip()
-        safe_sheet_name = f"SI_{safe_sheet_name}"  # 不再截断
-
-        si_sheet = consolidated_wb.create_sheet(title=safe_sheet_name)
-        self.copy_sheet_with_formatting(template_sheet, si_sheet)
-
-        self.fill_specific_info(order_sheet, si_sheet, rows[0])
-        self.fill_table_data(order_sheet, si_sheet, rows)
-
-    def find_column_index(self, sheet, column_name):
-        """Find column index by header name"""
-        for cell in sheet[1]:
-            if cell.value and str(cell.value).strip().lower() == column_name.lower():
-                return cell.column
-        return None
-
 
 def main():
     app = SIGeneratorWeb()
@@ -0,0 +1,210 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 21:45
+# @Author  : Healer
+# @File    : bench_pipeline.py
+# @Software: PyCharm
+
+"""Time every stage of the SI pipeline on a synthetic workbook.
+
+Usage::
+
+    python benchmarks/bench_pipeline.py --rows 20000 --groups 400 --skew 1.2
+    python benchmarks/bench_pipeline.py --compare benchmarks/results/old.json
+
+Each stage is timed in one pass and measured with tracemalloc in a second
+pass, so the memory bookkeeping does not distort the timings. Results are
+written as JSON (``benchmarks/results/<time>_<commit>.json`` by default).
+"""
+
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from io import BytesIO
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+import openpyxl
+
+from si_engine import (
+    ConsolidatedSink, MemoryOutput, TemplateSnapshot, TEMPLATE_SHEET_NAME, copy_sheet_with_formatting,
+    fill_specific_info, fill_table_data, group_data_by_column, load_template_workbook, read_order_sheet, render_group,
+    save_workbook
+)
+from synthetic import make_workbook
+from xlsx_template import XlsxTemplate
+
+RESULTS_DIR = os.path.join(ROOT, "benchmarks", "results")
+
+
+class StageTimer:
+    """Accumulates wall time, item counts and tracemalloc peaks per stage"""
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = {}
+
+    def run(self, name, unit, items, func, *args):
+        stage = self.stages.setdefault(name, {"seconds": 0.0, "items": 0, "unit": unit, "peak_kb": None})
+        if self.trace_memory:
+            tracemalloc.reset_peak()
+            baseline = tracemalloc.get_traced_memory()[0]
+        started = time.perf_counter()
+        result = func(*args)
+        stage["seconds"] += time.perf_counter() - started
+        stage["items"] += items
+        if self.trace_memory:
+            peak = (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+            stage["peak_kb"] = max(stage["peak_kb"] or 0.0, round(peak, 1))
+        return result
+
+
+def run_pipeline(path, group_column, sample_groups, timer):
+    """Run every stage once; per-SI stages cover the first ``sample_groups`` groups"""
+    order_data = timer.run("load_order_sheet", "rows", 0, read_order_sheet, path, [group_column])
+    timer.stages["load_order_sheet"]["items"] = len(order_data)
+    workbook = timer.run("load_template", "workbooks", 1, load_template_workbook, path)
+    template = timer.run("snapshot_template", "templates", 1, TemplateSnapshot, workbook[TEMPLATE_SHEET_NAME])
+
+    grouped = timer.run("group_data_by_column", "rows", len(order_data), group_data_by_column, order_data, group_column)
+    plan = order_data.plan
+    records = timer.run(
+        "group_records", "groups", len(grouped),
+        lambda: [order_data.group_record(key, positions) for key, positions in grouped.items()]
+    )
+    rendered_groups = timer.run(
+        "render_group", "groups", len(records),
+        lambda: [render_group(record, plan, template.max_row) for record in records]
+    )
+
+    sample = rendered_groups[:sample_groups] if sample_groups else rendered_groups
+    for rendered in sample:
+        si_workbook = openpyxl.Workbook()
+        si_sheet = si_workbook.active
+        timer.run("copy_sheet_with_formatting", "sheets", 1, copy_sheet_with_formatting, template, si_sheet)
+        timer.run("fill_specific_info", "sheets", 1, fill_specific_info, si_sheet, rendered)
+        timer.run("fill_table_data", "rows", len(rendered.table_rows), fill_table_data, si_sheet, rendered)
+        timer.run("save", "files", 1, save_workbook, si_workbook, BytesIO())
+
+    xlsx_template = timer.run("compile_xml_template", "templates", 1, XlsxTemplate, template)
+    for rendered in sample:
+        timer.run("xml_render", "files", 1, xlsx_template.render, rendered, BytesIO())
+
+    sink = ConsolidatedSink(template, MemoryOutput(), "Consolidated_SI_bench.xlsx")
+    for rendered in rendered_groups:
+        timer.run("consolidated_write", "sheets", 1, sink.write, rendered)
+    timer.run("consolidated_save", "workbooks", 1, sink.close)
+    return len(order_data), len(grouped)
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def benchmark(args):
+    workbook_path = args.workbook
+    if not workbook_path:
+        workbook_path = os.path.join(tempfile.gettempdir(), f"si_bench_{args.rows}_{args.groups}_{args.seed}.xlsx")
+        started = time.perf_counter()
+        make_workbook(workbook_path, args.rows, args.groups, args.skew, args.template_cells, args.merges,
+                      args.styles, args.seed)
+        print(f"Generated {workbook_path} in {time.perf_counter() - started:.2f}s", file=sys.stderr)
+
+    timer = StageTimer()
+    rows, groups = run_pipeline(workbook_path, args.group_column, args.sample_groups, timer)
+    stages = timer.stages
+
+    if not args.no_memory:
+        memory_timer = StageTimer(trace_memory=True)
+        tracemalloc.start()
+        try:
+            run_pipeline(workbook_path, args.group_column, args.sample_groups, memory_timer)
+        finally:
+            tracemalloc.stop()
+        for name, stage in memory_timer.stages.items():
+            stages[name]["peak_kb"] = stage["peak_kb"]
+
+    for stage in stages.values():
+        stage["seconds"] = round(stage["seconds"], 6)
+        stage["per_second"] = round(stage["items"] / stage["seconds"], 1) if stage["seconds"] else None
+
+    return {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec='seconds'),
+            "python": platform.python_version(),
+            "openpyxl": openpyxl.__version__,
+            "workbook": workbook_path,
+            "workbook_bytes": os.path.getsize(workbook_path),
+            "rows": rows,
+            "groups": groups,
+            "params": {key: value for key, value in vars(args).items() if key not in ("output", "compare")},
+        },
+        "stages": stages,
+    }
+
+
+def print_table(result, baseline=None):
+    print(f"{'stage':<28}{'seconds':>10}{'items/s':>12}{'peak KB':>12}" + ("{:>10}".format('vs base') if baseline else ""))
+    for name, stage in result["stages"].items():
+        peak = f"{stage['peak_kb']:.1f}" if stage["peak_kb"] is not None else "-"
+        line = f"{name:<28}{stage['seconds']:>10.3f}{stage['per_second'] or 0:>12.1f}{peak:>12}"
+        if baseline:
+            old = baseline["stages"].get(name)
+            line += f"{stage['seconds'] / old['seconds']:>9.2f}x" if old and old["seconds"] else f"{'-':>10}"
+        print(line)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the SI pipeline stage by stage")
+    parser.add_argument("--workbook", help="Benchmark this workbook instead of a generated one")
+    parser.add_argument("--rows", type=int, default=5000)
+    parser.add_argument("--groups", type=int, default=100)
+    parser.add_argument("--skew", type=float, default=0.0, help="Group size skew (0 = equal groups)")
+    parser.add_argument("--template-cells", type=int, default=60, help="Extra styled cells in the template")
+    parser.add_argument("--merges", type=int, default=2, help="Merged ranges in the template")
+    parser.add_argument("--styles", type=int, default=4, help="Distinct cell styles in the template")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--group-column", default="O")
+    parser.add_argument("--sample-groups", type=int, default=50,
+                        help="Groups that go through the per-SI stages (0 = all)")
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass")
+    parser.add_argument("--output", help="Result JSON path")
+    parser.add_argument("--compare", help="Earlier result JSON to compare the timings against")
+    return parser
+
+
+def main(argv=None):
+    args = build_parser().parse_args(argv)
+    result = benchmark(args)
+
+    output = args.output
+    if not output:
+        os.makedirs(RESULTS_DIR, exist_ok=True)
+        output = os.path.join(RESULTS_DIR, f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{result['meta']['commit']}.json")
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(result, f, indent=2)
+
+    baseline = None
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_table(result, baseline)
+    print(f"Results written to {output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 21:30
+# @Author  : Healer
+# @File    : synthetic.py
+# @Software: PyCharm
+
+"""Synthetic order workbooks for the benchmarks.
+
+The 'No SI Order' sheet carries every header the engine maps plus a group
+key in column O; the 'SI Template' sheet has the mapped label cells, the
+table header and styled first table row, and a configurable number of extra
+styled cells and merged ranges.
+"""
+
+import os
+import random
+import sys
+
+import openpyxl
+from openpyxl.styles import Alignment, Border, Font, PatternFill, Side
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from si_engine import FIELD_MAPPING, ORDER_SHEET_NAME, TABLE_COLUMNS, TABLE_START_ROW, TEMPLATE_SHEET_NAME
+
+GROUP_KEY_HEADER = "Group Key"
+# 分组键放在 O 列（第 15 列），与界面默认分组列一致
+GROUP_KEY_COLUMN = 15
+
+
+def order_headers():
+    headers = list(TABLE_COLUMNS) + [name for name, _ in FIELD_MAPPING]
+    while len(headers) < GROUP_KEY_COLUMN - 1:
+        headers.append(f"Extra {len(headers) + 1}")
+    headers.insert(GROUP_KEY_COLUMN - 1, GROUP_KEY_HEADER)
+    return headers
+
+
+def group_weights(groups, skew):
+    """Zipf-like weights: 0 gives equal groups, larger values a few huge ones"""
+    return [1.0 / (rank + 1) ** skew for rank in range(groups)]
+
+
+def _style_pool(count, rng):
+    sides = [Side(style='thin'), Side(style='medium'), Side(style='dashed')]
+    colors = ["FFFF00", "C6EFCE", "FFC7CE", "DDEBF7", "FCE4D6", "EDEDED"]
+    pool = []
+    for index in range(max(1, count)):
+        side = sides[index % len(sides)]
+        pool.append((
+            Font(bold=index % 2 == 0, italic=index % 3 == 0, size=9 + index % 5),
+            Border(left=side, right=side, top=side, bottom=side),
+            PatternFill("solid", fgColor=colors[index % len(colors)]),
+            Alignment(horizontal=rng.choice(['left', 'center', 'right']), wrap_text=index % 2 == 1),
+            rng.choice(['General', '0.00', '#,##0', '@', 'yyyy-mm-dd']),
+        ))
+    return pool
+
+
+def _apply(cell, style):
+    cell.font, cell.border, cell.fill, cell.alignment, cell.number_format = style
+
+
+def build_template(sheet, template_cells=60, merges=2, styles=4, rng=None):
+    rng = rng or random.Random(0)
+    pool = _style_pool(styles, rng)
+
+    for name, address in FIELD_MAPPING:
+        label = sheet[address].offset(column=-1)
+        label.value = name
+        _apply(label, pool[0])
+        _apply(sheet[address], pool[-1])
+
+    for column, name in enumerate(TABLE_COLUMNS, 1):
+        header = sheet.cell(row=TABLE_START_ROW - 1, column=column, value=name)
+        _apply(header, pool[0])
+        _apply(sheet.cell(row=TABLE_START_ROW, column=column), pool[column % len(pool)])
+
+    # 额外的样式单元格放在 D:J 列，合并区域放在 L:M 列，互不重叠
+    for index in range(template_cells):
+        cell = sheet.cell(row=1 + index // 7, column=4 + index % 7, value=f"Text {index}")
+        _apply(cell, rng.choice(pool))
+    for index in range(merges):
+        sheet.merge_cells(f"L{2 * index + 1}:M{2 * index + 2}")
+        sheet[f"L{2 * index + 1}"] = f"Merged {index}"
+
+    sheet.column_dimensions['A'].width = 24
+    sheet.row_dimensions[TABLE_START_ROW - 1].height = 24
+    sheet.page_setup.orientation = 'landscape'
+
+
+def make_workbook(path, rows=1000, groups=50, skew=0.0, template_cells=60, merges=2, styles=4, seed=0):
+    """Write a synthetic order workbook to ``path`` and return ``path``"""
+    rng = random.Random(seed)
+    workbook = openpyxl.Workbook()
+    order_sheet = workbook.active
+    order_sheet.title = ORDER_SHEET_NAME
+
+    headers = order_headers()
+    order_sheet.append(headers)
+    keys = [f"G{index:05d}" for index in range(groups)]
+    header_names = {name for name, _ in FIELD_MAPPING}
+    for row_index, key in enumerate(rng.choices(keys, group_weights(groups, skew), k=rows)):
+        row = []
+        for header in headers:
+            if header == GROUP_KEY_HEADER:
+                row.append(key)
+            elif header in ("Total Qty", "Age (Days)"):
+                row.append(rng.randint(1, 500))
+            elif header in ("Shipment Wt", "Volumetric Wt"):
+                row.append(round(rng.random() * 1000, 2))
+            elif header in header_names:
+                # 表头字段取分组第一行，每组内保持一致
+                row.append(f"{header} {key}")
+            else:
+                row.append(f"{header} {row_index}")
+        order_sheet.append(row)
+
+    build_template(workbook.create_sheet(TEMPLATE_SHEET_NAME), template_cells, merges, styles, rng)
+    workbook.save(path)
+    return path
+
+
+if __name__ == "__main__":
+    make_workbook(sys.argv[1], *[int(value) for value in sys.argv[2:4]])
@@ -7,24 +7,44 @@
 
 
 # -*- coding: utf-8 -*-
+import time
+
+_IMPORT_STARTED = time.perf_counter()
+
 import json
 import base64
+import gzip
+import hashlib
 import os
+import re
+import shutil
 import sys
 import tempfile
-from io import BytesIO
+import uuid
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
 
 # 添加当前目录到Python路径
 sys.path.append(os.path.dirname(__file__))
 
-try:
-    # 尝试导入您的主应用
-    from app import SIGeneratorWeb
+# 冷启动只导入标准库；SI 引擎（openpyxl）在第一次上传时才导入，
+# 不再导入依赖 Streamlit 和 pandas 的 app 模块
+IMPORT_SECONDS = time.perf_counter() - _IMPORT_STARTED
+ENGINE_IMPORT_SECONDS = None
+_engine = None
+
+# API 网关响应体上限约 6MB，base64 编码后膨胀 4/3，超出时返回下载引用
+INLINE_RESPONSE_MAX_BYTES = 4 * 1024 * 1024
+# 通过 /download 分段取回时每段的大小
+DOWNLOAD_PART_BYTES = 4 * 1024 * 1024
+RESULT_DIR = os.path.join(tempfile.gettempdir(), "si_results")
+# 实例本地的结果只保留一小时
+RESULT_TTL_SECONDS = 3600
 
-    HAS_MAIN_APP = True
-except ImportError as e:
-    print(f"导入主应用失败: {e}")
-    HAS_MAIN_APP = False
+_JOB_PATH_RE = re.compile(r'^/jobs/([\w-]+)(/result)?$')
 
 
 def main_handler(event, context):
@@ -54,20 +74,26 @@ def main_handler(event, context):
 
         # 路由处理
         if path == '/' or path == '/index.html':
-            return serve_static_page()
+            return serve_static_page(event)
         elif path == '/upload' and http_method == 'POST':
             return handle_file_upload(event)
+        elif path == '/download' and http_method == 'GET':
+            return handle_download(event)
+        elif path == '/jobs' and http_method == 'POST':
+            return handle_job_submit(event)
+        elif _JOB_PATH_RE.match(path) and http_method == 'GET':
+            match = _JOB_PATH_RE.match(path)
+            return handle_job_request(event, match.group(1), bool(match.group(2)))
         else:
-            return serve_static_page()
+            return serve_static_page(event)
 
     except Exception as e:
         print(f"处理请求时出错: {e}")
         return error_response(f"服务器错误: {str(e)}")
 
 
-def serve_static_page():
-    """返回静态HTML页面"""
-    html_content = """
+# 首页 HTML，每个实例只编码、压缩一次（见 _build_static_page）
+INDEX_HTML = """
 <!DOCTYPE html>
 <html lang="zh-CN">
 <head>
@@ -254,13 +280,16 @@ def serve_static_page():
 
             <div class="upload-area">
                 <h3>文件上传区域</h3>
-                <p>当前版本运行在腾讯云函数环境中</p>
-                <p>文件处理功能需要完整服务器部署</p>
-                <p style="margin: 20px 0; color: #e74c3c; font-weight: bold;">
-                    ⚠️ 云函数环境限制：文件处理功能需要完整服务器部署
+                <p>选择一个或多个Excel文件，生成的SI文件将打包为ZIP下载</p>
+                <p style="margin: 20px 0;">
+                    <input type="file" id="fileInput" accept=".xlsx,.xlsm" multiple>
+                    分组列
+                    <select id="groupColumn">
+                        <option>O</option><option>P</option><option>Q</option>
+                        <option>R</option><option>S</option><option>T</option>
+                    </select>
                 </p>
-                <button class="btn" onclick="showMessage()">上传Excel文件</button>
-                <button class="btn" onclick="showMessage()">生成SI文件</button>
+                <button class="btn" id="generateBtn" onclick="generate()">生成SI文件</button>
             </div>
 
             <div id="statusMessage" class="status info" style="display: none;">
@@ -270,18 +299,68 @@ def serve_static_page():
 
         <div class="footer">
             <p>Powered by 腾讯云函数 | 建议使用Chrome浏览器访问</p>
-            <p>技术支持：请联系系统管理员获取完整部署版本</p>
+            <p>技术支持：请联系系统管理员</p>
         </div>
     </div>
 
     <script>
-        function showMessage() {
+        function showMessage(message, kind) {
             const statusDiv = document.getElementById('statusMessage');
-            statusDiv.innerHTML = '💡 完整文件处理功能需要服务器部署。请联系管理员部署完整版本。';
-            statusDiv.className = 'status info';
+            statusDiv.innerHTML = message;
+            statusDiv.className = 'status ' + (kind || 'info');
             statusDiv.style.display = 'block';
         }
 
+        function saveBlob(blob, fileName) {
+            const link = document.createElement('a');
+            link.href = URL.createObjectURL(blob);
+            link.download = fileName;
+            link.click();
+            URL.revokeObjectURL(link.href);
+        }
+
+        async function generate() {
+            const files = document.getElementById('fileInput').files;
+            if (!files.length) {
+                showMessage('请先选择Excel文件', 'error');
+                return;
+            }
+            const form = new FormData();
+            for (const file of files) {
+                form.append('files', file, file.name);
+            }
+            form.append('group_column', document.getElementById('groupColumn').value);
+
+            const button = document.getElementById('generateBtn');
+            button.disabled = true;
+            showMessage('⏳ 正在生成SI文件...', 'info');
+            try {
+                const response = await fetch('upload', { method: 'POST', body: form });
+                const contentType = response.headers.get('Content-Type') || '';
+                if (contentType.startsWith('application/zip')) {
+                    saveBlob(await response.blob(), 'SI_Files.zip');
+                    showMessage('🎉 已生成 ' + response.headers.get('X-SI-Processed') + ' 个文件的SI', 'success');
+                    return;
+                }
+                const result = await response.json();
+                if (!response.ok) {
+                    showMessage('❌ ' + result.message, 'error');
+                    return;
+                }
+                // 结果过大时分段下载
+                const parts = [];
+                for (const url of result.download) {
+                    parts.push(await (await fetch(url.substring(1))).blob());
+                }
+                saveBlob(new Blob(parts, { type: 'application/zip' }), result.file_name);
+                showMessage('🎉 SI文件已生成', 'success');
+            } catch (error) {
+                showMessage('❌ 请求失败: ' + error, 'error');
+            } finally {
+                button.disabled = false;
+            }
+        }
+
         // 页面加载完成后的初始化
         document.addEventListener('DOMContentLoaded', function() {
             console.log('SI Generator Tool 已加载');
@@ -291,39 +370,403 @@ def serve_static_page():
 </html>
     """
 
+# 页面内容只随部署变化，CDN 可以长期缓存，浏览器用 ETag 重新验证
+STATIC_CACHE_CONTROL = 'public, max-age=86400, s-maxage=2592000, stale-while-revalidate=86400'
+
+_static_page = None
+
+
+def _build_static_page():
+    """Encode the page once per instance: ``{encoding: (etag, body)}``"""
+    raw = INDEX_HTML.encode('utf-8')
+    digest = hashlib.sha256(raw).hexdigest()[:32]
+    # 强 ETag 必须区分不同的编码
+    variants = {
+        'identity': (f'"{digest}"', raw),
+        'gzip': (f'"{digest}-gzip"', gzip.compress(raw, compresslevel=9, mtime=0)),
+    }
+    if brotli is not None:
+        variants['br'] = (f'"{digest}-br"', brotli.compress(raw, quality=11))
+    return variants
+
+
+def _accepted_encodings(header):
+    accepted = set()
+    for item in header.split(','):
+        coding, _, params = item.strip().partition(';')
+        if params.replace(' ', '').lower() in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000'):
+            continue
+        accepted.add(coding.strip().lower())
+    return accepted
+
+
+def serve_static_page(event=None):
+    """返回静态HTML页面（预压缩，支持 ETag/304）"""
+    global _static_page
+    if _static_page is None:
+        _static_page = _build_static_page()
+
+    headers = _lower_keys((event or {}).get('headers'))
+    accepted = _accepted_encodings(headers.get('accept-encoding', ''))
+    encoding = 'identity'
+    for candidate in ('br', 'gzip'):
+        if candidate in _static_page and (candidate in accepted or '*' in accepted):
+            encoding = candidate
+            break
+    etag, body = _static_page[encoding]
+
+    response_headers = {
+        'Content-Type': 'text/html; charset=utf-8',
+        'Cache-Control': STATIC_CACHE_CONTROL,
+        'ETag': etag,
+        'Vary': 'Accept-Encoding',
+        'Access-Control-Allow-Origin': '*'
+    }
+
+    if_none_match = headers.get('if-none-match', '')
+    known_etags = {variant_etag for variant_etag, _ in _static_page.values()}
+    # If-None-Match 使用弱比较
+    requested = {re.sub(r'^W/', '', tag.strip()) for tag in if_none_match.split(',') if tag.strip()}
+    if '*' in requested or requested & known_etags:
+        return {
+            "isBase64Encoded": False,
+            "statusCode": 304,
+            "headers": response_headers,
+            "body": ""
+        }
+
+    if encoding == 'identity':
+        return {
+            "isBase64Encoded": False,
+            "statusCode": 200,
+            "headers": response_headers,
+            "body": INDEX_HTML
+        }
+    response_headers['Content-Encoding'] = encoding
     return {
-        "isBase64Encoded": False,
+        "isBase64Encoded": True,
+        "statusCode": 200,
+        "headers": response_headers,
+        "body": base64.b64encode(body).decode('ascii')
+    }
+
+
+def load_engine():
+    """Import the SI engine on first use and record how long that took"""
+    global _engine, ENGINE_IMPORT_SECONDS
+    if _engine is None:
+        started = time.perf_counter()
+        import si_batch
+        import si_engine
+        import si_package
+        _engine = (si_batch, si_engine, si_package)
+        ENGINE_IMPORT_SECONDS = time.perf_counter() - started
+        print(f"模块导入耗时: {IMPORT_SECONDS * 1000:.1f} ms, SI 引擎导入耗时: {ENGINE_IMPORT_SECONDS * 1000:.1f} ms")
+    return _engine
+
+
+def _lower_keys(mapping):
+    return {str(key).lower(): value for key, value in (mapping or {}).items()}
+
+
+def _header_param(value, name):
+    match = re.search(rf'{name}="([^"]*)"|{name}=([^;\s]+)', value, re.I)
+    if not match:
+        return None
+    return match.group(1) if match.group(1) is not None else match.group(2)
+
+
+def parse_multipart(body, boundary):
+    """Split a multipart/form-data body into ``(files, fields)``.
+
+    ``files`` is a list of ``(filename, bytes)``. Each file is sliced out of
+    ``body`` exactly once; nothing else is copied.
+    """
+    delimiter = b'--' + boundary.encode('latin-1')
+    files, fields = [], {}
+    position = body.find(delimiter)
+    while position != -1:
+        start = position + len(delimiter)
+        if body[start:start + 2] == b'--':
+            break
+        header_end = body.find(b'\r\n\r\n', start)
+        next_position = body.find(b'\r\n' + delimiter, header_end)
+        if header_end == -1 or next_position == -1:
+            raise ValueError("multipart 请求体不完整")
+
+        headers = body[start:header_end].decode('utf-8', 'replace')
+        disposition = next((line for line in headers.split('\r\n') if line.lower().startswith('content-disposition')), '')
+        name = _header_param(disposition, 'name')
+        filename = _header_param(disposition, 'filename')
+        content = body[header_end + 4:next_position]
+        if filename:
+            files.append((os.path.basename(filename), content))
+        elif name:
+            fields[name] = content.decode('utf-8').strip()
+        position = next_position + 2
+    return files, fields
+
+
+def decode_upload(event):
+    """Uploaded workbooks and form fields of an API gateway event.
+
+    Accepts multipart/form-data, a JSON body ``{"files": [{"name", "content"
+    (base64)}], ...}`` or the raw workbook with its name in ``X-File-Name``.
+    """
+    headers = _lower_keys(event.get('headers'))
+    fields = {key: str(value) for key, value in (event.get('queryStringParameters') or {}).items()}
+    body = event.get('body') or ''
+    if event.get('isBase64Encoded'):
+        body = base64.b64decode(body)
+    elif isinstance(body, str):
+        body = body.encode('latin-1') if 'multipart/' in headers.get('content-type', '') else body.encode('utf-8')
+
+    content_type = headers.get('content-type', '')
+    if content_type.startswith('multipart/form-data'):
+        boundary = _header_param(content_type, 'boundary')
+        if not boundary:
+            raise ValueError("multipart 请求缺少 boundary")
+        files, form_fields = parse_multipart(body, boundary)
+        fields.update(form_fields)
+        return files, fields
+
+    if content_type.startswith('application/json'):
+        payload = json.loads(body)
+        files = [(os.path.basename(item['name']), base64.b64decode(item['content'])) for item in payload.get('files', [])]
+        fields.update({key: str(value) for key, value in payload.items() if key != 'files'})
+        return files, fields
+
+    name = headers.get('x-file-name') or fields.get('name')
+    if not name:
+        raise ValueError("无法识别的上传格式，请使用 multipart/form-data 或 JSON")
+    return [(os.path.basename(name), body)], fields
+
+
+def handle_file_upload(event):
+    """处理文件上传请求：生成SI文件并返回 ZIP（过大时返回下载引用）"""
+    request_started = time.perf_counter()
+    try:
+        uploads, fields = decode_upload(event)
+    except (ValueError, KeyError, TypeError) as e:
+        return error_response(f"无法解析上传内容: {e}", 400)
+    uploads = [(name, data) for name, data in uploads if name.lower().endswith(('.xlsx', '.xlsm'))]
+    if not uploads:
+        return error_response("请上传至少一个 .xlsx 或 .xlsm 文件", 400)
+
+    si_batch, si_engine, si_package = load_engine()
+    options, problem = options_from_fields(fields)
+    if problem:
+        return error_response(problem, 400)
+
+    jobs = [si_batch.FileJob(name, data) for name, data in uploads]
+    del uploads
+    # 每个SI生成后立即写入 ZIP，内容较大时转存到 /tmp
+    packager = si_package.ZipPackager(options.archive_compresslevel)
+    messages = []
+    processed = 0
+    for index, result in si_batch.run_batch(jobs, options, output=packager):
+        # 处理完即释放上传内容
+        jobs[index].release()
+        messages.extend(message for level, message in result.log_records if level in ('warning', 'error'))
+        if result.error:
+            messages.append(f"❌ Error processing {result.name}: {result.error}")
+        else:
+            processed += 1
+
+    if processed == 0:
+        return error_response("没有文件处理成功: " + "; ".join(messages), 422)
+
+    packager.close()
+    size = packager.fileobj.tell()
+    timing = {
+        'X-SI-Processed': str(processed),
+        'X-SI-Failed': str(len(jobs) - processed),
+        'X-SI-Import-Ms': f"{IMPORT_SECONDS * 1000:.1f}",
+        'X-SI-Engine-Import-Ms': f"{ENGINE_IMPORT_SECONDS * 1000:.1f}",
+        'X-SI-Processing-Ms': f"{(time.perf_counter() - request_started) * 1000:.1f}",
+    }
+    filename = f"SI_Files_{time.strftime('%Y%m%d_%H%M%S')}.zip"
+    return archive_response(packager.fileobj, size, filename, timing, messages)
+
+
+def options_from_fields(fields):
+    """``(SIOptions, None)`` from request fields, or ``(None, problem)``"""
+    si_engine = load_engine()[1]
+    group_column = fields.get('group_column', 'O').upper()
+    if group_column not in si_engine.GROUP_COLUMNS:
+        return None, f"不支持的分组列: {group_column}"
+    try:
+        memory_limit_mb = int(fields.get('memory_limit_mb') or 0)
+        consolidated_max_sheets = int(fields.get('consolidated_max_sheets') or 0)
+        consolidated_max_mb = float(fields.get('consolidated_max_mb') or 0)
+        # 逗号分隔，例如 "csv,jsonl"
+        exports = [name.strip() for name in fields.get('exports', '').split(',') if name.strip()]
+        return si_engine.SIOptions(
+            group_column, engine=fields.get('engine', 'xml'), memory_limit_mb=memory_limit_mb,
+            consolidated_max_sheets=consolidated_max_sheets, consolidated_max_mb=consolidated_max_mb, exports=exports
+        ), None
+    except ValueError as e:
+        return None, str(e)
+
+
+def archive_response(fileobj, size, filename, extra_headers=None, warnings=()):
+    """Return a finished ZIP inline, or as /download part references when too large"""
+    extra_headers = extra_headers or {}
+    if size <= INLINE_RESPONSE_MAX_BYTES:
+        fileobj.seek(0)
+        return {
+            "isBase64Encoded": True,
+            "statusCode": 200,
+            "headers": {
+                'Content-Type': 'application/zip',
+                'Content-Disposition': f'attachment; filename="{filename}"',
+                'Access-Control-Allow-Origin': '*',
+                'Access-Control-Expose-Headers': ', '.join(extra_headers),
+                **extra_headers
+            },
+            "body": base64.b64encode(fileobj.read()).decode('ascii')
+        }
+
+    result_id = store_result(fileobj)
+    parts = (size + DOWNLOAD_PART_BYTES - 1) // DOWNLOAD_PART_BYTES
+    return json_response({
+        "status": "success",
+        "message": "结果超过单次响应上限，请按分段下载",
+        "file_name": filename,
+        "size": size,
+        "parts": parts,
+        "download": [f"/download?id={result_id}&part={part}" for part in range(parts)],
+        "warnings": list(warnings),
+        "timing": extra_headers,
+    })
+
+
+_job_runner = None
+
+
+def get_job_runner():
+    """Job store and background runner of this instance, started on first use"""
+    global _job_runner
+    if _job_runner is None:
+        load_engine()
+        import si_jobs
+        _job_runner = si_jobs.JobRunner(si_jobs.JobStore()).start()
+    return _job_runner
+
+
+def handle_job_submit(event):
+    """提交后台任务：保存上传文件并立即返回任务ID"""
+    try:
+        uploads, fields = decode_upload(event)
+    except (ValueError, KeyError, TypeError) as e:
+        return error_response(f"无法解析上传内容: {e}", 400)
+    uploads = [(name, data) for name, data in uploads if name.lower().endswith(('.xlsx', '.xlsm'))]
+    if not uploads:
+        return error_response("请上传至少一个 .xlsx 或 .xlsm 文件", 400)
+    options, problem = options_from_fields(fields)
+    if problem:
+        return error_response(problem, 400)
+
+    runner = get_job_runner()
+    job_id = runner.store.submit(uploads, options)
+    runner.wake()
+    return json_response({
+        "status": "queued",
+        "job_id": job_id,
+        "status_url": f"/jobs/{job_id}",
+        "result_url": f"/jobs/{job_id}/result",
+    }, 202)
+
+
+def handle_job_request(event, job_id, want_result):
+    """查询任务状态，或下载任务结果（未完成时可用 partial=1 下载已完成部分）"""
+    import si_jobs
+
+    store = get_job_runner().store
+    try:
+        state = store.status(job_id)
+    except KeyError:
+        return error_response("任务不存在或已过期", 404)
+
+    if not want_result:
+        finished, total = si_jobs.job_progress(state)
+        return json_response({**state, "progress": {"finished": finished, "total": total}})
+
+    params = event.get('queryStringParameters') or {}
+    filename = f"SI_Files_{job_id}.zip"
+    result_path = store.result_path(job_id)
+    if result_path:
+        with open(result_path, 'rb') as f:
+            return archive_response(f, os.path.getsize(result_path), filename)
+    if str(params.get('partial', '')) not in ('1', 'true'):
+        return error_response(f"任务尚未完成: {state['status']}", 409)
+
+    with tempfile.SpooledTemporaryFile(max_size=INLINE_RESPONSE_MAX_BYTES) as partial:
+        store.write_archive(job_id, partial, state)
+        return archive_response(partial, partial.tell(), filename)
+
+
+def store_result(fileobj):
+    """Copy a finished ZIP to instance-local storage and return its id"""
+    os.makedirs(RESULT_DIR, exist_ok=True)
+    now = time.time()
+    for name in os.listdir(RESULT_DIR):
+        path = os.path.join(RESULT_DIR, name)
+        if now - os.path.getmtime(path) > RESULT_TTL_SECONDS:
+            os.remove(path)
+
+    result_id = uuid.uuid4().hex
+    fileobj.seek(0)
+    with open(os.path.join(RESULT_DIR, f"{result_id}.zip"), 'wb') as target:
+        shutil.copyfileobj(fileobj, target)
+    return result_id
+
+
+def handle_download(event):
+    """返回已生成 ZIP 的一个分段（结果只保存在生成它的实例上）"""
+    params = event.get('queryStringParameters') or {}
+    result_id = str(params.get('id', ''))
+    if not re.fullmatch(r'[0-9a-f]{32}', result_id):
+        return error_response("无效的结果ID", 400)
+    path = os.path.join(RESULT_DIR, f"{result_id}.zip")
+    if not os.path.exists(path):
+        return error_response("结果不存在或已过期", 404)
+
+    try:
+        part = int(params.get('part', 0))
+    except ValueError:
+        return error_response("无效的分段编号", 400)
+    with open(path, 'rb') as f:
+        f.seek(part * DOWNLOAD_PART_BYTES)
+        chunk = f.read(DOWNLOAD_PART_BYTES)
+    return {
+        "isBase64Encoded": True,
         "statusCode": 200,
         "headers": {
-            'Content-Type': 'text/html; charset=utf-8',
+            'Content-Type': 'application/octet-stream',
             'Access-Control-Allow-Origin': '*'
         },
-        "body": html_content
+        "body": base64.b64encode(chunk).decode('ascii')
     }
 
 
-def handle_file_upload(event):
-    """处理文件上传请求"""
+def json_response(payload, status_code=200):
     return {
         "isBase64Encoded": False,
-        "statusCode": 200,
+        "statusCode": status_code,
         "headers": {
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
         },
-        "body": json.dumps({
-            "status": "success",
-            "message": "文件上传功能需要在完整服务器环境中运行",
-            "note": "云函数环境适合展示页面，文件处理建议使用服务器部署"
-        })
+        "body": json.dumps(payload, ensure_ascii=False)
     }
 
 
-def error_response(message):
+def error_response(message, status_code=500):
     """返回错误响应"""
     return {
         "isBase64Encoded": False,
-        "statusCode": 500,
+        "statusCode": status_code,
         "headers": {
             'Content-Type': 'application/json',
             'Access-Control-Allow-Origin': '*'
@@ -0,0 +1,282 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 16:05
+# @Author  : Healer
+# @File    : si_batch.py
+# @Software: PyCharm
+
+"""Running several uploaded workbooks at once.
+
+Workers never touch Streamlit: each job logs into a LogBuffer that the main
+thread replays when the job completes.
+"""
+
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+from si_cache import CacheTee, cache_key
+from si_preflight import preflight
+from si_trace import NULL_TRACER, Tracer
+from si_upload import Upload
+from si_engine import (
+    GROUP_COLUMNS, DirectoryOutput, GroupManifest, MemoryGuard, MemoryOutput, ParsedWorkbook, output_folder_name,
+    process_workbook
+)
+
+# 粗略估计：处理一个工作簿的峰值内存约为文件大小的倍数
+FILE_MEMORY_FACTOR = 10
+
+
+class LogBuffer:
+    """Records info/success/warning/error calls so they can be replayed"""
+
+    def __init__(self):
+        self.records = []
+
+    def info(self, message):
+        self.records.append(("info", message))
+
+    def success(self, message):
+        self.records.append(("success", message))
+
+    def warning(self, message):
+        self.records.append(("warning", message))
+
+    def error(self, message):
+        self.records.append(("error", message))
+
+
+class FileJob:
+    """One workbook of a batch.
+
+    ``data`` is the uploaded content: bytes or an Upload (see si_upload),
+    which may live in a spool file on disk. Results go to
+    ``save_dir/SI_Output_<name>`` or, without ``save_dir``, stay in
+    memory. ``parsed`` is a ParsedWorkbook of ``data`` from an
+    earlier run; with ``keep_parsed`` a freshly parsed workbook is returned
+    in the result so the caller can keep it. ``preflight`` is the
+    PreflightReport of ``data``, set by run_batch (or earlier by the caller).
+    """
+
+    def __init__(self, name, data, save_dir=None, parsed=None, keep_parsed=False):
+        self.name = name
+        self.upload = data if isinstance(data, Upload) else Upload(name, data=data)
+        self.save_dir = save_dir
+        self.parsed = parsed
+        self.keep_parsed = keep_parsed
+        self.preflight = None
+
+    @property
+    def estimated_memory(self):
+        if self.preflight is not None and self.preflight.ok:
+            return self.preflight.estimated_memory
+        return self.upload.size * FILE_MEMORY_FACTOR
+
+    @property
+    def digest(self):
+        """SHA-256 of the uploaded bytes"""
+        return self.upload.digest
+
+    def open(self):
+        """Binary file object over the upload for the loader; the caller closes it"""
+        return self.upload.open()
+
+    def release(self):
+        """Drop the upload once the job is done"""
+        self.upload.discard()
+
+    def output(self, output=None):
+        """Where the files of this job go"""
+        if self.save_dir:
+            return DirectoryOutput(os.path.join(self.save_dir, output_folder_name(self.name)))
+        return output if output is not None else MemoryOutput()
+
+
+class FileResult:
+    """Outcome of a FileJob: OutputFiles and log, or the error"""
+
+    def __init__(self, name, result_files=None, log_records=None, error=None, parsed=None, trace=None):
+        self.name = name
+        self.result_files = result_files or []
+        self.log_records = log_records or []
+        self.error = error
+        self.parsed = parsed
+        # Tracer.to_dict() 的结果（未开启追踪时为 None）
+        self.trace = trace
+
+    def replay_log(self, target):
+        for level, message in self.log_records:
+            getattr(target, level)(message)
+
+
+def run_file_job(job, options, output=None, cache_entry=None):
+    """Process one workbook; never raises, errors end up in the result.
+
+    ``output`` overrides where the files of an in-memory job go, e.g. a
+    ZipPackager that archives each SI as soon as it is written. Files are
+    also copied into ``cache_entry`` when given; the entry is committed only
+    if the whole workbook succeeds.
+    """
+    log = LogBuffer()
+    if job.preflight is not None:
+        for level, message in job.preflight.log_records():
+            getattr(log, level)(message)
+    tracer = Tracer(job.name, trace_memory=True) if options.trace else NULL_TRACER
+    # 新解析的工作簿即使处理失败也交给调用方保留（例如选错了分组列）
+    new_parsed = None
+    guard = MemoryGuard(options.memory_limit_mb)
+    staged = None
+    try:
+        output = job.output(output)
+        if hasattr(output, 'stage'):
+            # 流式写入下载归档时先暂存，整个工作簿成功后才写入，失败的文件不留下半成品
+            output = staged = output.stage()
+        if cache_entry is not None:
+            output = CacheTee(output, cache_entry)
+        parsed = job.parsed
+        # 限制内存时只读取当前分组列，也不保留解析结果
+        if parsed is None and job.keep_parsed and not options.memory_limit_mb:
+            # 读取所有可选分组列，之后换分组列也能复用
+            extra_columns = list(GROUP_COLUMNS) + options.group_spec.refs
+            with job.open() as source:
+                parsed = new_parsed = ParsedWorkbook.load(source, extra_columns, tracer, guard)
+        # 直接从上传内容（内存或转存文件）读取，不再复制；用完即关闭文件
+        with job.open() as source:
+            result_files = process_workbook(source, job.name, options, output, log, parsed, tracer, guard)
+        if staged is not None:
+            archived = staged.commit()
+            result_files = [archived.get(output_file.name, output_file) for output_file in result_files]
+        if cache_entry is not None:
+            cache_error = _cache_error(job.name, lambda: cache_entry.commit(log.records))
+            if cache_error:
+                log.warning(cache_error)
+        return FileResult(job.name, result_files, log.records, parsed=new_parsed, trace=tracer.to_dict())
+    except Exception as e:
+        if staged is not None:
+            staged.discard()
+        if cache_entry is not None:
+            cache_entry.discard()
+        return FileResult(job.name, log_records=log.records, error=str(e), parsed=new_parsed, trace=tracer.to_dict())
+    finally:
+        tracer.close()
+
+
+def _cache_error(name, commit):
+    """Run ``commit``; returns a warning message instead of raising, since the file itself succeeded"""
+    try:
+        commit()
+    except Exception as e:
+        return f"⚠️ {name}: Could not store the result in the cache: {e}"
+    return None
+
+
+def restore_cached(job, cached, output=None):
+    """FileResult of ``job`` from a cache hit, with the files delivered to its output"""
+    output_files, log_records = cached
+    output = job.output(output)
+    manifest_path = getattr(output, 'manifest_path', None)
+    if manifest_path:
+        # 还原的文件与目录中的增量清单不再对应，下次按全量生成
+        GroupManifest.discard(manifest_path)
+    result_files = [output.add(output_file) for output_file in output_files]
+    log_records = log_records + [("info", f"♻️ Reused cached result for {job.name}")]
+    return FileResult(job.name, result_files, log_records)
+
+
+def run_batch(jobs, options, concurrency=1, memory_budget=None, output=None, cache=None):
+    """Run ``jobs`` with at most ``concurrency`` workbooks in flight.
+
+    Yields ``(index, FileResult)`` in completion order, on the calling
+    thread, so callers can update their UI directly. A job only starts while
+    the estimated memory of all running jobs stays within ``memory_budget``
+    bytes; one job always runs even if it alone exceeds the budget.
+
+    ``output`` is only used when jobs run one at a time on this thread;
+    concurrent jobs return their files as bytes.
+
+    Jobs with identical name and content are processed once: the copies complete
+    right after the original with an empty result. With a ResultCache,
+    earlier results are reused and new ones are stored.
+
+    With ``options.preflight`` every job that still has to run is checked
+    first (see si_preflight); rejected jobs complete before any work starts,
+    and concurrent batches start the longest jobs first.
+    """
+    keys = [cache_key(job.digest, job.name, options) for job in jobs]
+    first_of = {}
+    duplicates = {}
+    pending = []
+    for index, job in enumerate(jobs):
+        if keys[index] in first_of:
+            duplicates.setdefault(first_of[keys[index]], []).append(index)
+            continue
+        first_of[keys[index]] = index
+
+        cached = cache.get(keys[index]) if cache is not None else None
+        if cached is None:
+            pending.append((index, job))
+            continue
+        try:
+            result = restore_cached(job, cached, output)
+        except Exception as e:
+            result = FileResult(job.name, error=str(e))
+        yield from _with_duplicates(index, result, jobs, duplicates)
+
+    if options.preflight:
+        checked = []
+        for index, job in pending:
+            if job.preflight is None:
+                job.preflight = preflight(job.upload, job.name, options, parsed=job.parsed)
+            if job.preflight.ok:
+                checked.append((index, job))
+                continue
+            result = FileResult(
+                job.name, log_records=job.preflight.log_records(), error="Pre-flight: " + "; ".join(job.preflight.errors)
+            )
+            yield from _with_duplicates(index, result, jobs, duplicates)
+        pending = checked
+        if concurrency > 1:
+            # 耗时最长的先开始，整批更早结束
+            pending.sort(key=lambda item: -item[1].preflight.estimated_seconds)
+
+    if concurrency <= 1:
+        for index, job in pending:
+            cache_entry = cache.open_entry(keys[index]) if cache is not None else None
+            result = run_file_job(job, options, output, cache_entry)
+            yield from _with_duplicates(index, result, jobs, duplicates)
+        return
+
+    running = {}
+    with ProcessPoolExecutor(max_workers=concurrency) as executor:
+        while pending or running:
+            in_flight = sum(jobs[index].estimated_memory for index in running.values())
+            while pending and len(running) < concurrency:
+                index, job = pending[0]
+                if running and memory_budget and in_flight + job.estimated_memory > memory_budget:
+                    break
+                pending.pop(0)
+                running[executor.submit(run_file_job, job, options)] = index
+                in_flight += job.estimated_memory
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                index = running.pop(future)
+                try:
+                    result = future.result()
+                except Exception as e:
+                    # 工作进程异常退出等情况
+                    result = FileResult(jobs[index].name, error=str(e))
+                if cache is not None and not result.error:
+                    cache_error = _cache_error(
+                        result.name, lambda: cache.put(keys[index], result.result_files, result.log_records)
+                    )
+                    if cache_error:
+                        result.log_records.append(("warning", cache_error))
+                yield from _with_duplicates(index, result, jobs, duplicates)
+
+
+def _with_duplicates(index, result, jobs, duplicates):
+    yield index, result
+    for duplicate in duplicates.get(index, ()):
+        log_records = [("info", f"♻️ {jobs[duplicate].name} was uploaded more than once, processed it only once")]
+        yield duplicate, FileResult(jobs[duplicate].name, log_records=log_records, error=result.error)
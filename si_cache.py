@@ -0,0 +1,241 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 18:10
+# @Author  : Healer
+# @File    : si_cache.py
+# @Software: PyCharm
+
+"""Caches around the SI engine.
+
+:class:`ResultCache` stores generated SI files on disk. An entry is keyed by
+the SHA-256 of the uploaded workbook plus every setting that changes the
+output, and stored as one uncompressed zip in a local directory. The
+directory is kept under a size limit by evicting the least recently used
+entries.
+
+:class:`ParsedWorkbookCache` keeps parsed uploads in memory so a run with
+other settings skips reading the workbook.
+"""
+
+import hashlib
+import json
+import os
+import tempfile
+import uuid
+import zipfile
+from collections import OrderedDict
+
+from si_engine import MemoryOutput, OutputFile, layout_fingerprint
+
+DEFAULT_CACHE_DIR = os.path.join(tempfile.gettempdir(), "si_generator_cache")
+DEFAULT_CACHE_MAX_MB = 512
+DEFAULT_PARSED_CACHE_MB = 1024
+
+MANIFEST_NAME = "__si_cache__.json"
+
+
+def cache_key(digest, file_name, options):
+    """Key of the results of the upload with SHA-256 ``digest`` under ``options``"""
+    settings = {
+        # 输出文件名由原文件名派生，内容相同但文件名不同时结果也不同
+        "file_name": file_name,
+        "grouping": options.group_spec.to_dict(),
+        "engine": options.engine,
+        "xlsx_compresslevel": options.xlsx_compresslevel,
+        # 拆分设置决定汇总文件的个数和文件名
+        "consolidated_max_sheets": options.consolidated_max_sheets,
+        "consolidated_max_mb": options.consolidated_max_mb,
+        "exports": options.exports,
+        "layout": layout_fingerprint(),
+    }
+    material = digest + json.dumps(settings, sort_keys=True)
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class ResultCache:
+    """Size-bounded LRU store of generated files on local disk"""
+
+    def __init__(self, directory=DEFAULT_CACHE_DIR, max_mb=DEFAULT_CACHE_MAX_MB):
+        self.directory = directory
+        self.max_bytes = max_mb * 1024 * 1024
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.zip")
+
+    def __contains__(self, key):
+        """Whether ``key`` has an entry, without reading it"""
+        return os.path.exists(self._path(key))
+
+    def get(self, key):
+        """Return ``(output files, log records)`` of ``key`` or None"""
+        path = self._path(key)
+        try:
+            with zipfile.ZipFile(path) as archive:
+                manifest = json.loads(archive.read(MANIFEST_NAME))
+                output_files = [OutputFile(name, data=archive.read(name)) for name in manifest["files"]]
+            # 记录最近使用时间，供 LRU 淘汰
+            os.utime(path)
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+        except (OSError, KeyError, ValueError, zipfile.BadZipFile):
+            # 损坏的缓存条目直接丢弃
+            self._remove(path)
+            self.misses += 1
+            return None
+
+        self.hits += 1
+        return output_files, [tuple(record) for record in manifest["log"]]
+
+    def open_entry(self, key):
+        return CacheEntry(self, key)
+
+    def put(self, key, output_files, log_records):
+        entry = self.open_entry(key)
+        for output_file in output_files:
+            entry.add(output_file)
+        entry.commit(log_records)
+
+    def evict(self):
+        """Drop least recently used entries until the cache fits its limit"""
+        entries = []
+        for name in os.listdir(self.directory):
+            if name.endswith(".zip"):
+                path = os.path.join(self.directory, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            self._remove(path)
+            total -= size
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            self._remove(os.path.join(self.directory, name))
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+
+class CacheEntry:
+    """A cache entry being written; files can be added as they are generated"""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.names = []
+        # 同一进程的多个会话和后台任务可能同时写同一个键，临时文件各自独立
+        self._temp_path = os.path.join(cache.directory, f".{key}.{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        self._archive = zipfile.ZipFile(self._temp_path, 'w', zipfile.ZIP_STORED, allowZip64=True)
+
+    def add(self, output_file):
+        if output_file.data is not None:
+            self._archive.writestr(output_file.name, output_file.data)
+        else:
+            self._archive.write(output_file.path, output_file.name)
+        self.names.append(output_file.name)
+
+    def commit(self, log_records):
+        manifest = {"files": self.names, "log": [list(record) for record in log_records]}
+        try:
+            self._archive.writestr(MANIFEST_NAME, json.dumps(manifest, ensure_ascii=False))
+            self._archive.close()
+            os.replace(self._temp_path, self.cache._path(self.key))
+        except Exception:
+            self.discard()
+            raise
+        self.cache.evict()
+
+    def discard(self):
+        self._archive.close()
+        ResultCache._remove(self._temp_path)
+
+
+class CacheTee:
+    """Output that forwards files to ``inner`` and copies them into a CacheEntry"""
+
+    process_safe = False
+
+    def __init__(self, inner, entry):
+        self.inner = inner
+        self.entry = entry
+
+    @property
+    def manifest_path(self):
+        return getattr(self.inner, 'manifest_path', None)
+
+    def save(self, filename, write):
+        return self.add(MemoryOutput().save(filename, write))
+
+    def add(self, output_file):
+        self.entry.add(output_file)
+        return self.inner.add(output_file)
+
+
+class ParsedWorkbookCache:
+    """In-memory LRU of ParsedWorkbooks keyed by upload digest.
+
+    Bounded by the estimated memory of the entries; a workbook larger than
+    the whole limit is not kept at all.
+    """
+
+    def __init__(self, max_mb=DEFAULT_PARSED_CACHE_MB):
+        self.max_bytes = max_mb * 1024 * 1024
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    @property
+    def size(self):
+        return sum(parsed.estimated_memory for parsed in self._entries.values())
+
+    def get(self, key):
+        parsed = self._entries.get(key)
+        if parsed is not None:
+            self._entries.move_to_end(key)
+        return parsed
+
+    def put(self, key, parsed):
+        if parsed.estimated_memory > self.max_bytes:
+            return
+        self._entries[key] = parsed
+        self._entries.move_to_end(key)
+        self._evict()
+
+    def resize(self, max_mb):
+        self.max_bytes = max_mb * 1024 * 1024
+        self._evict()
+
+    def retain(self, keys):
+        """Drop every entry whose key is not in ``keys``"""
+        for key in [key for key in self._entries if key not in keys]:
+            del self._entries[key]
+
+    def discard(self, key):
+        self._entries.pop(key, None)
+
+    def clear(self):
+        self._entries.clear()
+
+    def _evict(self):
+        size = self.size
+        while size > self.max_bytes and self._entries:
+            _, parsed = self._entries.popitem(last=False)
+            size -= parsed.estimated_memory
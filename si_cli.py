@@ -0,0 +1,337 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 19:30
+# @Author  : Healer
+# @File    : si_cli.py
+# @Software: PyCharm
+
+"""Headless SI generation: the engine behind the Streamlit UI, from the shell.
+
+Examples::
+
+    python si_cli.py exports/ --group-column P --jobs 4
+    python si_cli.py "exports/*.xlsx" --zip SI_Files.zip --summary summary.json
+    python si_cli.py --watch inbox/ --interval 30
+
+Watch mode polls the inbox, processes every workbook whose size stopped
+changing and moves it to ``inbox/processed`` (or ``inbox/failed``). Its
+summary file receives one JSON line per processed batch.
+"""
+
+import argparse
+import glob
+import json
+import os
+import shutil
+import sys
+import time
+from datetime import datetime
+
+from si_batch import FileJob, run_batch
+from si_cache import DEFAULT_CACHE_MAX_MB, ResultCache
+from si_engine import GROUP_COLUMNS, RENDER_ENGINES, SIOptions, output_folder_name
+from si_export import EXPORT_FORMATS
+from si_grouping import GROUP_ORDERS, KEY_CASES
+from si_package import OrderedArchiver, ZipPackager
+from si_upload import UploadIntake, UploadRejected
+
+WORKBOOK_SUFFIXES = ('.xlsx', '.xlsm')
+
+
+class ConsoleLog:
+    """Log target for FileResult.replay_log that prints to stderr"""
+
+    def __init__(self, quiet=False):
+        self.quiet = quiet
+
+    def _print(self, message):
+        print(message, file=sys.stderr, flush=True)
+
+    def info(self, message):
+        if not self.quiet:
+            self._print(message)
+
+    def success(self, message):
+        if not self.quiet:
+            self._print(message)
+
+    def warning(self, message):
+        self._print(message)
+
+    def error(self, message):
+        self._print(message)
+
+
+def is_workbook(path):
+    name = os.path.basename(path)
+    # Excel 打开文件时留下的锁文件
+    return name.lower().endswith(WORKBOOK_SUFFIXES) and not name.startswith('~$')
+
+
+def collect_inputs(patterns):
+    """Workbook paths from files, directories and glob patterns, in order, without repeats"""
+    paths = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(os.path.join(pattern, name) for name in os.listdir(pattern))
+        else:
+            matches = sorted(glob.glob(pattern)) or [pattern]
+        for path in matches:
+            if os.path.isfile(path) and is_workbook(path) and path not in paths:
+                paths.append(path)
+    return paths
+
+
+def run_paths(paths, options, output_dir=None, zip_path=None, cache=None, log=None, intake=None):
+    """Process the workbooks at ``paths`` and return the summary dict.
+
+    Results go to ``SI_Output_<name>`` next to each input (or inside
+    ``output_dir``), or into one ZIP at ``zip_path``. Inputs are read in
+    place, not loaded into memory; ``intake`` (an UploadIntake) rejects
+    files over its size limits before they are parsed.
+    """
+    log = log or ConsoleLog()
+    intake = intake or UploadIntake()
+    started = time.time()
+    entries = [None] * len(paths)
+    jobs = []
+    # jobs 中每项对应的输入序号
+    job_paths = []
+    for path_index, path in enumerate(paths):
+        try:
+            upload = intake.from_path(os.path.basename(path), path)
+        except (UploadRejected, OSError) as e:
+            log.error(f"❌ Rejected {path}: {e}")
+            entries[path_index] = {"input": path, "status": "error", "error": str(e), "output": None, "files": []}
+            continue
+        save_dir = None if zip_path else (output_dir or os.path.dirname(os.path.abspath(path)))
+        jobs.append(FileJob(upload.name, upload, save_dir))
+        job_paths.append(path_index)
+
+    packager = None
+    archive_file = None
+    if zip_path:
+        archive_file = open(zip_path, 'wb')
+        packager = ZipPackager(options.archive_compresslevel, fileobj=archive_file)
+    # 逐个处理时每个SI生成后立即写入 ZIP；并发时按输入顺序写入
+    streaming = packager is not None and options.file_concurrency <= 1
+    archiver = OrderedArchiver(packager) if packager is not None and not streaming else None
+
+    try:
+        batch = run_batch(
+            jobs, options, options.file_concurrency, options.memory_budget, packager if streaming else None, cache
+        )
+        for index, result in batch:
+            result.replay_log(log)
+            if result.error:
+                log.error(f"❌ Error processing {result.name}: {result.error}")
+            else:
+                log.success(f"✅ Successfully processed: {result.name}")
+            entries[job_paths[index]] = {
+                "input": paths[job_paths[index]],
+                "status": "error" if result.error else "ok",
+                "error": result.error,
+                "output": _output_location(jobs[index], zip_path),
+                "files": [output_file.name for output_file in result.result_files],
+            }
+            if result.trace is not None:
+                entries[job_paths[index]]["trace"] = result.trace
+            if jobs[index].preflight is not None:
+                entries[job_paths[index]]["preflight"] = jobs[index].preflight.to_dict()
+            if archiver is not None:
+                archiver.add(index, result.result_files)
+    finally:
+        for job in jobs:
+            job.release()
+        if packager is not None:
+            packager.close()
+            archive_file.close()
+
+    failed = sum(1 for entry in entries if entry["status"] == "error")
+    summary = {
+        "started": datetime.fromtimestamp(started).isoformat(timespec='seconds'),
+        "seconds": round(time.time() - started, 3),
+        "options": {
+            "group_column": options.group_column,
+            "grouping": options.grouping,
+            "engine": options.engine,
+            "workers": options.workers,
+            "file_concurrency": options.file_concurrency,
+            "incremental": options.incremental,
+            "memory_limit_mb": options.memory_limit_mb,
+            "consolidated_max_sheets": options.consolidated_max_sheets,
+            "consolidated_max_mb": options.consolidated_max_mb,
+            "exports": options.exports,
+        },
+        "processed": len(entries) - failed,
+        "failed": failed,
+        "si_files": sum(len(entry["files"]) for entry in entries),
+        "files": entries,
+    }
+    if cache is not None:
+        summary["cache"] = {"hits": cache.hits, "misses": cache.misses}
+    return summary
+
+
+def _output_location(job, zip_path):
+    if job.save_dir:
+        return os.path.join(job.save_dir, output_folder_name(job.name))
+    return zip_path
+
+
+def watch(inbox, options, args, cache=None, log=None):
+    """Process workbooks dropped into ``inbox`` until interrupted"""
+    log = log or ConsoleLog(args.quiet)
+    processed_dir = os.path.join(inbox, "processed")
+    failed_dir = os.path.join(inbox, "failed")
+    os.makedirs(processed_dir, exist_ok=True)
+    os.makedirs(failed_dir, exist_ok=True)
+    output_dir = args.output_dir or processed_dir
+
+    # 文件大小连续两次不变才认为已经复制完成
+    last_sizes = {}
+    log.info(f"👀 Watching {inbox} every {args.interval}s (Ctrl+C to stop)")
+    try:
+        while True:
+            ready = []
+            sizes = {}
+            for name in sorted(os.listdir(inbox)):
+                path = os.path.join(inbox, name)
+                if not (os.path.isfile(path) and is_workbook(path)):
+                    continue
+                sizes[path] = os.path.getsize(path)
+                if last_sizes.get(path) == sizes[path]:
+                    ready.append(path)
+            last_sizes = {path: size for path, size in sizes.items() if path not in ready}
+
+            if ready:
+                zip_path = None
+                if args.zip:
+                    zip_path = os.path.join(output_dir, f"SI_Files_{datetime.now().strftime('%Y%m%d_%H%M%S')}.zip")
+                intake = UploadIntake(args.max_file_mb, args.max_batch_mb)
+                summary = run_paths(ready, options, output_dir, zip_path, cache, log, intake)
+                for entry in summary["files"]:
+                    target_dir = failed_dir if entry["status"] == "error" else processed_dir
+                    target = os.path.join(target_dir, os.path.basename(entry["input"]))
+                    shutil.move(entry["input"], target)
+                    entry["input"] = target
+                write_summary(summary, args.summary, append=True)
+            time.sleep(args.interval)
+    except KeyboardInterrupt:
+        log.info("Stopped watching")
+
+
+def write_summary(summary, destination, append=False):
+    if destination in (None, '-'):
+        print(json.dumps(summary, ensure_ascii=False, indent=None if append else 2))
+        return
+    with open(destination, 'a' if append else 'w', encoding='utf-8') as f:
+        json.dump(summary, f, ensure_ascii=False, indent=None if append else 2)
+        f.write('\n')
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(description="Generate SI files from 'No SI Order' workbooks without the web UI")
+    parser.add_argument("inputs", nargs='*', help="Workbooks, directories or glob patterns")
+    parser.add_argument("-g", "--group-column", action="append",
+                        help=f"Header name or column letter to group by, e.g. one of {', '.join(GROUP_COLUMNS)} "
+                             "(repeat for a composite key; default O)")
+    parser.add_argument("--key-case", default="keep", choices=KEY_CASES, help="Case normalization of group keys")
+    parser.add_argument("--collapse-spaces", action="store_true", help="Squeeze whitespace inside group keys")
+    parser.add_argument("--normalize-numbers", action="store_true",
+                        help="Treat 1001, 1001.0 and '1,001' as the same group key")
+    parser.add_argument("--group-order", default="first", choices=GROUP_ORDERS,
+                        help="Order of the groups: sheet order, natural key order or largest first")
+    parser.add_argument("--reverse-groups", action="store_true", help="Reverse the group order")
+    parser.add_argument("--sort-rows", action="append", default=[], metavar="COLUMN",
+                        help="Header name or column letter to sort the rows of each group by (repeatable)")
+    parser.add_argument("--sort-rows-desc", action="store_true", help="Sort rows within groups descending")
+    parser.add_argument("--engine", default="xml", choices=RENDER_ENGINES, help="SI rendering engine")
+    parser.add_argument("-w", "--workers", type=int, default=1,
+                        help="Processes generating the SI files of one workbook")
+    parser.add_argument("-j", "--jobs", type=int, default=1, help="Workbooks processed at the same time")
+    parser.add_argument("--memory-budget-mb", type=int, default=2048,
+                        help="Estimated memory allowed for concurrent workbooks")
+    parser.add_argument("--max-file-mb", type=float, default=0,
+                        help="Reject input workbooks larger than this before parsing (0 = unlimited)")
+    parser.add_argument("--max-batch-mb", type=float, default=0,
+                        help="Reject input workbooks once the batch would exceed this size (0 = unlimited)")
+    parser.add_argument("--memory-limit-mb", type=int, default=0,
+                        help="Fail a workbook instead of exceeding this much process memory (0 = unlimited)")
+    parser.add_argument("--consolidated-max-sheets", type=int, default=0,
+                        help="Split the consolidated workbook into numbered parts of at most this many sheets")
+    parser.add_argument("--consolidated-max-mb", type=float, default=0,
+                        help="Split the consolidated workbook into numbered parts below this size")
+    parser.add_argument("--export", action="append", default=[], choices=EXPORT_FORMATS, dest="exports",
+                        help="Also write the grouped data in this format, with a manifest (repeatable)")
+    parser.add_argument("-o", "--output-dir",
+                        help="Put SI_Output_* folders here instead of next to each input")
+    parser.add_argument("--zip", metavar="PATH",
+                        help="Write all SI files into one ZIP instead of folders (a directory in watch mode)")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Only regenerate groups whose rows changed since the last run into the same folder")
+    parser.add_argument("--cache-mb", type=int, default=0,
+                        help=f"Reuse results through the disk cache of this size, e.g. {DEFAULT_CACHE_MAX_MB}")
+    parser.add_argument("--no-preflight", action="store_true",
+                        help="Skip the quick check that rejects unusable workbooks before processing")
+    parser.add_argument("--trace", action="store_true",
+                        help="Add per-stage time and memory figures of each workbook to the summary")
+    parser.add_argument("--summary", default='-', help="JSON summary file ('-' for stdout)")
+    parser.add_argument("--watch", metavar="INBOX", help="Keep processing workbooks dropped into this folder")
+    parser.add_argument("--interval", type=float, default=10, help="Seconds between inbox scans in watch mode")
+    parser.add_argument("-q", "--quiet", action="store_true", help="Only print warnings and errors")
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+    if not args.inputs and not args.watch:
+        parser.error("give input workbooks or --watch INBOX")
+
+    group_columns = args.group_column or ["O"]
+    options = SIOptions(
+        group_columns if len(group_columns) > 1 else group_columns[0],
+        engine=args.engine,
+        workers=args.workers,
+        file_concurrency=args.jobs,
+        memory_budget_mb=args.memory_budget_mb,
+        cache_max_mb=args.cache_mb,
+        incremental=args.incremental,
+        trace=args.trace,
+        memory_limit_mb=args.memory_limit_mb,
+        consolidated_max_sheets=args.consolidated_max_sheets,
+        consolidated_max_mb=args.consolidated_max_mb,
+        exports=args.exports,
+        preflight=not args.no_preflight,
+        grouping={
+            "case": args.key_case,
+            "collapse_spaces": args.collapse_spaces,
+            "numbers": args.normalize_numbers,
+            "group_order": args.group_order,
+            "descending": args.reverse_groups,
+            "row_order": args.sort_rows,
+            "row_descending": args.sort_rows_desc,
+        }
+    )
+    cache = ResultCache(max_mb=options.cache_max_mb) if options.cache_max_mb else None
+    log = ConsoleLog(args.quiet)
+
+    if args.watch:
+        if args.zip:
+            os.makedirs(args.zip, exist_ok=True)
+            args.output_dir = args.zip
+        watch(args.watch, options, args, cache, log)
+        return 0
+
+    paths = collect_inputs(args.inputs)
+    if not paths:
+        parser.error("no .xlsx/.xlsm workbooks found")
+    intake = UploadIntake(args.max_file_mb, args.max_batch_mb)
+    summary = run_paths(paths, options, args.output_dir, args.zip, cache, log, intake)
+    write_summary(summary, args.summary)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
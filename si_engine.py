@@ -0,0 +1,1313 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 09:30
+# @Author  : Healer
+# @File    : si_engine.py
+# @Software: PyCharm
+
+"""SI generation engine shared by the Streamlit app and other entry points.
+
+Kept free of Streamlit / pandas imports so it stays cheap to import.
+"""
+
+import datetime
+import gc
+import hashlib
+import json
+import os
+import posixpath
+import re
+import time
+import weakref
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+from copy import copy
+from io import BytesIO
+from xml.etree import ElementTree
+
+import openpyxl
+from openpyxl import load_workbook
+from openpyxl.cell import WriteOnlyCell
+from openpyxl.styles.cell_style import StyleArray
+from openpyxl.styles.numbers import BUILTIN_FORMATS_MAX_SIZE, BUILTIN_FORMATS_REVERSE
+from openpyxl.utils import column_index_from_string, get_column_letter
+from openpyxl.utils.cell import coordinate_from_string
+from openpyxl.writer.excel import ExcelWriter
+
+from si_export import EXPORT_FORMATS, DataExportSink
+from si_grouping import GroupSpec, group_rows, resolve_column
+from si_trace import NULL_TRACER
+
+ORDER_SHEET_NAME = 'No SI Order'
+TEMPLATE_SHEET_NAME = 'SI Template'
+
+# (order sheet header, SI cell) pairs filled from the first row of a group
+FIELD_MAPPING = [
+    ("Destination Port", "B1"),
+    ("Customer Name", "B2"),
+    ("Payment Term", "B3"),
+    ("Transport Mode", "B5"),
+    ("Incoterm", "B6"),
+    ("Forwarder Name", "B13"),
+    ("Forwarder Contact Person", "B14"),
+    ("Forwarder Telephone No", "B15"),
+    ("Forwarder E-Mail", "B16")
+]
+
+# Order sheet headers copied into the SI table, one SI column each (A, B, ...)
+TABLE_COLUMNS = [
+    "Order Nbr", "Total Qty", "Shipment Wt", "Volumetric Wt",
+    "Age (Days)", "PO Nbr", "Sales Rep Name"
+]
+
+TABLE_START_ROW = 19
+
+# 界面上可选的分组列；解析时一并读取，切换分组列不必重新加载
+GROUP_COLUMNS = ("O", "P", "Q", "R", "S", "T")
+
+# 估算解析结果占用内存时每个单元格的字节数
+CELL_MEMORY_ESTIMATE = 100
+
+# 生成结果的格式发生变化时递增，使旧的缓存结果失效
+ENGINE_VERSION = "1"
+
+# "xml" patches sheet XML directly (see xlsx_template), "openpyxl" uses the object model
+RENDER_ENGINES = ("xml", "openpyxl")
+
+
+class UnsupportedPatch(Exception):
+    """The fast XML renderer cannot handle a value; use the openpyxl fallback"""
+
+
+class MemoryLimitExceeded(Exception):
+    """Processing a workbook pushed the process past SIOptions.memory_limit_mb"""
+
+
+class SIOptions:
+    """Settings of one generation run, shared by every entry point"""
+
+    def __init__(self, group_column="O", engine="xml", workers=1, file_concurrency=1, memory_budget_mb=2048,
+                 xlsx_compresslevel=None, archive_compresslevel=None, cache_max_mb=0, incremental=False,
+                 trace=False, memory_limit_mb=0, grouping=None, preflight=True, consolidated_max_sheets=0,
+                 consolidated_max_mb=0, exports=()):
+        if engine not in RENDER_ENGINES:
+            raise ValueError(f"Unknown render engine: {engine}")
+        for export_format in exports:
+            if export_format not in EXPORT_FORMATS:
+                raise ValueError(f"Unknown export format: {export_format}")
+        # 列字母或表头名；多列时为列表，组成组合键
+        self.group_column = group_column
+        # GroupSpec 的其余参数（键的规范化、分组与组内排序）
+        self.grouping = grouping
+        # 批量处理前先快速检查所有文件，拒绝无法生成SI的文件
+        self.preflight = preflight
+        self.engine = engine
+        # 大于 1 时单个工作簿内的分组交给进程池并行生成
+        self.workers = max(1, int(workers))
+        # 批量处理时同时处理的文件数，以及这些文件的估算内存上限
+        self.file_concurrency = max(1, int(file_concurrency))
+        self.memory_budget_mb = memory_budget_mb
+        # 生成的 xlsx 的 deflate 级别（None 为默认）；下载 ZIP 中 xlsx 默认直接存储不再压缩
+        self.xlsx_compresslevel = xlsx_compresslevel
+        self.archive_compresslevel = archive_compresslevel
+        # 结果缓存的磁盘上限，0 表示不使用缓存
+        self.cache_max_mb = cache_max_mb
+        # 保存到目录时只重新生成内容有变化的分组
+        self.incremental = incremental
+        # 记录各阶段耗时与内存峰值（见 si_trace）
+        self.trace = trace
+        # 进程内存上限，0 表示不限制
+        self.memory_limit_mb = memory_limit_mb
+        # 汇总工作簿按表数或大小拆分成编号的分片，0 表示不拆分
+        self.consolidated_max_sheets = consolidated_max_sheets
+        self.consolidated_max_mb = consolidated_max_mb
+        # 额外导出的数据格式（si_export.EXPORT_FORMATS 的子集），附带清单
+        self.exports = list(exports)
+
+    @property
+    def group_spec(self):
+        return GroupSpec(self.group_column, **(self.grouping or {}))
+
+    @property
+    def memory_budget(self):
+        return self.memory_budget_mb * 1024 * 1024 if self.memory_budget_mb else None
+
+
+def current_rss():
+    """Resident memory of this process in bytes (0 where it cannot be read)"""
+    try:
+        with open('/proc/self/statm') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, AttributeError):
+        return 0
+
+
+class MemoryGuard:
+    """Samples the process memory at checkpoints, keeps the peak and stops
+    processing with MemoryLimitExceeded before the ceiling is crossed"""
+
+    # 读取订单表时每隔多少行检查一次
+    ROW_INTERVAL = 5000
+
+    def __init__(self, limit_mb=0):
+        self.limit_mb = limit_mb
+        self.limit = limit_mb * 1024 * 1024 if limit_mb else None
+        self.peak = current_rss()
+
+    def check(self, stage):
+        rss = current_rss()
+        if self.limit and rss > self.limit:
+            # 先回收一次，超限的可能只是尚未释放的垃圾
+            gc.collect()
+            rss = current_rss()
+            if rss > self.limit:
+                self.peak = max(self.peak, rss)
+                raise MemoryLimitExceeded(
+                    f"Memory use reached {rss / 1024 / 1024:.0f} MB while {stage}, "
+                    f"above the {self.limit_mb} MB limit"
+                )
+        self.peak = max(self.peak, rss)
+
+    @property
+    def peak_mb(self):
+        return self.peak / 1024 / 1024
+
+
+def layout_fingerprint():
+    """Fingerprint of the SI layout this engine produces (mappings + version)"""
+    layout = repr((ENGINE_VERSION, FIELD_MAPPING, TABLE_COLUMNS, TABLE_START_ROW))
+    return hashlib.sha256(layout.encode('utf-8')).hexdigest()[:16]
+
+
+def normalize_header(value):
+    """Normalize a header cell value for case-insensitive lookups"""
+    if value is None:
+        return ''
+    return str(value).strip().lower()
+
+
+class HeaderIndex:
+    """Header name -> column index, resolved once from row 1 of a sheet"""
+
+    def __init__(self, header_values):
+        self._columns = {}
+        for col_idx, value in enumerate(header_values, 1):
+            name = normalize_header(value)
+            # 与原 find_column_index 保持一致：重复表头取最左边一列
+            if name and name not in self._columns:
+                self._columns[name] = col_idx
+
+    @classmethod
+    def from_sheet(cls, sheet):
+        for header_row in sheet.iter_rows(min_row=1, max_row=1, values_only=True):
+            return cls(header_row)
+        return cls(())
+
+    def get(self, column_name):
+        return self._columns.get(normalize_header(column_name))
+
+    def __contains__(self, column_name):
+        return normalize_header(column_name) in self._columns
+
+    def __len__(self):
+        return len(self._columns)
+
+
+class FieldPlan:
+    """Compiled field mapping for one order sheet.
+
+    Built once per workbook and shared by the individual-SI and the
+    consolidated paths, so the header row is never rescanned per row.
+    """
+
+    def __init__(self, header_index, field_mapping=None, table_columns=None):
+        field_mapping = FIELD_MAPPING if field_mapping is None else field_mapping
+        table_columns = TABLE_COLUMNS if table_columns is None else table_columns
+
+        # (header name, SI cell address, source column index or None)
+        self.header_fields = [
+            (field_name, cell_address, header_index.get(field_name))
+            for field_name, cell_address in field_mapping
+        ]
+        # (header name, SI column index, source column index or None)
+        self.table_fields = [
+            (column_name, target_col, header_index.get(column_name))
+            for target_col, column_name in enumerate(table_columns, 1)
+        ]
+        self.table_width = len(table_columns)
+        self.missing_headers = [
+            name for name, _, source_col in self.header_fields + self.table_fields
+            if source_col is None
+        ]
+
+    @classmethod
+    def from_sheet(cls, order_sheet, field_mapping=None, table_columns=None):
+        return cls(HeaderIndex.from_sheet(order_sheet), field_mapping, table_columns)
+
+    @property
+    def source_columns(self):
+        """Sorted source column indexes the plan reads from"""
+        return sorted({
+            source_col for _, _, source_col in self.header_fields + self.table_fields
+            if source_col is not None
+        })
+
+
+class OrderData:
+    """Columnar snapshot of the 'No SI Order' sheet.
+
+    Only the columns the plan (and the group column) need are kept, as one
+    list per column; ``row_numbers`` maps each position back to its sheet row.
+    """
+
+    def __init__(self, header_index, plan, columns, row_numbers):
+        self.header_index = header_index
+        self.plan = plan
+        self.columns = columns
+        self.row_numbers = row_numbers
+
+    def __len__(self):
+        return len(self.row_numbers)
+
+    def has_columns(self, refs):
+        """Whether every resolvable column of ``refs`` was extracted"""
+        for ref in refs:
+            col_idx = resolve_column(self.header_index, ref)
+            if col_idx is not None and col_idx not in self.columns:
+                return False
+        return True
+
+    def column(self, col_idx):
+        if col_idx not in self.columns:
+            raise KeyError(f"Column {get_column_letter(col_idx)} was not extracted")
+        return self.columns[col_idx]
+
+    def group_record(self, key, positions):
+        """Build the detached GroupRecord for the rows at ``positions``"""
+        columns = self.columns
+        first = positions[0]
+        header_values = [
+            columns[source_col][first] if source_col else None
+            for _, _, source_col in self.plan.header_fields
+        ]
+        table_cols = [
+            columns[source_col] if source_col else None
+            for _, _, source_col in self.plan.table_fields
+        ]
+        table_rows = [
+            tuple(col[pos] if col is not None else None for col in table_cols)
+            for pos in positions
+        ]
+        return GroupRecord(key, header_values, table_rows,
+                           [self.row_numbers[pos] for pos in positions])
+
+
+class GroupRecord:
+    """Values of one SI group, detached from any workbook.
+
+    ``header_values`` follows ``plan.header_fields`` and each entry of
+    ``table_rows`` follows ``plan.table_fields``.
+    """
+
+    __slots__ = ('key', 'header_values', 'table_rows', 'source_rows')
+
+    def __init__(self, key, header_values, table_rows, source_rows=None):
+        self.key = key
+        self.header_values = header_values
+        self.table_rows = table_rows
+        self.source_rows = source_rows or []
+
+    def fingerprint(self, template_hash):
+        """Hash of everything that ends up in this group's SI"""
+        content = repr((layout_fingerprint(), template_hash, self.key, self.header_values, self.table_rows))
+        return hashlib.sha256(content.encode('utf-8')).hexdigest()
+
+
+def read_order_sheet(source, extra_columns=(), tracer=NULL_TRACER, guard=None):
+    """Stream 'No SI Order' once in read-only, values-only mode.
+
+    ``source`` is a path or a binary file object. ``extra_columns`` are
+    column letters or header names to keep besides the mapped fields (e.g.
+    the group columns); unknown ones are left to the grouping to report.
+    A MemoryGuard ``guard`` is checked every few thousand rows.
+    """
+    with tracer.stage("open_workbook"):
+        workbook = load_workbook(source, read_only=True, data_only=True)
+    try:
+        check_required_sheets(workbook.sheetnames)
+
+        order_sheet = workbook[ORDER_SHEET_NAME]
+        # 导出文件的 dimension 经常不准，按实际行读取
+        order_sheet.reset_dimensions()
+        rows = order_sheet.iter_rows(values_only=True)
+
+        with tracer.stage("resolve_headers"):
+            header_index = HeaderIndex(next(rows, ()))
+            plan = FieldPlan(header_index)
+
+        wanted = set(plan.source_columns)
+        wanted.update(resolve_column(header_index, ref) for ref in extra_columns)
+        wanted.discard(None)
+        columns = {col_idx: [] for col_idx in sorted(wanted)}
+        # (position in row tuple, target list)
+        targets = [(col_idx - 1, values) for col_idx, values in columns.items()]
+
+        row_numbers = []
+        with tracer.stage("read_order_rows"):
+            for row_number, row in enumerate(rows, 2):
+                width = len(row)
+                row_numbers.append(row_number)
+                for offset, values in targets:
+                    values.append(row[offset] if offset < width else None)
+                if guard is not None and row_number % guard.ROW_INTERVAL == 0:
+                    guard.check(f"reading row {row_number}")
+
+        return OrderData(header_index, plan, columns, row_numbers)
+    finally:
+        workbook.close()
+
+
+def group_data_by_column(order_data, column_letter):
+    """Group positions of ``order_data`` by the value in ``column_letter``
+
+    ``column_letter`` may also be a GroupSpec (see si_grouping).
+    """
+    spec = column_letter if isinstance(column_letter, GroupSpec) else GroupSpec([column_letter])
+    try:
+        return group_rows(order_data, spec)
+    except Exception as e:
+        raise Exception(f"Error grouping data: {str(e)}")
+
+
+class TemplateSnapshot:
+    """'SI Template' compiled once: dimensions, merges, values and styles.
+
+    Distinct cell styles are kept once as (font, border, fill, number_format,
+    protection, alignment) tuples. :meth:`stamp` registers them once per
+    target workbook and then only hands out StyleArray ids, so stamping a
+    sheet never copies a style object per cell.
+    """
+
+    def __init__(self, template_sheet):
+        workbook = template_sheet.parent
+
+        self.column_dimensions = [
+            (col_letter, col_dim.width, col_dim.hidden)
+            for col_letter, col_dim in template_sheet.column_dimensions.items()
+        ]
+        self.row_dimensions = [
+            (row_num, row_dim.height, row_dim.hidden)
+            for row_num, row_dim in template_sheet.row_dimensions.items()
+        ]
+        self.merged_ranges = [str(merged_range) for merged_range in template_sheet.merged_cells.ranges]
+
+        self.styles = []
+        style_slots = {}
+        # (row, column, value, style slot or None, hyperlink)
+        self.cells = []
+        for row in template_sheet.iter_rows():
+            for cell in row:
+                slot = None
+                if cell.has_style:
+                    style = cell._style
+                    style_key = (style.fontId, style.borderId, style.fillId,
+                                 style.numFmtId, style.protectionId, style.alignmentId)
+                    slot = style_slots.get(style_key)
+                    if slot is None:
+                        slot = style_slots[style_key] = len(self.styles)
+                        self.styles.append((
+                            workbook._fonts[style.fontId],
+                            workbook._borders[style.borderId],
+                            workbook._fills[style.fillId],
+                            cell.number_format,
+                            workbook._protections[style.protectionId],
+                            workbook._alignments[style.alignmentId],
+                        ))
+                if cell.value is None and slot is None and not cell.hyperlink:
+                    continue
+                self.cells.append((cell.row, cell.column, cell.value, slot, cell.hyperlink))
+
+        self.max_row = template_sheet.max_row
+        self.max_column = template_sheet.max_column
+        self.page_setup = copy(template_sheet.page_setup)
+        # 不保留对模板工作表的引用，快照需要可以 pickle
+        self.page_setup._parent = None
+        self.print_options = copy(template_sheet.print_options)
+
+        self._bound = weakref.WeakKeyDictionary()
+        self._fingerprint = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_bound']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._bound = weakref.WeakKeyDictionary()
+
+    @property
+    def fingerprint(self):
+        """Hash of everything the snapshot reproduces"""
+        if self._fingerprint is None:
+            content = repr((
+                self.column_dimensions, self.row_dimensions, self.merged_ranges, self.styles, self.cells,
+                self.max_row, self.max_column, self.page_setup, self.print_options,
+            ))
+            self._fingerprint = hashlib.sha256(content.encode('utf-8')).hexdigest()
+        return self._fingerprint
+
+    def style_arrays(self, workbook):
+        """StyleArray per style slot, registered in ``workbook`` once"""
+        arrays = self._bound.get(workbook)
+        if arrays is None:
+            arrays = self._bound[workbook] = [
+                _register_style(workbook, *style) for style in self.styles
+            ]
+        return arrays
+
+    def stamp(self, target_sheet):
+        """Reproduce the template on an empty ``target_sheet``"""
+        for col_letter, width, hidden in self.column_dimensions:
+            target_sheet.column_dimensions[col_letter].width = width
+            if hidden:
+                target_sheet.column_dimensions[col_letter].hidden = True
+
+        for row_num, height, hidden in self.row_dimensions:
+            target_sheet.row_dimensions[row_num].height = height
+            if hidden:
+                target_sheet.row_dimensions[row_num].hidden = True
+
+        for merged_range in self.merged_ranges:
+            target_sheet.merge_cells(merged_range)
+
+        style_arrays = self.style_arrays(target_sheet.parent)
+        for row, column, value, slot, hyperlink in self.cells:
+            new_cell = target_sheet.cell(row=row, column=column, value=value)
+            if slot is not None:
+                new_cell._style = copy(style_arrays[slot])
+            if hyperlink:
+                new_cell.hyperlink = hyperlink
+                new_cell.style = "Hyperlink"
+
+        # 保持与模板相同的使用区域（max_row 决定表格行是否需要扩展样式）
+        target_sheet.cell(row=self.max_row, column=self.max_column)
+
+        page_setup = copy(self.page_setup)
+        page_setup._parent = target_sheet
+        target_sheet.page_setup = page_setup
+        target_sheet.print_options = copy(self.print_options)
+
+    def stream(self, target_sheet, rendered):
+        """Write the template filled with ``rendered`` to a write-only sheet.
+
+        Same result as :func:`write_si_sheet`, but rows can only be appended
+        in order, so the sheet is laid out as ``{row: {column: cell}}`` first.
+        """
+        for col_letter, width, hidden in self.column_dimensions:
+            target_sheet.column_dimensions[col_letter].width = width
+            if hidden:
+                target_sheet.column_dimensions[col_letter].hidden = True
+
+        for row_num, height, hidden in self.row_dimensions:
+            target_sheet.row_dimensions[row_num].height = height
+            if hidden:
+                target_sheet.row_dimensions[row_num].hidden = True
+
+        for merged_range in self.merged_ranges:
+            target_sheet.merged_cells.add(merged_range)
+
+        page_setup = copy(self.page_setup)
+        page_setup._parent = target_sheet
+        target_sheet.page_setup = page_setup
+        target_sheet.print_options = copy(self.print_options)
+
+        style_arrays = self.style_arrays(target_sheet.parent)
+        rows = {}
+        for row, column, value, slot, hyperlink in self.cells:
+            cell = WriteOnlyCell(target_sheet, value)
+            if slot is not None:
+                cell._style = copy(style_arrays[slot])
+            if hyperlink:
+                cell.hyperlink = copy(hyperlink)
+                cell.style = "Hyperlink"
+            rows.setdefault(row, {})[column] = cell
+
+        def cell_at(row, column):
+            cells = rows.setdefault(row, {})
+            cell = cells.get(column)
+            if cell is None:
+                cell = cells[column] = WriteOnlyCell(target_sheet)
+            return cell
+
+        for row, column, value in rendered.header_cells:
+            cell_at(row, column).value = value
+
+        # 与 fill_table_data 相同：超出模板的行沿用上一行的样式
+        for target_row, cells in rendered.table_rows:
+            if target_row >= rendered.extend_from:
+                for column in range(1, rendered.table_width + 1):
+                    source_cell = rows.get(target_row - 1, {}).get(column)
+                    if source_cell is not None and source_cell.has_style:
+                        target_cell = cell_at(target_row, column)
+                        target_cell._style = extended_style(source_cell._style, target_cell._style)
+            for column, value in cells:
+                cell_at(target_row, column).value = value
+
+        max_row = max([self.max_row] + list(rows))
+        for row in range(1, max_row + 1):
+            cells = rows.pop(row, {})
+            target_sheet.append([cells.get(column) for column in range(1, max(cells, default=0) + 1)])
+
+
+class ParsedWorkbook:
+    """Settings-independent parse of one upload: order columns plus template.
+
+    Worth keeping between runs: regrouping or re-rendering with other
+    settings starts from here instead of reading the workbook again. The XML
+    template is compiled on first use.
+    """
+
+    def __init__(self, order_data, template):
+        self.order_data = order_data
+        self.template = template
+        self._xlsx_template = None
+
+    @classmethod
+    def load(cls, source, extra_columns=GROUP_COLUMNS, tracer=NULL_TRACER, guard=None):
+        order_data = read_order_sheet(source, extra_columns, tracer, guard)
+        # 只有模板表需要带样式加载
+        with tracer.stage("load_template"):
+            template = TemplateSnapshot(load_template_workbook(source)[TEMPLATE_SHEET_NAME])
+        return cls(order_data, template)
+
+    @property
+    def xlsx_template(self):
+        # 延迟导入：xlsx_template 本身依赖本模块
+        from xlsx_template import XlsxTemplate
+
+        if self._xlsx_template is None:
+            self._xlsx_template = XlsxTemplate(self.template)
+        return self._xlsx_template
+
+    @property
+    def estimated_memory(self):
+        cells = len(self.order_data) * len(self.order_data.columns) + len(self.template.cells)
+        return cells * CELL_MEMORY_ESTIMATE
+
+
+def _register_style(workbook, font, border, fill, number_format, protection, alignment):
+    """Add one style to the shared tables of ``workbook`` and return its ids"""
+    style = StyleArray()
+    style.fontId = workbook._fonts.add(font)
+    style.borderId = workbook._borders.add(border)
+    style.fillId = workbook._fills.add(fill)
+    if number_format in BUILTIN_FORMATS_REVERSE:
+        style.numFmtId = BUILTIN_FORMATS_REVERSE[number_format]
+    else:
+        style.numFmtId = workbook._number_formats.add(number_format) + BUILTIN_FORMATS_MAX_SIZE
+    style.protectionId = workbook._protections.add(protection)
+    style.alignmentId = workbook._alignments.add(alignment)
+    return style
+
+
+class RenderedGroup:
+    """One group's SI content, computed once and written by every sink.
+
+    ``header_cells`` is a list of (row, column, value); ``table_rows`` a list
+    of (row, [(column, value), ...]). Table rows from ``extend_from`` on lie
+    past the template and take their styles from the row above.
+    """
+
+    __slots__ = ('key', 'header_cells', 'table_rows', 'table_width', 'extend_from')
+
+    def __init__(self, key, header_cells, table_rows, table_width, extend_from):
+        self.key = key
+        self.header_cells = header_cells
+        self.table_rows = table_rows
+        self.table_width = table_width
+        self.extend_from = extend_from
+
+
+def render_group(record, plan, template_max_row):
+    """Turn a GroupRecord into SI cell values, independent of any output"""
+    header_cells = []
+    for (field_name, cell_address, col_idx), value in zip(plan.header_fields, record.header_values):
+        if col_idx:
+            column_letter, row = coordinate_from_string(cell_address)
+            header_cells.append((row, column_index_from_string(column_letter), value))
+
+    table_rows = []
+    for i, row_values in enumerate(record.table_rows):
+        table_rows.append((TABLE_START_ROW + i, [
+            (col_idx, value)
+            for (column_name, col_idx, source_col_idx), value in zip(plan.table_fields, row_values)
+            if source_col_idx
+        ]))
+
+    # 表头单元格也可能超出模板范围，按写入后的最大行判断
+    used_rows = max([template_max_row] + [row for row, _, _ in header_cells])
+    return RenderedGroup(record.key, header_cells, table_rows, plan.table_width, used_rows + 1)
+
+
+def copy_sheet_with_formatting(template, target_sheet):
+    """Copy entire sheet with all formatting
+
+    ``template`` is a TemplateSnapshot, or a worksheet to snapshot first.
+    """
+    try:
+        if not isinstance(template, TemplateSnapshot):
+            template = TemplateSnapshot(template)
+        template.stamp(target_sheet)
+
+    except Exception as e:
+        raise Exception(f"Error copying sheet formatting: {str(e)}")
+
+
+def fill_specific_info(si_sheet, rendered):
+    """Fill specific information into SI template"""
+    for row, column, value in rendered.header_cells:
+        si_sheet.cell(row=row, column=column).value = value
+
+
+def extended_style(source_style, target_style):
+    """Style of a cell that continues the row above.
+
+    The six style ids of ``source_style`` are already registered in the
+    workbook, so they are shared instead of copying the style objects and
+    registering them again; the rest comes from ``target_style``.
+    """
+    style = copy(target_style) if target_style else StyleArray()
+    style.fontId = source_style.fontId
+    style.borderId = source_style.borderId
+    style.fillId = source_style.fillId
+    style.numFmtId = source_style.numFmtId
+    style.protectionId = source_style.protectionId
+    style.alignmentId = source_style.alignmentId
+    return style
+
+
+def fill_table_data(si_sheet, rendered):
+    """Fill table data starting from row 19"""
+    for target_row, cells in rendered.table_rows:
+        if target_row >= rendered.extend_from:
+            for col in range(1, rendered.table_width + 1):
+                source_cell = si_sheet.cell(row=target_row - 1, column=col)
+                target_cell = si_sheet.cell(row=target_row, column=col)
+
+                if source_cell.has_style:
+                    target_cell._style = extended_style(source_cell._style, target_cell._style)
+
+        for column, value in cells:
+            si_sheet.cell(row=target_row, column=column).value = value
+
+
+def write_si_sheet(si_sheet, rendered, template):
+    """Stamp the template onto ``si_sheet`` and fill in ``rendered``"""
+    copy_sheet_with_formatting(template, si_sheet)
+    fill_specific_info(si_sheet, rendered)
+    fill_table_data(si_sheet, rendered)
+
+
+def create_safe_filename(text):
+    """创建安全的文件名，移除特殊字符但保持完整内容"""
+    # 只移除Windows不允许的特殊字符，保持其他内容完整
+    safe_text = re.sub(r'[<>:"/\\|?*]', '', text)
+    safe_text = re.sub(r'\s+', ' ', safe_text.strip())  # 保留空格，不替换为下划线
+    return safe_text  # 不再限制长度
+
+
+def si_filename(group_key, original_filename):
+    """File name of the individual SI for ``group_key``"""
+    # 使用完整的原始文件名，不再截断
+    file_base_name = os.path.splitext(original_filename)[0]
+    return f"SI_{create_safe_filename(group_key)}_{file_base_name}.xlsx"
+
+
+def consolidated_sheet_name(group_key):
+    """Sheet title of ``group_key`` in the consolidated workbook"""
+    safe_sheet_name = "".join(c for c in str(group_key) if c.isalnum() or c in (' ', '-', '_')).rstrip()
+    return f"SI_{safe_sheet_name}"  # 不再截断
+
+
+def output_folder_name(original_filename):
+    """Folder the results of ``original_filename`` go to in local mode"""
+    # 创建输出目录 - 使用完整的原始文件名
+    return f"SI_Output_{os.path.splitext(original_filename)[0]}"
+
+
+class OutputFile:
+    """One generated file: on disk (``path``), in memory (``data``), or
+    already streamed into an archive (neither)"""
+
+    __slots__ = ('name', 'path', 'data', 'size')
+
+    def __init__(self, name, path=None, data=None, size=None):
+        self.name = name
+        self.path = path
+        self.data = data
+        if size is None:
+            size = len(data) if data is not None else os.path.getsize(path)
+        self.size = size
+
+    def read_bytes(self):
+        if self.data is not None:
+            return self.data
+        with open(self.path, "rb") as f:
+            return f.read()
+
+
+class DirectoryOutput:
+    """Saves result files into ``folder`` ("Same as input files" mode)"""
+
+    # 可以直接交给工作进程使用
+    process_safe = True
+
+    def __init__(self, folder):
+        self.folder = folder
+        # 增量生成的清单放在输出目录旁边
+        self.manifest_path = os.path.normpath(folder) + MANIFEST_SUFFIX
+        os.makedirs(folder, exist_ok=True)
+
+    def save(self, filename, write):
+        """Call ``write(destination)`` and return the resulting OutputFile"""
+        path = os.path.join(self.folder, filename)
+        write(path)
+        return OutputFile(filename, path=path)
+
+    def add(self, output_file):
+        """Store a file produced elsewhere (e.g. by a worker process)"""
+        if output_file.path == os.path.join(self.folder, output_file.name):
+            return output_file
+        data = output_file.read_bytes()
+        return self.save(output_file.name, lambda path: _write_bytes(path, data))
+
+
+class MemoryOutput:
+    """Keeps result files as bytes; nothing touches the disk"""
+
+    process_safe = True
+
+    def save(self, filename, write):
+        buffer = BytesIO()
+        write(buffer)
+        return OutputFile(filename, data=buffer.getvalue())
+
+    def add(self, output_file):
+        return output_file
+
+
+def _write_bytes(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+def save_workbook(workbook, destination, compresslevel=None):
+    """``Workbook.save`` with a configurable deflate level for the package"""
+    if compresslevel is None:
+        workbook.save(destination)
+        return
+    archive = zipfile.ZipFile(destination, 'w', zipfile.ZIP_DEFLATED, allowZip64=True, compresslevel=compresslevel)
+    workbook.properties.modified = datetime.datetime.utcnow()
+    ExcelWriter(workbook, archive).save()
+
+
+class SIFileSink:
+    """Writes every rendered group to its own SI_<group>_<file>.xlsx"""
+
+    def __init__(self, template, output, original_filename, xlsx_template=None, compresslevel=None):
+        self.template = template
+        self.output = output
+        self.original_filename = original_filename
+        self.xlsx_template = xlsx_template
+        self.compresslevel = compresslevel
+
+    def write(self, rendered):
+        filename = si_filename(rendered.key, self.original_filename)
+
+        if self.xlsx_template is not None:
+            try:
+                return self.output.save(
+                    filename,
+                    lambda destination: self.xlsx_template.render(rendered, destination, self.compresslevel)
+                )
+            except UnsupportedPatch:
+                pass  # 回退到 openpyxl
+
+        si_wb = openpyxl.Workbook()
+        si_wb.remove(si_wb.active)
+        write_si_sheet(si_wb.create_sheet(title="SI"), rendered, self.template)
+        return self.output.save(filename, lambda destination: save_workbook(si_wb, destination, self.compresslevel))
+
+
+class ConsolidatedShard:
+    """One saved file of the consolidated output"""
+
+    __slots__ = ('output_file', 'sheets', 'sheet_bytes', 'seconds', 'groups')
+
+    def __init__(self, output_file, sheets, sheet_bytes, seconds, groups):
+        self.output_file = output_file
+        self.sheets = sheets
+        # 各表 XML 的总大小（压缩前）
+        self.sheet_bytes = sheet_bytes
+        self.seconds = seconds
+        # (group key, sheet title)
+        self.groups = groups
+
+
+class ConsolidatedSink:
+    """Appends every rendered group as one sheet of the consolidated output.
+
+    Sheets are streamed in openpyxl write-only mode: each one is serialized
+    to a temporary file as soon as its group is written, so memory does not
+    grow with the number of groups. All sheets share the style table the
+    snapshot registers once per workbook.
+
+    With ``max_sheets`` or ``max_bytes`` the output is split into numbered
+    shards (``<name>_part01.xlsx``, ...). ``max_bytes`` bounds the sheet XML
+    of a shard before compression, so the saved file stays below it; a
+    single sheet larger than the limit still gets a shard of its own. A
+    full shard is saved to ``output`` right away.
+    """
+
+    def __init__(self, template, output, filename, compresslevel=None, max_sheets=0, max_bytes=0,
+                 tracer=NULL_TRACER):
+        self.template = template
+        self.output = output
+        self.filename = filename
+        self.compresslevel = compresslevel
+        self.max_sheets = max_sheets
+        self.max_bytes = max_bytes
+        self.tracer = tracer
+        self.shards = []
+        self._sheets = 0
+        self._new_shard()
+
+    def __len__(self):
+        return self._sheets
+
+    def _new_shard(self):
+        self.workbook = openpyxl.Workbook(write_only=True)
+        self._shard_sheets = 0
+        self._shard_bytes = 0
+        self._shard_groups = []
+        self._shard_started = time.perf_counter()
+
+    def _stream(self, rendered):
+        si_sheet = self.workbook.create_sheet(title=consolidated_sheet_name(rendered.key))
+        self.template.stream(si_sheet, rendered)
+        # 立即关闭，表的 XML 落到临时文件里，大小也就确定了
+        si_sheet.close()
+        return si_sheet, os.path.getsize(si_sheet._writer.out)
+
+    def write(self, rendered):
+        if self.max_sheets and self._shard_sheets >= self.max_sheets:
+            self._save_shard()
+        with self.tracer.stage("consolidated_write"):
+            si_sheet, sheet_bytes = self._stream(rendered)
+        if self.max_bytes and self._shard_sheets and self._shard_bytes + sheet_bytes > self.max_bytes:
+            # 放不下：撤回这张表，保存当前分片，在新分片里重写
+            self.workbook.remove(si_sheet)
+            si_sheet._writer.cleanup()
+            self._save_shard()
+            with self.tracer.stage("consolidated_write"):
+                si_sheet, sheet_bytes = self._stream(rendered)
+        self._shard_sheets += 1
+        self._shard_bytes += sheet_bytes
+        self._shard_groups.append((rendered.key, si_sheet.title))
+        self._sheets += 1
+
+    def _shard_name(self, number):
+        base, extension = os.path.splitext(self.filename)
+        return f"{base}_part{number:02d}{extension}"
+
+    def _save_shard(self, filename=None):
+        filename = filename or self._shard_name(len(self.shards) + 1)
+        workbook = self.workbook
+        with self.tracer.stage("consolidated_save"):
+            output_file = self.output.save(
+                filename, lambda destination: save_workbook(workbook, destination, self.compresslevel)
+            )
+        self.shards.append(ConsolidatedShard(
+            output_file, self._shard_sheets, self._shard_bytes, time.perf_counter() - self._shard_started,
+            self._shard_groups
+        ))
+        self._new_shard()
+
+    def close(self):
+        """Save the last shard; returns the OutputFiles of all shards.
+
+        Without any split the one file keeps the plain ``filename``.
+        """
+        if self._shard_sheets:
+            self._save_shard(None if self.shards else self.filename)
+        return [shard.output_file for shard in self.shards]
+
+
+def generate_si_files(records, plan, template, xlsx_template, output, original_filename, workers=1,
+                      compresslevel=None, tracer=NULL_TRACER):
+    """Render and save the individual SI file of every GroupRecord.
+
+    Yields ``(group key, OutputFile, RenderedGroup, error)`` in input order, so
+    the caller can feed the consolidated workbook and the log exactly as in
+    the serial loop. A failing group yields its error message instead of
+    raising. With ``workers > 1`` the groups run in a process pool; the plan
+    and compiled template are shipped to each worker once, not per group.
+    Outputs that cannot be shared with other processes (e.g. a streaming
+    archive) receive the files from the workers as bytes. Stage timings of
+    the workers are merged into ``tracer``.
+    """
+    if workers <= 1:
+        sink = SIFileSink(template, output, original_filename, xlsx_template, compresslevel)
+        for record in records:
+            yield _write_individual_si(sink, plan, record, tracer)
+        return
+
+    worker_output = output if getattr(output, 'process_safe', False) else MemoryOutput()
+    records = list(records)
+    chunksize = max(1, len(records) // (workers * 4))
+    with ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_si_worker,
+            initargs=(plan, template, xlsx_template, worker_output, original_filename, compresslevel, tracer.enabled)
+    ) as executor:
+        for result, stages in executor.map(_si_worker, records, chunksize=chunksize):
+            group_key, individual_si, rendered, error = result
+            if stages:
+                tracer.merge(stages)
+            if individual_si is not None and worker_output is not output:
+                individual_si = output.add(individual_si)
+            yield group_key, individual_si, rendered, error
+
+
+def _write_individual_si(sink, plan, record, tracer=NULL_TRACER):
+    try:
+        with tracer.stage("render_group"):
+            rendered = render_group(record, plan, sink.template.max_row)
+        with tracer.stage("save_si"):
+            individual_si = sink.write(rendered)
+        return record.key, individual_si, rendered, None
+    except Exception as e:
+        return record.key, None, None, str(e)
+
+
+# 每个工作进程里常驻的 (plan, SIFileSink, tracer)，由 _init_si_worker 设置
+_worker_state = None
+
+
+def _init_si_worker(plan, template, xlsx_template, output, original_filename, compresslevel, trace):
+    global _worker_state
+    from si_trace import Tracer
+
+    tracer = Tracer("worker") if trace else NULL_TRACER
+    _worker_state = (plan, SIFileSink(template, output, original_filename, xlsx_template, compresslevel), tracer)
+
+
+def _si_worker(record):
+    plan, sink, tracer = _worker_state
+    result = _write_individual_si(sink, plan, record, tracer)
+    if not tracer.enabled:
+        return result, None
+    # 每次只交回本组的统计
+    stages, tracer.stages = tracer.stages, {}
+    return result, stages
+
+
+MANIFEST_SUFFIX = ".manifest.json"
+MANIFEST_VERSION = 1
+
+
+class GroupManifest:
+    """Fingerprint and file name of every SI in an output folder.
+
+    Stored as ``<folder>.manifest.json`` next to the folder. A group whose
+    fingerprint matches and whose file still exists does not need to be
+    generated again.
+    """
+
+    def __init__(self, path, groups=None):
+        self.path = path
+        self.folder = path[:-len(MANIFEST_SUFFIX)]
+        # group key -> (fingerprint, file name)
+        self.groups = groups or {}
+
+    @classmethod
+    def load(cls, path):
+        try:
+            with open(path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get("version") != MANIFEST_VERSION:
+                return cls(path)
+            return cls(path, {key: tuple(entry) for key, entry in data["groups"].items()})
+        except (OSError, KeyError, ValueError):
+            # 没有或损坏的清单按全量生成处理
+            return cls(path)
+
+    @staticmethod
+    def discard(path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def is_current(self, key, fingerprint):
+        entry = self.groups.get(key)
+        return entry is not None and entry[0] == fingerprint and os.path.exists(os.path.join(self.folder, entry[1]))
+
+    def existing_file(self, key):
+        filename = self.groups[key][1]
+        return OutputFile(filename, path=os.path.join(self.folder, filename))
+
+    def save(self):
+        data = {
+            "version": MANIFEST_VERSION,
+            "groups": {key: list(entry) for key, entry in self.groups.items()},
+        }
+        temp_path = self.path + ".tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(temp_path, self.path)
+
+
+def _generate_incremental(records, manifest, fingerprints, template, plan, output, generate):
+    """Like :func:`generate_si_files`, but groups listed as current in
+    ``manifest`` keep their existing file and are only rendered again for the
+    consolidated workbook. ``generate`` produces the changed groups and
+    ``fingerprints`` receives the fingerprint of every group.
+    """
+    records = list(records)
+    changed = []
+    for record in records:
+        fingerprints[record.key] = record.fingerprint(template.fingerprint)
+        if not manifest.is_current(record.key, fingerprints[record.key]):
+            changed.append(record)
+
+    changed_keys = {record.key for record in changed}
+    generated = generate(changed)
+    for record in records:
+        if record.key in changed_keys:
+            yield next(generated)
+            continue
+        try:
+            rendered = render_group(record, plan, template.max_row)
+            yield record.key, output.add(manifest.existing_file(record.key)), rendered, None
+        except Exception as e:
+            yield record.key, None, None, str(e)
+
+
+def process_workbook(source, file_name, options, output, log, parsed=None, tracer=NULL_TRACER, guard=None):
+    """Generate every SI of one order workbook.
+
+    ``source`` is a path or binary file object (e.g. the upload buffer),
+    ``output`` a DirectoryOutput or MemoryOutput and ``log`` anything with
+    info/warning methods (a Streamlit container, a LogBuffer, ...).
+    ``parsed`` is an earlier ParsedWorkbook of ``source``; without it the
+    workbook is read here. With ``options.incremental`` and an output that
+    has a ``manifest_path``, unchanged groups keep their existing files and
+    files of groups that disappeared are deleted. Stage timings go to
+    ``tracer``. With ``options.memory_limit_mb``, ``guard`` (a MemoryGuard)
+    stops the run before the limit is crossed. ``options.exports`` adds the
+    data exports and their manifest (see si_export) after the consolidated
+    workbook. Returns the OutputFiles written, the consolidated workbook
+    (or its shards) after the SI files.
+    """
+    group_spec = options.group_spec
+    if guard is None:
+        guard = MemoryGuard(options.memory_limit_mb)
+    # 复用的解析结果缺少按表头名指定的列时重新读取
+    if parsed is not None and not parsed.order_data.has_columns(group_spec.refs):
+        parsed = None
+    if parsed is None:
+        # 订单表只读流式读取一次，只保留需要的列
+        parsed = ParsedWorkbook.load(source, extra_columns=group_spec.refs, tracer=tracer, guard=guard)
+    order_data = parsed.order_data
+
+    # 表头只解析一次，单个SI和汇总文件共用同一个映射
+    plan = order_data.plan
+    if plan.missing_headers:
+        log.warning(f"⚠️ {file_name}: Missing headers: {', '.join(plan.missing_headers)}")
+
+    # Group data
+    with tracer.stage("group_data_by_column"):
+        grouped_data = group_data_by_column(order_data, group_spec)
+
+    if not grouped_data:
+        raise Exception(f"No valid data found in column {group_spec.label}")
+
+    log.info(f"📁 {file_name}: Found {len(grouped_data)} groups")
+
+    template = parsed.template
+    xlsx_template = parsed.xlsx_template if options.engine == "xml" else None
+
+    file_base_name = os.path.splitext(file_name)[0]
+
+    result_files = []
+    si_count = 0
+
+    # 每个分组只渲染一次，再分别写入单独文件和汇总工作簿
+    consolidated_sink = ConsolidatedSink(
+        template, output, f"Consolidated_SI_{file_base_name}.xlsx", options.xlsx_compresslevel,
+        options.consolidated_max_sheets, int(options.consolidated_max_mb * 1024 * 1024), tracer
+    )
+    export_sink = None
+    if options.exports:
+        export_sink = DataExportSink(order_data, file_name, options.exports, group_spec.to_dict())
+    records = (order_data.group_record(key, positions) for key, positions in grouped_data.items())
+
+    def generate(group_records):
+        return generate_si_files(
+            group_records, plan, template, xlsx_template, output, file_name, options.workers,
+            options.xlsx_compresslevel, tracer
+        )
+
+    manifest_path = getattr(output, 'manifest_path', None) if options.incremental else None
+    manifest = None
+    fingerprints = {}
+    if manifest_path:
+        manifest = GroupManifest.load(manifest_path)
+        generated = _generate_incremental(records, manifest, fingerprints, template, plan, output, generate)
+    else:
+        generated = generate(records)
+    new_manifest = GroupManifest(manifest_path) if manifest_path else None
+
+    for group_key, individual_si, rendered, error in generated:
+        # 超限时中止整个文件，而不是让进程被 OOM 杀掉
+        guard.check(f"writing group {group_key}")
+        try:
+            if error:
+                raise Exception(error)
+
+            # Create individual SI file
+            result_files.append(individual_si)
+            if new_manifest is not None:
+                new_manifest.groups[group_key] = (fingerprints[group_key], individual_si.name)
+
+            # Add to consolidated workbook
+            consolidated_sink.write(rendered)
+            if export_sink is not None:
+                export_sink.add(group_key, grouped_data[group_key], individual_si.name)
+
+            si_count += 1
+            log.info(f"   ✅ Created SI for group: {group_key}")
+
+        except Exception as e:
+            log.warning(f"   ⚠️ Skipped group {group_key}: {str(e)}")
+            continue
+
+    # Save consolidated workbook - 使用完整文件名
+    if si_count > 0:
+        result_files.extend(consolidated_sink.close())
+        for shard in consolidated_sink.shards:
+            log.info(
+                f"🗂️ {file_name}: {shard.output_file.name}: {shard.sheets} sheet(s), "
+                f"{shard.output_file.size / 1024:,.0f} KB in {shard.seconds:.2f}s"
+            )
+        guard.check("saving the consolidated workbook")
+        if export_sink is not None:
+            with tracer.stage("data_export"):
+                export_files = export_sink.close(output, consolidated_sink.shards)
+            result_files.extend(export_files)
+            log.info(
+                f"🧾 {file_name}: Exported {export_sink.row_count} rows of {len(export_sink)} groups to "
+                f"{', '.join(output_file.name for output_file in export_files)}"
+            )
+
+    if options.memory_limit_mb:
+        log.info(f"📊 {file_name}: Peak memory {guard.peak_mb:.0f} MB of {options.memory_limit_mb} MB")
+
+    if manifest is not None:
+        _finish_incremental(manifest, new_manifest, result_files, file_name, log)
+
+    return result_files
+
+
+def _finish_incremental(manifest, new_manifest, result_files, file_name, log):
+    """Delete SI files of groups that are gone and store the new manifest"""
+    kept = sum(1 for key, entry in new_manifest.groups.items() if manifest.groups.get(key) == entry)
+    current_files = {output_file.name for output_file in result_files}
+    removed = 0
+    for key, (_, filename) in manifest.groups.items():
+        if key not in new_manifest.groups and filename not in current_files:
+            try:
+                os.remove(os.path.join(manifest.folder, filename))
+                removed += 1
+            except OSError:
+                pass
+    new_manifest.save()
+    log.info(
+        f"♻️ {file_name}: {kept} unchanged group(s) kept, "
+        f"{len(new_manifest.groups) - kept} regenerated, {removed} stale file(s) removed"
+    )
+
+
+def check_required_sheets(sheetnames):
+    if ORDER_SHEET_NAME not in sheetnames:
+        raise Exception(f"'{ORDER_SHEET_NAME}' sheet not found")
+
+    if TEMPLATE_SHEET_NAME not in sheetnames:
+        raise Exception(f"'{TEMPLATE_SHEET_NAME}' sheet not found")
+
+
+_EMPTY_WORKSHEET = (
+    b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+    b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    b'<sheetData/></worksheet>'
+)
+
+
+def load_template_workbook(source):
+    """Load the workbook with styles, but with 'No SI Order' emptied out.
+
+    The order sheet is already covered by :func:`read_order_sheet`, so its
+    worksheet part is swapped for an empty one before openpyxl sees it. Only
+    'SI Template' (and any other small sheets) get the full object model.
+    """
+    if hasattr(source, 'seek'):
+        source.seek(0)
+
+    trimmed = BytesIO()
+    with zipfile.ZipFile(source) as archive:
+        order_part = _find_sheet_part(archive, ORDER_SHEET_NAME)
+        order_rels = None
+        if order_part:
+            folder, name = posixpath.split(order_part)
+            order_rels = posixpath.join(folder, '_rels', name + '.rels')
+
+        # 临时包只在内存里用一次，不必再压缩
+        with zipfile.ZipFile(trimmed, 'w', zipfile.ZIP_STORED) as target:
+            for info in archive.infolist():
+                if info.filename == order_rels:
+                    continue
+                if info.filename == order_part:
+                    target.writestr(info.filename, _EMPTY_WORKSHEET)
+                else:
+                    target.writestr(info.filename, archive.read(info.filename))
+
+    trimmed.seek(0)
+    return load_workbook(trimmed, data_only=True)
+
+
+_NS_MAIN = '{http://schemas.openxmlformats.org/spreadsheetml/2006/main}'
+_NS_REL = '{http://schemas.openxmlformats.org/officeDocument/2006/relationships}'
+_NS_PKG_REL = '{http://schemas.openxmlformats.org/package/2006/relationships}'
+
+
+def _find_sheet_part(archive, sheet_name):
+    """Return the zip member path of worksheet ``sheet_name`` (or None)"""
+    workbook_xml = ElementTree.fromstring(archive.read('xl/workbook.xml'))
+    rel_id = None
+    for sheet in workbook_xml.iter(f'{_NS_MAIN}sheet'):
+        if sheet.get('name') == sheet_name:
+            rel_id = sheet.get(f'{_NS_REL}id')
+            break
+    if rel_id is None:
+        return None
+
+    rels_xml = ElementTree.fromstring(archive.read('xl/_rels/workbook.xml.rels'))
+    for rel in rels_xml.iter(f'{_NS_PKG_REL}Relationship'):
+        if rel.get('Id') == rel_id:
+            target = rel.get('Target')
+            if target.startswith('/'):
+                return target.lstrip('/')
+            return posixpath.normpath(posixpath.join('xl', target))
+    return None
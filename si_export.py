@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/19 10:40
+# @Author  : Healer
+# @File    : si_export.py
+# @Software: PyCharm
+
+"""Machine-readable copies of the grouped SI data.
+
+The export reads the same columnar OrderData the SIs are rendered from, one
+group at a time as the groups are written, so downstream systems get the
+header fields and table rows without parsing any xlsx. Every export comes
+with a manifest that maps each group to its SI file and consolidated sheet.
+
+The columnar export is Parquet when pyarrow is installed and a column-wise
+JSON document otherwise. pyarrow is imported on first use to keep
+:mod:`si_engine` cheap to import.
+"""
+
+import csv
+import datetime
+import decimal
+import io
+import json
+import math
+import os
+from contextlib import contextmanager
+
+EXPORT_FORMATS = ("csv", "jsonl", "columnar")
+
+# 清单结构发生变化时递增
+MANIFEST_VERSION = 1
+
+# 导出数据中附加在订单字段前面的列
+GROUP_FIELD = "Group"
+SI_FILE_FIELD = "SI File"
+SOURCE_ROW_FIELD = "Source Row"
+
+
+def _import_pyarrow():
+    """The pyarrow module (with pyarrow.parquet loaded), or None when it is not installed"""
+    try:
+        import pyarrow
+        import pyarrow.parquet
+    except ImportError:
+        return None
+    return pyarrow
+
+
+def export_filenames(original_filename, formats):
+    """``{format: file name}`` of the exports of ``original_filename``"""
+    file_base_name = os.path.splitext(original_filename)[0]
+    suffixes = {"csv": ".csv", "jsonl": ".jsonl"}
+    if "columnar" in formats:
+        suffixes["columnar"] = ".parquet" if _import_pyarrow() is not None else ".columns.json"
+    return {export_format: f"SI_Data_{file_base_name}{suffixes[export_format]}" for export_format in formats}
+
+
+def manifest_filename(original_filename):
+    return f"SI_Manifest_{os.path.splitext(original_filename)[0]}.json"
+
+
+def _json_value(value):
+    """JSON-compatible form of one cell value"""
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    if isinstance(value, decimal.Decimal):
+        return str(value)
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, (str, int, float, bool)) or value is None:
+        return value
+    return str(value)
+
+
+def _csv_value(value):
+    if value is None:
+        return ''
+    if isinstance(value, (datetime.date, datetime.time)):
+        return value.isoformat()
+    return value
+
+
+def _arrow_values(values):
+    # pyarrow 要求一列只有一种类型（整数和小数可以混合），其他混合类型的列按文本输出
+    types = {type(value) for value in values if value is not None}
+    if len(types) <= 1 or types == {int, float}:
+        return values
+    return [str(_csv_value(value)) if value is not None else None for value in values]
+
+
+class DataExportSink:
+    """Collects the rows of every written group and saves the exports.
+
+    ``order_data`` is the OrderData the groups come from; ``formats`` a
+    subset of EXPORT_FORMATS. Call :meth:`add` for each group that got its
+    SI and :meth:`close` once at the end.
+    """
+
+    def __init__(self, order_data, original_filename, formats, grouping=None):
+        self.order_data = order_data
+        self.original_filename = original_filename
+        self.formats = list(formats)
+        self.grouping = grouping
+        plan = order_data.plan
+        self.header_fields = [(name, source_col) for name, _, source_col in plan.header_fields]
+        self.table_fields = [(name, source_col) for name, _, source_col in plan.table_fields]
+        self.fields = (
+            [GROUP_FIELD, SI_FILE_FIELD, SOURCE_ROW_FIELD]
+            + [name for name, _ in self.header_fields + self.table_fields]
+        )
+        # 按列收集，每行对应一个表格行；表头字段在组内重复
+        self.columns = {field: [] for field in self.fields}
+        self.groups = []
+
+    def add(self, key, positions, si_file):
+        """Record the group ``key`` made of the order rows at ``positions``"""
+        columns = self.order_data.columns
+        row_count = len(positions)
+        self.columns[GROUP_FIELD].extend([key] * row_count)
+        self.columns[SI_FILE_FIELD].extend([si_file] * row_count)
+        self.columns[SOURCE_ROW_FIELD].extend(self.order_data.row_numbers[pos] for pos in positions)
+        header = {}
+        for name, source_col in self.header_fields:
+            value = columns[source_col][positions[0]] if source_col else None
+            header[name] = value
+            self.columns[name].extend([value] * row_count)
+        for name, source_col in self.table_fields:
+            if source_col:
+                column = columns[source_col]
+                self.columns[name].extend(column[pos] for pos in positions)
+            else:
+                self.columns[name].extend([None] * row_count)
+        self.groups.append({"group": key, "si_file": si_file, "header": header, "rows": row_count})
+
+    def __len__(self):
+        return len(self.groups)
+
+    @property
+    def row_count(self):
+        return len(self.columns[GROUP_FIELD])
+
+    def close(self, output, consolidated_shards=()):
+        """Save every export and the manifest to ``output``; returns the OutputFiles"""
+        filenames = export_filenames(self.original_filename, self.formats)
+        writers = {"csv": self._write_csv, "jsonl": self._write_jsonl, "columnar": self._write_columnar}
+        output_files = [
+            output.save(filenames[export_format], writers[export_format])
+            for export_format in self.formats
+        ]
+        manifest = self.manifest(output_files, consolidated_shards)
+        output_files.append(output.save(
+            manifest_filename(self.original_filename),
+            lambda destination: _write_bytes(
+                destination, json.dumps(manifest, ensure_ascii=False, indent=2, default=_json_value).encode('utf-8')
+            )
+        ))
+        return output_files
+
+    def manifest(self, export_files, consolidated_shards=()):
+        """Index of the exports: every SI file with its group and consolidated sheet"""
+        sheets = {}
+        for shard in consolidated_shards:
+            for key, title in shard.groups:
+                sheets[key] = (shard.output_file.name, title)
+        start = 0
+        groups = []
+        for group in self.groups:
+            consolidated_file, sheet = sheets.get(group["group"], (None, None))
+            source_rows = self.columns[SOURCE_ROW_FIELD][start:start + group["rows"]]
+            start += group["rows"]
+            groups.append({
+                "group": group["group"],
+                "si_file": group["si_file"],
+                "consolidated_file": consolidated_file,
+                "consolidated_sheet": sheet,
+                "rows": group["rows"],
+                "source_rows": source_rows,
+            })
+        return {
+            "manifest_version": MANIFEST_VERSION,
+            "source": self.original_filename,
+            "grouping": self.grouping,
+            "fields": {
+                "header": [name for name, _ in self.header_fields],
+                "table": [name for name, _ in self.table_fields],
+            },
+            "exports": [
+                {"format": export_format, "file": output_file.name, "rows": self.row_count}
+                for export_format, output_file in zip(self.formats, export_files)
+            ],
+            "consolidated": [
+                {"file": shard.output_file.name, "sheets": shard.sheets} for shard in consolidated_shards
+            ],
+            "groups": groups,
+        }
+
+    def _rows(self):
+        return zip(*(self.columns[field] for field in self.fields))
+
+    def _write_csv(self, destination):
+        with _open_binary(destination) as f:
+            text = io.TextIOWrapper(f, encoding='utf-8', newline='')
+            writer = csv.writer(text)
+            writer.writerow(self.fields)
+            for row in self._rows():
+                writer.writerow([_csv_value(value) for value in row])
+            # 交还底层文件，由调用方关闭（内存输出还要读取内容）
+            text.detach()
+
+    def _write_jsonl(self, destination):
+        """One line per group: its header fields and its table rows"""
+        table_names = [name for name, _ in self.table_fields]
+        table_columns = [self.columns[name] for name in table_names]
+        source_rows = self.columns[SOURCE_ROW_FIELD]
+        start = 0
+        with _open_binary(destination) as f:
+            for group in self.groups:
+                rows = []
+                for index in range(start, start + group["rows"]):
+                    row = {name: column[index] for name, column in zip(table_names, table_columns)}
+                    row[SOURCE_ROW_FIELD] = source_rows[index]
+                    rows.append(row)
+                start += group["rows"]
+                line = {"group": group["group"], "si_file": group["si_file"], "header": group["header"], "rows": rows}
+                f.write(json.dumps(line, ensure_ascii=False, default=_json_value).encode('utf-8'))
+                f.write(b'\n')
+
+    def _write_columnar(self, destination):
+        pyarrow = _import_pyarrow()
+        if pyarrow is not None:
+            table = pyarrow.table({field: _arrow_values(self.columns[field]) for field in self.fields})
+            pyarrow.parquet.write_table(table, destination)
+            return
+        document = {
+            "row_count": self.row_count,
+            "fields": self.fields,
+            "columns": {field: [_json_value(value) for value in self.columns[field]] for field in self.fields},
+        }
+        _write_bytes(destination, json.dumps(document, ensure_ascii=False).encode('utf-8'))
+
+
+@contextmanager
+def _open_binary(destination):
+    """Binary file of ``destination``: a path to create, or a file object that stays open"""
+    if isinstance(destination, str):
+        with open(destination, 'wb') as f:
+            yield f
+    else:
+        yield destination
+
+
+def _write_bytes(destination, data):
+    with _open_binary(destination) as f:
+        f.write(data)
@@ -0,0 +1,273 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 23:05
+# @Author  : Healer
+# @File    : si_grouping.py
+# @Software: PyCharm
+
+"""Grouping order rows into SIs, vectorized over the columnar order data.
+
+Each key column is factorized once with pandas, so normalization runs per
+distinct value instead of per row. Rows are then ordered with one stable
+``lexsort`` and cut into contiguous groups, which keeps the cost flat no
+matter how uneven the group sizes are.
+
+pandas / numpy are imported on first use to keep :mod:`si_engine` cheap to
+import.
+"""
+
+import datetime
+import decimal
+import math
+import re
+
+from openpyxl.utils import column_index_from_string
+
+KEY_CASES = ("keep", "upper", "lower")
+GROUP_ORDERS = ("first", "key", "size")
+
+# 组合键各部分之间的分隔符
+KEY_SEPARATOR = " - "
+
+_COLUMN_LETTERS_RE = re.compile(r'[A-Za-z]{1,3}')
+_NUMBER_TEXT_RE = re.compile(r'[+-]?(0|[1-9]\d*)(\.\d+)?')
+_DIGITS_RE = re.compile(r'(\d+)')
+_NUMBER_TYPES = {bool, int, float, decimal.Decimal}
+
+
+def resolve_column(header_index, ref):
+    """Column index of ``ref``: a header name first, else a column letter.
+
+    Returns None when ``ref`` is neither.
+    """
+    if isinstance(ref, int):
+        return ref
+    col_idx = header_index.get(ref) if header_index is not None else None
+    if col_idx:
+        return col_idx
+    if _COLUMN_LETTERS_RE.fullmatch(ref.strip()):
+        return column_index_from_string(ref.strip().upper())
+    return None
+
+
+class GroupSpec:
+    """Which columns form the group key and how keys and rows are ordered.
+
+    ``columns`` and ``row_order`` hold header names or column letters.
+    ``case`` is one of KEY_CASES; ``collapse_spaces`` squeezes inner
+    whitespace; ``numbers`` writes numeric keys canonically (1001.0 and
+    "1001" both become "1001"). ``group_order`` is one of GROUP_ORDERS:
+    first appearance, natural key order or largest group first.
+    """
+
+    def __init__(self, columns=("O",), case="keep", collapse_spaces=False, numbers=False, group_order="first",
+                 descending=False, row_order=(), row_descending=False):
+        if isinstance(columns, str):
+            columns = [columns]
+        if not columns:
+            raise ValueError("At least one group column is required")
+        if case not in KEY_CASES:
+            raise ValueError(f"Unknown key case: {case}")
+        if group_order not in GROUP_ORDERS:
+            raise ValueError(f"Unknown group order: {group_order}")
+        self.columns = list(columns)
+        self.case = case
+        self.collapse_spaces = collapse_spaces
+        self.numbers = numbers
+        self.group_order = group_order
+        self.descending = descending
+        self.row_order = [row_order] if isinstance(row_order, str) else list(row_order)
+        self.row_descending = row_descending
+
+    @property
+    def refs(self):
+        """Every column the grouping reads"""
+        return self.columns + [ref for ref in self.row_order if ref not in self.columns]
+
+    @property
+    def label(self):
+        return " + ".join(self.columns)
+
+    def to_dict(self):
+        return dict(vars(self))
+
+    def resolve(self, header_index, refs):
+        columns = []
+        for ref in refs:
+            col_idx = resolve_column(header_index, ref)
+            if col_idx is None:
+                raise Exception(f"Column '{ref}' is neither a header nor a column letter")
+            columns.append(col_idx)
+        return columns
+
+    def normalize(self, value):
+        """Key text of one cell value; '' means the row has no key"""
+        # 与原分组逻辑一致：空值、0 和 False 都不成组
+        if not value or (isinstance(value, float) and math.isnan(value)):
+            return ''
+        if self.numbers:
+            text = _number_text(value)
+            if text is not None:
+                return text
+        text = str(value).strip()
+        if self.collapse_spaces:
+            text = ' '.join(text.split())
+        if self.case == "upper":
+            text = text.upper()
+        elif self.case == "lower":
+            text = text.lower()
+        return text
+
+
+def _number_text(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, str):
+        text = value.strip().replace(',', '')
+        if not _NUMBER_TEXT_RE.fullmatch(text):
+            return None
+        value = decimal.Decimal(text)
+    if isinstance(value, float) and not math.isfinite(value):
+        return None
+    if isinstance(value, (int, float, decimal.Decimal)):
+        if value == int(value):
+            return str(int(value))
+        return format(float(value), '.15g')
+    return None
+
+
+def natural_key(text):
+    """Sort key that orders "G2" before "G10\""""
+    return [(0, int(part)) if part.isdigit() else (1, part.lower()) for part in _DIGITS_RE.split(text) if part]
+
+
+def _sort_value(value):
+    # 数字、日期、文本分开比较，避免不同类型之间比较出错
+    if isinstance(value, (bool, int, float, decimal.Decimal)):
+        return 0, float(value), ''
+    if isinstance(value, (datetime.date, datetime.time)):
+        return 1, 0.0, value.isoformat()
+    return 2, 0.0, str(value)
+
+
+def group_rows(order_data, spec):
+    """Group the positions of ``order_data`` by ``spec``.
+
+    Returns ``{key: [position, ...]}`` in group order; positions follow the
+    row order (sheet order unless ``spec.row_order`` says otherwise).
+    """
+    import numpy as np
+    import pandas as pd
+
+    header_index = order_data.header_index
+    row_count = len(order_data)
+    if row_count == 0:
+        return {}
+
+    # 每列先按原始值编码，只对不同的取值做规范化
+    combined = np.zeros(row_count, dtype=np.int64)
+    has_key = np.zeros(row_count, dtype=bool)
+    parts = []
+    for col_idx in spec.resolve(header_index, spec.columns):
+        codes, uniques = _factorize(order_data.column(col_idx))
+        label_ids = {'': 0}
+        # 末尾一项对应空值的编码 -1
+        remap = np.array(
+            [label_ids.setdefault(spec.normalize(value), len(label_ids)) for value in uniques] + [0],
+            dtype=np.int64
+        )
+        part = remap[codes]
+        has_key |= part != 0
+        parts.append((part, list(label_ids)))
+        # 重新编码（按首次出现编号），多列组合时不会溢出
+        combined = pd.factorize(combined * len(label_ids) + part)[0]
+
+    positions = np.flatnonzero(has_key)
+    if positions.size == 0:
+        return {}
+
+    # 按完整的组合（空白部分保留在原位置）分组，编号按首次出现
+    group_ids, _ = pd.factorize(combined[positions])
+    sample_rows = np.empty(group_ids.max() + 1, dtype=np.int64)
+    sample_rows[group_ids] = positions
+    unique_keys = _display_keys([
+        [labels[part[row]] for part, labels in parts] for row in sample_rows
+    ])
+    group_rank = _group_ranks(spec, unique_keys, np.bincount(group_ids, minlength=len(unique_keys)))
+
+    # 组内排序键在前，组序号最后（lexsort 以最后一个键为主键，且是稳定排序）
+    sort_keys = [
+        _row_ranks(order_data.column(col_idx), positions, spec.row_descending)
+        for col_idx in reversed(spec.resolve(header_index, spec.row_order))
+    ]
+    sort_keys.append(group_rank[group_ids])
+    order = np.lexsort(sort_keys)
+    ordered_groups = group_ids[order]
+    ordered_positions = positions[order]
+
+    bounds = np.flatnonzero(np.diff(ordered_groups)) + 1
+    grouped_data = {}
+    for start, segment in zip(np.concatenate(([0], bounds)), np.split(ordered_positions, bounds)):
+        grouped_data[unique_keys[ordered_groups[start]]] = segment.tolist()
+    return grouped_data
+
+
+def _display_keys(key_parts):
+    """Key text of each group; groups whose joined parts read the same get a " (2)", " (3)" suffix"""
+    keys = []
+    used = set()
+    for parts in key_parts:
+        key = base = KEY_SEPARATOR.join(label for label in parts if label)
+        number = 1
+        # 不同组合拼出相同文本时不能合并成一个 SI
+        while key in used:
+            number += 1
+            key = f"{base} ({number})"
+        used.add(key)
+        keys.append(key)
+    return keys
+
+
+def _factorize(values):
+    """``pd.factorize`` that keeps True, 1 and 1.0 apart like ``str()`` does"""
+    import numpy as np
+    import pandas as pd
+
+    codes, uniques = pd.factorize(np.array(values, dtype=object))
+    # 相等但类型不同的数字会被合成一个编码，同时出现多种数字类型时才按类型区分
+    if len(set(map(type, values)) & _NUMBER_TYPES) > 1:
+        tagged = np.empty(len(values), dtype=object)
+        tagged[:] = [(type(value), value) for value in values]
+        codes, tagged_uniques = pd.factorize(tagged)
+        uniques = [value for _, value in tagged_uniques]
+    return codes, uniques
+
+
+def _group_ranks(spec, keys, sizes):
+    """Rank of each group (by first appearance id) in the output order"""
+    import numpy as np
+
+    if spec.group_order == "key":
+        order = sorted(range(len(keys)), key=lambda group: natural_key(keys[group]))
+    elif spec.group_order == "size":
+        order = np.argsort(-sizes, kind='stable').tolist()
+    else:
+        order = list(range(len(keys)))
+    if spec.descending:
+        order.reverse()
+    ranks = np.empty(len(keys), dtype=np.int64)
+    ranks[order] = np.arange(len(keys))
+    return ranks
+
+
+def _row_ranks(values, positions, descending):
+    """Sort rank of the rows at ``positions`` by ``values``; blanks go last"""
+    import numpy as np
+    import pandas as pd
+
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object).iloc[positions])
+    order = sorted(range(len(uniques)), key=lambda index: _sort_value(uniques[index]), reverse=descending)
+    ranks = np.empty(len(uniques) + 1, dtype=np.int64)
+    ranks[order] = np.arange(len(uniques))
+    ranks[-1] = len(uniques)
+    return ranks[codes]
@@ -0,0 +1,335 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 20:40
+# @Author  : Healer
+# @File    : si_jobs.py
+# @Software: PyCharm
+
+"""Background SI jobs with durable state on the local filesystem.
+
+A job is a folder under the jobs directory::
+
+    <job id>/job.json          state, options and per-file progress
+    <job id>/inputs/           the uploaded workbooks
+    <job id>/outputs/          SI_Output_<name> folders, filled file by file
+    <job id>/result.zip        all SI files, once the job is finished
+    <job id>/claim             lease of the runner executing the job
+
+The folder is the queue: a :class:`JobRunner` in any process claims queued
+jobs by creating ``claim`` exclusively, so no broker is needed and a job
+outlives the page or request that submitted it.
+
+A claim is a lease: while a job runs, its runner touches ``claim`` every
+few seconds. A claim that has not been touched for ``lease_seconds`` belongs
+to a runner that died (or a container that restarted), and any runner puts
+the job back in the queue. Process ids are not used for this, since they
+are reused across restarts.
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+
+from si_batch import FileJob, run_batch
+from si_cache import ResultCache
+from si_engine import OutputFile, SIOptions, output_folder_name
+from si_package import ZipPackager
+from si_upload import Upload
+
+DEFAULT_JOBS_DIR = os.path.join(tempfile.gettempdir(), "si_jobs")
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_DONE = "done"
+JOB_FAILED = "failed"
+
+# 已结束的任务保留一天
+JOB_TTL_SECONDS = 24 * 3600
+
+# claim 超过该时间未更新即视为执行者已退出
+JOB_LEASE_SECONDS = 60
+
+
+class JobStore:
+    """Jobs kept as folders under ``directory``; claims expire after ``lease_seconds`` without a heartbeat"""
+
+    def __init__(self, directory=DEFAULT_JOBS_DIR, lease_seconds=JOB_LEASE_SECONDS):
+        self.directory = directory
+        self.lease_seconds = lease_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, job_id, *parts):
+        if not job_id or os.sep in job_id or job_id.startswith('.'):
+            raise KeyError(job_id)
+        return os.path.join(self.directory, job_id, *parts)
+
+    def submit(self, uploads, options):
+        """Queue ``uploads`` (``(name, bytes or Upload)`` pairs) and return the job id"""
+        job_id = f"{time.strftime('%Y%m%d%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        inputs = self._path(job_id, "inputs")
+        os.makedirs(inputs)
+
+        files = []
+        for index, (name, data) in enumerate(uploads):
+            # 序号前缀保证同名上传互不覆盖
+            stored = f"{index:04d}_{os.path.basename(name)}"
+            if not isinstance(data, Upload):
+                data = Upload(name, data=data)
+            data.save_as(os.path.join(inputs, stored))
+            files.append({"name": name, "input": stored, "status": JOB_QUEUED, "error": None, "files": [], "log": []})
+
+        self._save(job_id, {
+            "id": job_id,
+            "status": JOB_QUEUED,
+            "created": time.time(),
+            "started": None,
+            "finished": None,
+            "error": None,
+            # SIOptions 的属性与构造参数一一对应
+            "options": dict(vars(options)),
+            "files": files,
+        })
+        return job_id
+
+    def status(self, job_id):
+        """State dict of ``job_id``; raises KeyError for unknown jobs"""
+        try:
+            with open(self._path(job_id, "job.json"), encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            raise KeyError(job_id)
+
+    def _save(self, job_id, state):
+        path = self._path(job_id, "job.json")
+        temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False)
+        os.replace(temp_path, path)
+
+    def job_ids(self):
+        # 任务 ID 以时间开头，按名称排序即按提交顺序
+        return sorted(name for name in os.listdir(self.directory) if not name.startswith('.'))
+
+    def result_path(self, job_id):
+        """Path of the finished job's ZIP, or None while it is not done"""
+        path = self._path(job_id, "result.zip")
+        return path if os.path.exists(path) else None
+
+    def claim(self, job_id):
+        """Atomically take ``job_id`` for this process; False if already taken"""
+        try:
+            fd = os.open(self._path(job_id, "claim"), os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as f:
+            # 仅供排查问题，租约是否有效只看修改时间
+            f.write(str(os.getpid()))
+        return True
+
+    def claim_next(self):
+        for job_id in self.job_ids():
+            try:
+                queued = self.status(job_id)["status"] == JOB_QUEUED
+            except KeyError:
+                continue
+            if queued and self.claim(job_id):
+                return job_id
+        return None
+
+    def recover(self):
+        """Requeue jobs whose lease has expired"""
+        expired_before = time.time() - self.lease_seconds
+        for job_id in self.job_ids():
+            claim_path = self._path(job_id, "claim")
+            try:
+                if os.path.getmtime(claim_path) >= expired_before:
+                    continue
+                # 先把过期的 claim 改名占为己有，避免多个执行者同时恢复同一任务
+                stale_path = f"{claim_path}.{uuid.uuid4().hex}.stale"
+                os.rename(claim_path, stale_path)
+            except OSError:
+                continue
+            if os.path.getmtime(stale_path) >= expired_before:
+                # 改名前已被重新领取，归还新的 claim
+                os.replace(stale_path, claim_path)
+                continue
+            try:
+                state = self.status(job_id)
+            except KeyError:
+                os.remove(stale_path)
+                continue
+            if state["status"] in (JOB_QUEUED, JOB_RUNNING):
+                state["status"] = JOB_QUEUED
+                for entry in state["files"]:
+                    if entry["status"] == JOB_RUNNING:
+                        entry["status"] = JOB_QUEUED
+                self._save(job_id, state)
+            os.remove(stale_path)
+
+    def release(self, job_id):
+        """Give up the claim of a finished job"""
+        try:
+            os.remove(self._path(job_id, "claim"))
+        except OSError:
+            pass
+
+    def cleanup(self, max_age=JOB_TTL_SECONDS):
+        """Delete finished jobs older than ``max_age`` seconds"""
+        now = time.time()
+        for job_id in self.job_ids():
+            try:
+                state = self.status(job_id)
+            except KeyError:
+                continue
+            if state["status"] in (JOB_DONE, JOB_FAILED) and now - (state["finished"] or now) > max_age:
+                shutil.rmtree(self._path(job_id), ignore_errors=True)
+
+    def run(self, job_id):
+        """Execute a claimed job, saving progress after every file"""
+        try:
+            state = self.status(job_id)
+        except KeyError:
+            self.release(job_id)
+            return
+        with _Heartbeat(self._path(job_id, "claim"), self.lease_seconds / 4):
+            self._run(job_id, state)
+        self.release(job_id)
+
+    def _run(self, job_id, state):
+        try:
+            state["status"] = JOB_RUNNING
+            state["started"] = time.time()
+            self._save(job_id, state)
+
+            options = SIOptions(**state["options"])
+            cache = ResultCache(max_mb=options.cache_max_mb) if options.cache_max_mb else None
+            outputs = self._path(job_id, "outputs")
+            # 已完成的文件（例如进程重启前）不再处理
+            pending = [index for index, entry in enumerate(state["files"]) if entry["status"] in (JOB_QUEUED, JOB_RUNNING)]
+            jobs = []
+            for index in pending:
+                entry = state["files"][index]
+                entry["status"] = JOB_RUNNING
+                # 直接使用保存的输入文件，不读入内存
+                upload = Upload(entry["name"], path=self._path(job_id, "inputs", entry["input"]))
+                jobs.append(FileJob(entry["name"], upload, outputs))
+            self._save(job_id, state)
+
+            batch = run_batch(jobs, options, options.file_concurrency, options.memory_budget, cache=cache)
+            for position, result in batch:
+                entry = state["files"][pending[position]]
+                entry["status"] = JOB_FAILED if result.error else JOB_DONE
+                entry["error"] = result.error
+                entry["files"] = [output_file.name for output_file in result.result_files]
+                entry["log"] = [list(record) for record in result.log_records]
+                jobs[position].release()
+                self._save(job_id, state)
+
+            result_path = self._path(job_id, "result.zip")
+            with open(result_path + ".tmp", 'wb') as f:
+                self.write_archive(job_id, f, state, options.archive_compresslevel)
+            os.replace(result_path + ".tmp", result_path)
+            succeeded = any(entry["status"] == JOB_DONE for entry in state["files"])
+            state["status"] = JOB_DONE if succeeded else JOB_FAILED
+            if not succeeded:
+                state["error"] = "No files were successfully processed."
+        except Exception as e:
+            state["status"] = JOB_FAILED
+            state["error"] = str(e)
+        state["finished"] = time.time()
+        self._save(job_id, state)
+
+    def write_archive(self, job_id, fileobj, state=None, compresslevel=None):
+        """Write the SI files of every finished file of the job as a ZIP.
+
+        Works while the job is still running, for partial results.
+        """
+        state = state or self.status(job_id)
+        packager = ZipPackager(compresslevel, fileobj=fileobj)
+        for entry in state["files"]:
+            if entry["status"] != JOB_DONE:
+                continue
+            folder = self._path(job_id, "outputs", output_folder_name(entry["name"]))
+            for name in entry["files"]:
+                path = os.path.join(folder, name)
+                if os.path.exists(path):
+                    packager.add(OutputFile(name, path=path))
+        packager.close()
+
+
+def job_progress(state):
+    """``(finished files, total files)`` of a job state"""
+    finished = sum(1 for entry in state["files"] if entry["status"] in (JOB_DONE, JOB_FAILED))
+    return finished, len(state["files"])
+
+
+class _Heartbeat:
+    """Touches the claim file at ``path`` every ``interval`` seconds to keep its lease"""
+
+    def __init__(self, path, interval):
+        self.path = path
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = None
+
+    def __enter__(self):
+        self._thread = threading.Thread(target=self._loop, name="si-job-heartbeat", daemon=True)
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            try:
+                os.utime(self.path)
+            except OSError:
+                pass
+
+
+class JobRunner:
+    """Daemon threads that execute the queued jobs of a JobStore"""
+
+    def __init__(self, store, threads=1, poll_interval=2.0):
+        self.store = store
+        self.threads = threads
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._workers = []
+
+    def start(self):
+        if self._workers:
+            return self
+        self.store.recover()
+        self.store.cleanup()
+        for number in range(self.threads):
+            worker = threading.Thread(target=self._loop, name=f"si-job-runner-{number}", daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        return self
+
+    def wake(self):
+        """Look for queued jobs now instead of at the next poll"""
+        self._wake.set()
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def _loop(self):
+        while not self._stop.is_set():
+            job_id = self.store.claim_next()
+            if job_id is None:
+                # 空闲时接管租约过期的任务，不必等到重启
+                self.store.recover()
+                self._wake.wait(self.poll_interval)
+                self._wake.clear()
+                continue
+            self.store.run(job_id)
@@ -0,0 +1,140 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 17:20
+# @Author  : Healer
+# @File    : si_package.py
+# @Software: PyCharm
+
+"""Packaging generated SI files into the download ZIP."""
+
+import os
+import shutil
+import tempfile
+import zipfile
+
+from si_engine import MemoryOutput, OutputFile
+
+# 归档超过这个大小后转存到临时文件，避免整个 ZIP 常驻内存
+SPOOL_MAX_SIZE = 64 * 1024 * 1024
+
+# 这些格式本身就是压缩包，再压缩一次只浪费 CPU
+PRECOMPRESSED_SUFFIXES = ('.xlsx', '.xlsm', '.zip', '.parquet')
+
+
+class ZipPackager:
+    """Streams OutputFiles into a ZIP archive as soon as they are produced.
+
+    Already-compressed members (xlsx, ...) are stored as-is unless
+    ``compresslevel`` is given, in which case every member is deflated at
+    that level. The packager also works as an output for
+    :func:`si_engine.process_workbook`, so SI files go straight into the
+    archive instead of being collected first; use :meth:`stage` for the
+    files of one workbook, so a workbook that fails halfway leaves nothing
+    in the archive.
+    """
+
+    # 打开的归档不能交给其他进程
+    process_safe = False
+
+    def __init__(self, compresslevel=None, fileobj=None):
+        self.compresslevel = compresslevel
+        self.fileobj = fileobj if fileobj is not None else tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        self.zip_file = zipfile.ZipFile(self.fileobj, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+        self.entry_count = 0
+
+    def _policy(self, name):
+        if self.compresslevel is None and name.lower().endswith(PRECOMPRESSED_SUFFIXES):
+            return zipfile.ZIP_STORED, None
+        return zipfile.ZIP_DEFLATED, self.compresslevel
+
+    def save(self, filename, write):
+        """Output interface: let ``write`` produce the file, then archive it"""
+        return self.add(MemoryOutput().save(filename, write))
+
+    def add(self, output_file):
+        compress_type, compresslevel = self._policy(output_file.name)
+        if output_file.data is not None:
+            self.zip_file.writestr(output_file.name, output_file.data, compress_type, compresslevel)
+        else:
+            self.zip_file.write(output_file.path, output_file.name, compress_type, compresslevel)
+        self.entry_count += 1
+        # 内容已写入归档，不再保留一份
+        return OutputFile(output_file.name, size=output_file.size)
+
+    def stage(self):
+        """Output that holds files until :meth:`StagedFiles.commit` archives them"""
+        return StagedFiles(self)
+
+    def close(self):
+        self.zip_file.close()
+
+    def getvalue(self):
+        """Close the archive and return its bytes"""
+        self.close()
+        self.fileobj.seek(0)
+        return self.fileobj.read()
+
+
+class StagedFiles:
+    """The files of one workbook on their way into a ZipPackager.
+
+    Files are kept in a temporary folder (not in memory) until the workbook
+    has succeeded; :meth:`commit` then archives them in the order they were
+    produced, :meth:`discard` drops them.
+    """
+
+    process_safe = False
+
+    def __init__(self, packager):
+        self.packager = packager
+        self.folder = tempfile.mkdtemp(prefix='si_stage_')
+        self.files = []
+
+    def save(self, filename, write):
+        path = os.path.join(self.folder, f"{len(self.files):05d}_{filename}")
+        write(path)
+        return self.add(OutputFile(filename, path=path))
+
+    def add(self, output_file):
+        if output_file.data is not None:
+            # 内存中的文件（例如经过缓存的）也转存到暂存目录
+            data = output_file.data
+            return self.save(output_file.name, lambda path: _write_bytes(path, data))
+        self.files.append(output_file)
+        return output_file
+
+    def commit(self):
+        """Archive the staged files; returns ``{name: archived OutputFile}``"""
+        try:
+            return {output_file.name: self.packager.add(output_file) for output_file in self.files}
+        finally:
+            self.discard()
+
+    def discard(self):
+        self.files = []
+        shutil.rmtree(self.folder, ignore_errors=True)
+
+
+def _write_bytes(path, data):
+    with open(path, 'wb') as f:
+        f.write(data)
+
+
+class OrderedArchiver:
+    """Adds the files of batch results to a ZipPackager in job order.
+
+    Results arrive in completion order; each one is archived as soon as all
+    earlier jobs are done, so the archive layout does not depend on timing.
+    """
+
+    def __init__(self, packager):
+        self.packager = packager
+        self._waiting = {}
+        self._next_index = 0
+
+    def add(self, index, output_files):
+        self._waiting[index] = output_files
+        while self._next_index in self._waiting:
+            for output_file in self._waiting.pop(self._next_index):
+                self.packager.add(output_file)
+            self._next_index += 1
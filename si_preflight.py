@@ -0,0 +1,433 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/19 00:10
+# @Author  : Healer
+# @File    : si_preflight.py
+# @Software: PyCharm
+
+"""Pre-flight check of uploads before any SI is generated.
+
+:func:`preflight` opens the package with ``zipfile`` only: it checks the
+required sheets, resolves the mapped headers from row 1 and streams the
+order sheet XML with ``iterparse``, decoding just the key columns, which is
+far cheaper than a full openpyxl read. The rows are grouped exactly like the
+real run, and a :class:`CostModel` turns the counts into an estimate of
+runtime and output size.
+
+Files that cannot produce any SI are rejected here, before the batch spends
+worker time on them. A rejection found by the fast scan is confirmed with
+the engine's own reader first, so pre-flight never turns away a file the
+real run would process.
+"""
+
+import json
+import zipfile
+from xml.etree import ElementTree
+
+from openpyxl import load_workbook
+from openpyxl.utils import column_index_from_string
+from openpyxl.utils.datetime import from_ISO8601
+
+from si_engine import (
+    CELL_MEMORY_ESTIMATE, ORDER_SHEET_NAME, TEMPLATE_SHEET_NAME, FieldPlan, HeaderIndex, OrderData, _find_sheet_part,
+    consolidated_sheet_name, create_safe_filename, read_order_sheet, si_filename
+)
+from si_grouping import GroupSpec, group_rows, resolve_column
+from si_upload import Upload
+
+# benchmarks/synthetic.py 生成的订单表列数，用于把每行耗时折算为每个单元格
+BENCHMARK_ORDER_COLUMNS = 17
+
+SHARED_STRINGS_PART = 'xl/sharedStrings.xml'
+
+# 快速扫描遇到这些错误时说明看不懂该 XML，改用 openpyxl 读取
+_SCAN_ERRORS = (ElementTree.ParseError, ValueError, KeyError, IndexError, TypeError, OverflowError)
+
+
+class CostModel:
+    """Per-unit costs for estimating runtime (seconds) and output size (bytes).
+
+    The defaults were measured with ``benchmarks/bench_pipeline.py``; use
+    :meth:`from_benchmark` to calibrate against a result of that script
+    from the machine that actually runs the batch.
+    """
+
+    def __init__(self, read_cell=22e-6, si_file=2.0e-3, si_row=40e-6, sheet=1.5e-3, sheet_row=0.4e-3,
+                 sheet_save=1.1e-3, si_file_bytes=5600, si_row_bytes=70, sheet_bytes=1450, sheet_row_bytes=52):
+        self.read_cell = read_cell
+        self.si_file = si_file
+        self.si_row = si_row
+        self.sheet = sheet
+        self.sheet_row = sheet_row
+        self.sheet_save = sheet_save
+        self.si_file_bytes = si_file_bytes
+        self.si_row_bytes = si_row_bytes
+        self.sheet_bytes = sheet_bytes
+        self.sheet_row_bytes = sheet_row_bytes
+
+    @classmethod
+    def from_benchmark(cls, path):
+        """Costs from a ``bench_pipeline.py`` result JSON"""
+        with open(path, encoding='utf-8') as f:
+            result = json.load(f)
+        stages = result["stages"]
+        rows = result["meta"]["rows"]
+        groups = result["meta"]["groups"]
+        rows_per_group = rows / groups if groups else 1
+
+        def per_item(name):
+            stage = stages[name]
+            return stage["seconds"] / stage["items"] if stage["items"] else 0.0
+
+        model = cls()
+        model.read_cell = per_item("load_order_sheet") / BENCHMARK_ORDER_COLUMNS
+        model.si_file = per_item("xml_render")
+        model.sheet_row = (per_item("consolidated_write") - model.sheet) / rows_per_group
+        model.sheet_save = per_item("consolidated_save") / groups if groups else model.sheet_save
+        return model
+
+    def estimate(self, cells, groups, rows):
+        """``(seconds, bytes)`` for reading ``cells`` order cells and writing
+        ``groups`` SIs with ``rows`` table rows in total"""
+        seconds = (
+            cells * self.read_cell
+            + groups * (self.si_file + self.sheet + self.sheet_save)
+            + rows * (self.si_row + self.sheet_row)
+        )
+        size = (
+            groups * (self.si_file_bytes + self.sheet_bytes)
+            + rows * (self.si_row_bytes + self.sheet_row_bytes)
+        )
+        return seconds, size
+
+
+DEFAULT_COST_MODEL = CostModel()
+
+
+class PreflightReport:
+    """What a workbook would produce, or why it cannot be processed"""
+
+    def __init__(self, name):
+        self.name = name
+        self.errors = []
+        self.warnings = []
+        # 缺少的表头由引擎处理时自行提示，这里只用于汇总表
+        self.missing_headers = []
+        self.rows = 0
+        self.width = 0
+        self.groups = 0
+        self.grouped_rows = 0
+        self.largest_group = 0
+        self.smallest_group = 0
+        self.estimated_seconds = 0.0
+        self.estimated_bytes = 0
+        self.estimated_memory = 0
+
+    @property
+    def ok(self):
+        return not self.errors
+
+    def log_records(self):
+        """LogBuffer-style records describing the report (errors are left
+        to the caller, which reports them as the file's failure)"""
+        records = [("warning", f"⚠️ {self.name}: {warning}") for warning in self.warnings]
+        if self.ok:
+            records.append(("info", (
+                f"🧭 {self.name}: {self.rows} rows, {self.groups} groups "
+                f"({self.smallest_group}-{self.largest_group} rows each), "
+                f"about {self.estimated_bytes / 1024 / 1024:.1f} MB in {self.estimated_seconds:.1f}s"
+            )))
+        return records
+
+    def to_dict(self):
+        return dict(vars(self))
+
+
+def preflight(data, file_name, options, cost_model=DEFAULT_COST_MODEL, parsed=None):
+    """Check the upload ``data`` (bytes or an Upload) against ``options`` and estimate its cost.
+
+    With ``parsed``, a ParsedWorkbook of ``data`` that holds the key columns,
+    its OrderData is grouped instead of reading the upload again.
+    """
+    if not isinstance(data, Upload):
+        data = Upload(file_name, data=data)
+    report = PreflightReport(file_name)
+    spec = GroupSpec(options.group_spec.columns, **{
+        # 只统计分组，组内排序不影响数量
+        key: value for key, value in options.group_spec.to_dict().items() if key not in ("columns", "row_order")
+    })
+    reuse_parsed = parsed is not None and parsed.order_data.has_columns(spec.columns)
+    try:
+        if reuse_parsed:
+            order_data = parsed.order_data
+            header_index, plan, grouped, rows, width, columns = _group_order_data(
+                order_data, spec, max(order_data.columns, default=0)
+            )
+        else:
+            header_index, plan, grouped, rows, width, columns = _group_scan(scan_order_sheet(data, spec.columns), spec)
+        if not grouped and not reuse_parsed:
+            # 快速扫描的结果会导致拒绝：先用引擎自己的读取方式确认，避免误拒
+            header_index, plan, grouped, rows, width, columns = _group_scan(
+                _scan_with_openpyxl(data, spec.columns), spec
+            )
+    except zipfile.BadZipFile:
+        report.errors.append("not a valid .xlsx file")
+        return report
+    except Exception as e:
+        report.errors.append(str(e))
+        return report
+
+    report.missing_headers = plan.missing_headers
+    if grouped is None:
+        for ref in spec.columns:
+            if resolve_column(header_index, ref) is None:
+                report.errors.append(f"group column '{ref}' is neither a header nor a column letter")
+        return report
+
+    report.rows = rows
+    report.width = width
+    if not grouped:
+        report.errors.append(f"No valid data found in column {spec.label}")
+        return report
+
+    sizes = [len(positions) for positions in grouped.values()]
+    report.groups = len(grouped)
+    report.grouped_rows = sum(sizes)
+    report.largest_group = max(sizes)
+    report.smallest_group = min(sizes)
+    _check_names(report, grouped, file_name)
+
+    # 已解析的工作簿不用再读取，也已经在内存中
+    cells = 0 if reuse_parsed else rows * max(report.width, 1)
+    report.estimated_seconds, report.estimated_bytes = cost_model.estimate(cells, report.groups, report.grouped_rows)
+    parsed_columns = 0 if reuse_parsed else len(set(plan.source_columns) | set(columns))
+    report.estimated_memory = parsed_columns * rows * CELL_MEMORY_ESTIMATE + report.estimated_bytes
+    return report
+
+
+def _group_scan(scanned, spec):
+    """``(header_index, plan, grouped, rows, width, columns)`` of a scan; ``grouped``
+    is None when a key column cannot be resolved"""
+    header_values, columns, rows = scanned
+    header_index = HeaderIndex(header_values)
+    order_data = OrderData(header_index, FieldPlan(header_index), columns, list(range(2, rows + 2)))
+    return _group_order_data(order_data, spec, len(header_values))
+
+
+def _group_order_data(order_data, spec, width):
+    header_index = order_data.header_index
+    grouped = None
+    if all(resolve_column(header_index, ref) is not None for ref in spec.columns):
+        grouped = group_rows(order_data, spec)
+    return header_index, order_data.plan, grouped, len(order_data), width, order_data.columns
+
+
+def _check_names(report, grouped, file_name):
+    """Warn about keys whose SI file or sheet names collide"""
+    files = {}
+    sheets = {}
+    for key in grouped:
+        if not create_safe_filename(key):
+            report.warnings.append(f"Group '{key}' has no usable characters for a file name")
+        files.setdefault(si_filename(key, file_name).lower(), []).append(key)
+        sheets.setdefault(consolidated_sheet_name(key).lower(), []).append(key)
+    for keys in files.values():
+        if len(keys) > 1:
+            report.warnings.append(f"Groups {', '.join(map(repr, keys))} map to the same SI file name")
+    for keys in sheets.values():
+        if len(keys) > 1:
+            report.warnings.append(f"Groups {', '.join(map(repr, keys))} map to the same sheet name")
+
+
+def scan_order_sheet(upload, refs):
+    """``(header values, {column: values}, data row count)`` of 'No SI Order'.
+
+    The sheet XML is streamed with ``iterparse`` and only the columns named
+    by ``refs`` are decoded. Sheets the scan cannot make sense of are read
+    with openpyxl instead.
+    """
+    with upload.open() as source, zipfile.ZipFile(source) as archive:
+        order_part = _find_sheet_part(archive, ORDER_SHEET_NAME)
+        if order_part is None:
+            raise Exception(f"'{ORDER_SHEET_NAME}' sheet not found")
+        if _find_sheet_part(archive, TEMPLATE_SHEET_NAME) is None:
+            raise Exception(f"'{TEMPLATE_SHEET_NAME}' sheet not found")
+        try:
+            with archive.open(order_part) as sheet:
+                return _scan_sheet(sheet, refs, _SharedStrings(archive))
+        except _SCAN_ERRORS:
+            pass
+    return _scan_with_openpyxl(upload, refs)
+
+
+def _scan_with_openpyxl(upload, refs):
+    with upload.open() as source:
+        workbook = load_workbook(source, read_only=True, data_only=True)
+        try:
+            header_values = list(next(workbook[ORDER_SHEET_NAME].iter_rows(max_row=1, values_only=True), ()))
+        finally:
+            workbook.close()
+    with upload.open() as source:
+        order_data = read_order_sheet(source, refs)
+    return header_values, order_data.columns, len(order_data)
+
+
+def _local(tag):
+    """Tag name without its namespace, so prefixed XML (``<x:row>``) matches too"""
+    return tag.rpartition('}')[2]
+
+
+def _scan_sheet(sheet, refs, shared_strings):
+    header = {}
+    wanted = None
+    values = {}
+    last_row = 0
+    row = 0
+    row_tags = set()
+    other_tags = set()
+    cell_tags = {}
+    column_cache = {}
+    for _, element in ElementTree.iterparse(sheet):
+        tag = element.tag
+        if tag not in row_tags:
+            if tag in other_tags:
+                continue
+            if _local(tag) != 'row':
+                other_tags.add(tag)
+                continue
+            row_tags.add(tag)
+        # 没有 r 属性的行和单元格按 openpyxl 的方式顺延编号
+        row_ref = element.get('r')
+        row = int(row_ref) if row_ref else row + 1
+        last_row = max(last_row, row)
+        if row == 1:
+            for col_idx, cell in _row_cells(element, cell_tags, column_cache):
+                header[col_idx] = _cell_value(cell, shared_strings)
+        elif row > 1:
+            if wanted is None:
+                wanted = _wanted_columns(header, refs)
+                values = {col_idx: {} for col_idx in wanted}
+            if wanted:
+                for col_idx, cell in _row_cells(element, cell_tags, column_cache):
+                    if col_idx in values:
+                        values[col_idx][row] = _cell_value(cell, shared_strings)
+        # 与 openpyxl 一样，处理完的行立即清空，只留下空的 row 元素
+        element.clear()
+
+    header_values = [header.get(col_idx) for col_idx in range(1, max(header, default=0) + 1)]
+    if wanted is None:
+        wanted = _wanted_columns(header, refs)
+        values = {col_idx: {} for col_idx in wanted}
+    rows = max(last_row - 1, 0)
+    columns = {}
+    for col_idx, cells in values.items():
+        column = [None] * rows
+        for row, value in cells.items():
+            column[row - 2] = value
+        columns[col_idx] = column
+    return header_values, columns, rows
+
+
+def _wanted_columns(header, refs):
+    """Columns of ``refs`` that resolve against the header row"""
+    header_index = HeaderIndex([header.get(col_idx) for col_idx in range(1, max(header, default=0) + 1)])
+    wanted = []
+    for ref in refs:
+        col_idx = resolve_column(header_index, ref)
+        if col_idx is not None:
+            wanted.append(col_idx)
+    return wanted
+
+
+def _row_cells(row, cell_tags, column_cache):
+    """``(column, <c> element)`` of one ``<row>``; the caches map tags and column letters"""
+    col_idx = 0
+    for cell in row:
+        is_cell = cell_tags.get(cell.tag)
+        if is_cell is None:
+            is_cell = cell_tags[cell.tag] = _local(cell.tag) == 'c'
+        if not is_cell:
+            continue
+        ref = cell.get('r')
+        if ref:
+            letters = ref.rstrip('0123456789')
+            col_idx = column_cache.get(letters)
+            if col_idx is None:
+                col_idx = column_cache[letters] = column_index_from_string(letters)
+        else:
+            col_idx += 1
+        yield col_idx, cell
+
+
+def _child(element, name):
+    for child in element:
+        if _local(child.tag) == name:
+            return child
+    return None
+
+
+def _rich_text(element):
+    """Text of an ``<si>`` or ``<is>`` element: plain ``<t>`` or rich text runs, without phonetic hints"""
+    parts = []
+    for child in element:
+        name = _local(child.tag)
+        if name == 't':
+            parts.append(child.text or '')
+        elif name == 'r':
+            text = _child(child, 't')
+            if text is not None:
+                parts.append(text.text or '')
+    return ''.join(parts)
+
+
+def _cell_value(cell, shared_strings):
+    """Decode one ``<c>`` element the way openpyxl's values_only reader does.
+
+    Number formats are not looked at, so dates stored as numbers stay serial
+    numbers; that changes no group boundaries.
+    """
+    cell_type = cell.get('t', 'n')
+    if cell_type == 'inlineStr':
+        inline = _child(cell, 'is')
+        return (_rich_text(inline) or None) if inline is not None else None
+    value = _child(cell, 'v')
+    if value is None or value.text is None:
+        return None
+    raw = value.text
+    if cell_type == 's':
+        return shared_strings[int(raw)]
+    if cell_type == 'b':
+        return bool(int(raw))
+    if cell_type in ('str', 'e'):
+        return raw
+    if cell_type == 'd':
+        return from_ISO8601(raw)
+    if '.' in raw or 'E' in raw or 'e' in raw:
+        return float(raw)
+    return int(raw)
+
+
+class _SharedStrings:
+    """sharedStrings.xml, streamed on first use"""
+
+    def __init__(self, archive):
+        self._archive = archive
+        self._strings = None
+
+    def __getitem__(self, index):
+        if self._strings is None:
+            self._strings = self._load()
+        return self._strings[index]
+
+    def _load(self):
+        try:
+            part = self._archive.open(SHARED_STRINGS_PART)
+        except KeyError:
+            return []
+        strings = []
+        with part:
+            for _, element in ElementTree.iterparse(part):
+                if _local(element.tag) == 'si':
+                    strings.append(_rich_text(element))
+                    element.clear()
+        return strings
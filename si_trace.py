@@ -0,0 +1,186 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 22:10
+# @Author  : Healer
+# @File    : si_trace.py
+# @Software: PyCharm
+
+"""Per-stage timing and memory instrumentation of the SI pipeline.
+
+Code under measurement wraps each stage in ``with tracer.stage("name"):``.
+A stage entered several times (e.g. once per group) accumulates its calls,
+wall time, CPU time and the highest tracemalloc peak. When tracing is off
+the engine uses :data:`NULL_TRACER`, whose ``stage`` hands back one shared
+do-nothing context manager.
+
+tracemalloc has a single peak per process, so memory is only measured for
+the outermost stage running in the process: stages nested inside it, or
+running at the same time on other threads, report no peak. The peak of the
+outermost stage covers every allocation of the process during the stage,
+including those of other threads.
+"""
+
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+# 同一进程里可能有多个 Tracer（例如后台任务线程），tracemalloc 按引用计数启停
+_tracemalloc_lock = threading.Lock()
+_tracemalloc_users = 0
+# 进程内正在测量内存的阶段数，峰值只属于最外层的那个
+_memory_stages = 0
+
+
+def _start_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        if _tracemalloc_users == 0 and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            _tracemalloc_users = 1
+        elif _tracemalloc_users:
+            _tracemalloc_users += 1
+        # 已由别处开启的跟踪不归我们管
+        return _tracemalloc_users > 0
+
+
+def _stop_tracemalloc():
+    global _tracemalloc_users
+    with _tracemalloc_lock:
+        _tracemalloc_users -= 1
+        if _tracemalloc_users == 0:
+            tracemalloc.stop()
+
+
+def _enter_memory_stage():
+    """Baseline of the stage being entered, or None if another stage of the process is measured"""
+    global _memory_stages
+    with _tracemalloc_lock:
+        _memory_stages += 1
+        if _memory_stages > 1:
+            return None
+        tracemalloc.reset_peak()
+        return tracemalloc.get_traced_memory()[0]
+
+
+def _exit_memory_stage(baseline):
+    """Peak KB above ``baseline`` since the stage was entered"""
+    global _memory_stages
+    with _tracemalloc_lock:
+        _memory_stages -= 1
+        if baseline is None:
+            return None
+        return (tracemalloc.get_traced_memory()[1] - baseline) / 1024
+
+
+class Tracer:
+    """Collects stage statistics of one workbook"""
+
+    enabled = True
+
+    def __init__(self, name, trace_memory=False):
+        self.name = name
+        self.trace_memory = trace_memory
+        self.stages = {}
+        self._created = time.perf_counter()
+        self._started_tracemalloc = False
+        if trace_memory:
+            self._started_tracemalloc = _start_tracemalloc()
+
+    def _entry(self, name):
+        entry = self.stages.get(name)
+        if entry is None:
+            entry = self.stages[name] = {"calls": 0, "wall": 0.0, "cpu": 0.0, "peak_kb": None}
+        return entry
+
+    @contextmanager
+    def stage(self, name):
+        entry = self._entry(name)
+        if self.trace_memory:
+            baseline = _enter_memory_stage()
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        try:
+            yield
+        finally:
+            entry["calls"] += 1
+            entry["wall"] += time.perf_counter() - wall
+            entry["cpu"] += time.process_time() - cpu
+            if self.trace_memory:
+                peak_kb = _exit_memory_stage(baseline)
+                if peak_kb is not None:
+                    entry["peak_kb"] = max(entry["peak_kb"] or 0.0, peak_kb)
+
+    def merge(self, stages):
+        """Add stage statistics measured elsewhere (e.g. in a worker process)"""
+        for name, other in stages.items():
+            entry = self._entry(name)
+            entry["calls"] += other["calls"]
+            entry["wall"] += other["wall"]
+            entry["cpu"] += other["cpu"]
+            if other["peak_kb"] is not None:
+                entry["peak_kb"] = max(entry["peak_kb"] or 0.0, other["peak_kb"])
+
+    def close(self):
+        if self._started_tracemalloc:
+            _stop_tracemalloc()
+            self._started_tracemalloc = False
+
+    def to_dict(self):
+        return {
+            "name": self.name,
+            "total_wall_ms": round((time.perf_counter() - self._created) * 1000, 3),
+            "stages": {
+                name: {
+                    "calls": entry["calls"],
+                    "wall_ms": round(entry["wall"] * 1000, 3),
+                    "cpu_ms": round(entry["cpu"] * 1000, 3),
+                    "peak_kb": round(entry["peak_kb"], 1) if entry["peak_kb"] is not None else None,
+                }
+                for name, entry in self.stages.items()
+            },
+        }
+
+
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+
+class NullTracer:
+    """Tracer that records nothing"""
+
+    enabled = False
+    _stage = _NullStage()
+
+    def stage(self, name):
+        return self._stage
+
+    def merge(self, stages):
+        pass
+
+    def close(self):
+        pass
+
+    def to_dict(self):
+        return None
+
+
+NULL_TRACER = NullTracer()
+
+
+def trace_rows(trace):
+    """Rows of a ``Tracer.to_dict()`` result for a summary table"""
+    return [
+        {
+            "Stage": name,
+            "Calls": stage["calls"],
+            "Wall (ms)": stage["wall_ms"],
+            "CPU (ms)": stage["cpu_ms"],
+            "Peak (KB)": stage["peak_kb"],
+        }
+        for name, stage in trace["stages"].items()
+    ]
@@ -0,0 +1,216 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/19 11:30
+# @Author  : Healer
+# @File    : si_upload.py
+# @Software: PyCharm
+
+"""Taking in uploaded workbooks without holding extra copies.
+
+:class:`UploadIntake` reads each upload in chunks. Small uploads stay in
+memory; once an upload passes the spool threshold the rest goes to a
+temporary file. The SHA-256 used by the result cache is computed while
+reading, and size limits are enforced before anything is parsed.
+
+Uploads that are already in memory (Streamlit's ``UploadedFile`` is a
+``BytesIO``) are not read at all: their bytes are shared and hashed in
+place, and only spooled when they pass the threshold.
+
+An :class:`Upload` hands the loader a file object: a ``BytesIO`` sharing
+the bytes in memory, or the spooled file opened for reading.
+"""
+
+import hashlib
+import os
+import shutil
+import tempfile
+import weakref
+from io import BytesIO
+
+CHUNK_SIZE = 1024 * 1024
+
+# 超过该大小的上传转存到磁盘
+DEFAULT_SPOOL_THRESHOLD_MB = 32
+
+
+class UploadRejected(Exception):
+    """An upload is empty or breaks the per-file or per-batch size limit"""
+
+
+def _remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+
+class Upload:
+    """One received workbook: ``data`` in memory or a file at ``path``.
+
+    ``owned`` files are temporary spool files and are deleted by
+    :meth:`discard` (or when the Upload is garbage collected in the process
+    that created it). Uploads pickle cheaply for worker processes: a
+    spooled upload only sends its path.
+    """
+
+    def __init__(self, name, data=None, path=None, size=None, digest=None, owned=False):
+        self.name = name
+        self.data = data
+        self.path = path
+        if size is None:
+            size = len(data) if data is not None else os.path.getsize(path)
+        self.size = size
+        self._digest = digest
+        self._finalizer = weakref.finalize(self, _remove_file, path) if owned else None
+
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        # 临时文件只由创建它的进程删除
+        state['_finalizer'] = None
+        return state
+
+    @property
+    def in_memory(self):
+        return self.data is not None
+
+    @property
+    def digest(self):
+        """SHA-256 of the content; spooled uploads already know it"""
+        if self._digest is None:
+            if self.data is not None:
+                self._digest = hashlib.sha256(self.data).hexdigest()
+            else:
+                digest = hashlib.sha256()
+                with open(self.path, 'rb') as f:
+                    for chunk in iter(lambda: f.read(CHUNK_SIZE), b''):
+                        digest.update(chunk)
+                self._digest = digest.hexdigest()
+        return self._digest
+
+    def open(self):
+        """Binary file object over the content, without copying it.
+
+        The caller owns the returned file and closes it (``with upload.open() as f``);
+        zipfile and openpyxl leave file objects passed to them open.
+        """
+        if self.data is not None:
+            # BytesIO 与 bytes 共享缓冲区，只有写入时才复制
+            return BytesIO(self.data)
+        # 按需从磁盘（页缓存）读取，zipfile 需要可 seek 的文件对象
+        return open(self.path, 'rb')
+
+    def save_as(self, path):
+        """Write the content to ``path``"""
+        if self.data is not None:
+            with open(path, 'wb') as f:
+                f.write(self.data)
+        else:
+            shutil.copyfile(self.path, path)
+
+    def discard(self):
+        """Release the content; the Upload cannot be opened afterwards"""
+        self.data = None
+        if self._finalizer is not None:
+            self._finalizer()
+        self.path = None
+
+
+class UploadIntake:
+    """Receives the uploads of one batch.
+
+    ``max_file_mb`` and ``max_batch_mb`` (0 = unlimited) are checked while
+    reading, so an oversized upload is rejected as soon as it crosses the
+    limit. Uploads larger than ``spool_threshold_mb`` are spooled to
+    ``spool_dir`` (the system temp directory by default).
+    """
+
+    def __init__(self, max_file_mb=0, max_batch_mb=0, spool_threshold_mb=DEFAULT_SPOOL_THRESHOLD_MB, spool_dir=None):
+        self.max_file_mb = max_file_mb
+        self.max_batch_mb = max_batch_mb
+        self.max_file_bytes = int(max_file_mb * 1024 * 1024)
+        self.max_batch_bytes = int(max_batch_mb * 1024 * 1024)
+        self.spool_threshold = int(spool_threshold_mb * 1024 * 1024)
+        self.spool_dir = spool_dir
+        # 已接收的上传总大小
+        self.total = 0
+
+    def _check(self, name, size):
+        if self.max_file_bytes and size > self.max_file_bytes:
+            raise UploadRejected(f"{name} is larger than the {self.max_file_mb:g} MB limit per file")
+        if self.max_batch_bytes and self.total + size > self.max_batch_bytes:
+            raise UploadRejected(f"{name} would take the batch past the {self.max_batch_mb:g} MB limit")
+
+    def _accept(self, upload):
+        if upload.size == 0:
+            upload.discard()
+            raise UploadRejected(f"{upload.name} is empty")
+        self.total += upload.size
+        return upload
+
+    def receive(self, name, fileobj):
+        """Take ``fileobj`` (e.g. a Streamlit UploadedFile); other file objects are read in chunks"""
+        if isinstance(fileobj, BytesIO):
+            # getvalue() 直接返回 BytesIO 内部的 bytes，不复制
+            return self._receive_buffer(name, fileobj.getvalue())
+        if hasattr(fileobj, 'seek'):
+            fileobj.seek(0)
+        digest = hashlib.sha256()
+        chunks = []
+        size = 0
+        spool = None
+        try:
+            for chunk in iter(lambda: fileobj.read(CHUNK_SIZE), b''):
+                size += len(chunk)
+                self._check(name, size)
+                digest.update(chunk)
+                if spool is None and size > self.spool_threshold:
+                    # 超过阈值：已读的部分和后续内容都写入临时文件
+                    spool = tempfile.NamedTemporaryFile(prefix='si_upload_', dir=self.spool_dir, delete=False)
+                    spool.writelines(chunks)
+                    chunks = None
+                if spool is not None:
+                    spool.write(chunk)
+                else:
+                    chunks.append(chunk)
+        except BaseException:
+            if spool is not None:
+                spool.close()
+                _remove_file(spool.name)
+            raise
+        if spool is not None:
+            spool.close()
+            upload = Upload(name, path=spool.name, size=size, digest=digest.hexdigest(), owned=True)
+        else:
+            upload = Upload(name, data=b''.join(chunks), digest=digest.hexdigest())
+        return self._accept(upload)
+
+    def _receive_buffer(self, name, data):
+        """Hash ``data`` in chunks without copying it; spool it only past the threshold"""
+        size = len(data)
+        self._check(name, size)
+        view = memoryview(data)
+        chunks = [view[start:start + CHUNK_SIZE] for start in range(0, size, CHUNK_SIZE)]
+        digest = hashlib.sha256()
+        for chunk in chunks:
+            digest.update(chunk)
+        if size <= self.spool_threshold:
+            return self._accept(Upload(name, data=data, digest=digest.hexdigest()))
+        spool = tempfile.NamedTemporaryFile(prefix='si_upload_', dir=self.spool_dir, delete=False)
+        try:
+            spool.writelines(chunks)
+        except BaseException:
+            spool.close()
+            _remove_file(spool.name)
+            raise
+        spool.close()
+        return self._accept(Upload(name, path=spool.name, size=size, digest=digest.hexdigest(), owned=True))
+
+    def from_bytes(self, name, data):
+        """Wrap content that is already in memory"""
+        self._check(name, len(data))
+        return self._accept(Upload(name, data=data))
+
+    def from_path(self, name, path):
+        """Use a file that is already on disk in place; it is hashed only when needed"""
+        self._check(name, os.path.getsize(path))
+        return self._accept(Upload(name, path=path))
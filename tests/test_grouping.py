@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/20 09:30
+# @Author  : Healer
+# @File    : test_grouping.py
+# @Software: PyCharm
+
+"""Tests of si_grouping.group_rows"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from si_engine import HeaderIndex, OrderData  # noqa: E402
+from si_grouping import GroupSpec, group_rows  # noqa: E402
+
+HEADERS = ["Customer", "Port", "Qty"]
+
+
+def order_data(rows):
+    """OrderData with the columns A (Customer), B (Port) and C (Qty)"""
+    columns = {col_idx: [row[col_idx - 1] for row in rows] for col_idx in range(1, len(HEADERS) + 1)}
+    return OrderData(HeaderIndex(HEADERS), None, columns, list(range(2, len(rows) + 2)))
+
+
+def test_single_column_groups_in_first_appearance_order():
+    data = order_data([("G2", None, 1), ("G1", None, 2), ("G2", None, 3), (None, None, 4), (0, None, 5)])
+    assert group_rows(data, GroupSpec("A")) == {"G2": [0, 2], "G1": [1]}
+
+
+def test_composite_key_joins_parts():
+    data = order_data([("ACME", "Rotterdam", 1), ("ACME", "Hamburg", 2), ("ACME", "Rotterdam", 3)])
+    assert group_rows(data, GroupSpec(["Customer", "Port"])) == {
+        "ACME - Rotterdam": [0, 2],
+        "ACME - Hamburg": [1],
+    }
+
+
+def test_composite_key_keeps_blank_parts_in_place():
+    data = order_data([("X", None, 1), (None, "X", 2), ("X", None, 3)])
+    assert group_rows(data, GroupSpec(["A", "B"])) == {"X": [0, 2], "X (2)": [1]}
+
+
+def test_composite_keys_with_the_same_text_stay_apart():
+    data = order_data([("A - B", "C", 1), ("A", "B - C", 2)])
+    assert group_rows(data, GroupSpec(["A", "B"])) == {"A - B - C": [0], "A - B - C (2)": [1]}
+
+
+def test_normalization_merges_equivalent_keys():
+    data = order_data([(" acme  corp ", None, 1), ("ACME CORP", None, 2), (1001.0, None, 3), ("1001", None, 4)])
+    spec = GroupSpec("A", case="upper", collapse_spaces=True, numbers=True)
+    assert group_rows(data, spec) == {"ACME CORP": [0, 1], "1001": [2, 3]}
+
+
+def test_without_normalization_numbers_and_text_differ():
+    data = order_data([(1001, None, 1), ("1001", None, 2), (True, None, 3), (1, None, 4)])
+    assert group_rows(data, GroupSpec("A")) == {"1001": [0, 1], "True": [2], "1": [3]}
+
+
+def test_group_order():
+    data = order_data([("G10", None, 1), ("G2", None, 2), ("G2", None, 3), ("G1", None, 4)])
+    assert list(group_rows(data, GroupSpec("A", group_order="key"))) == ["G1", "G2", "G10"]
+    assert list(group_rows(data, GroupSpec("A", group_order="key", descending=True))) == ["G10", "G2", "G1"]
+    assert list(group_rows(data, GroupSpec("A", group_order="size"))) == ["G2", "G10", "G1"]
+
+
+def test_row_order_within_groups():
+    data = order_data([("G1", None, 3), ("G1", None, None), ("G1", None, 1), ("G2", None, 2)])
+    assert group_rows(data, GroupSpec("A", row_order="Qty")) == {"G1": [2, 0, 1], "G2": [3]}
+    assert group_rows(data, GroupSpec("A", row_order="C", row_descending=True)) == {"G1": [0, 2, 1], "G2": [3]}
+
+
+def test_no_keys():
+    assert group_rows(order_data([(None, None, 1), ("", None, 2)]), GroupSpec("A")) == {}
+    assert group_rows(order_data([]), GroupSpec("A")) == {}
@@ -0,0 +1,197 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+# @Time    : 2026/10/18 14:40
+# @Author  : Healer
+# @File    : xlsx_template.py
+# @Software: PyCharm
+
+"""Direct XLSX templating: SI files are produced by patching sheet XML.
+
+The template is rendered through openpyxl exactly once into a one-sheet
+package. Every SI after that copies the untouched parts (styles.xml, theme,
+docProps, ...) byte-for-byte and only rewrites ``sheetData`` of the
+worksheet, so the per-SI cost is a small constant plus the row count.
+
+Anything the patcher does not handle raises :class:`UnsupportedPatch`;
+callers then fall back to the openpyxl object model.
+"""
+
+import datetime
+import decimal
+import math
+import re
+import zipfile
+from io import BytesIO
+from xml.sax.saxutils import escape
+
+import openpyxl
+from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+from openpyxl.utils import column_index_from_string, get_column_letter, range_boundaries
+from openpyxl.utils.cell import coordinate_from_string
+
+from si_engine import UnsupportedPatch
+
+SHEET_PART = 'xl/worksheets/sheet1.xml'
+
+_SHEET_DATA_RE = re.compile(r'<sheetData\s*/>|<sheetData>(.*?)</sheetData>', re.S)
+_ROW_RE = re.compile(r'<row\b([^>]*?)\s*/>|<row\b([^>]*)>(.*?)</row>', re.S)
+_CELL_RE = re.compile(r'<c\b[^>]*?/>|<c\b[^>]*>.*?</c>', re.S)
+_ATTR_RE = re.compile(r'(\w+)="([^"]*)"')
+_DIMENSION_RE = re.compile(r'<dimension ref="[^"]*"\s*/>')
+
+
+class XlsxTemplate:
+    """One-sheet SI package compiled from a TemplateSnapshot"""
+
+    def __init__(self, snapshot, sheet_title="SI"):
+        workbook = openpyxl.Workbook()
+        sheet = workbook.active
+        sheet.title = sheet_title
+        snapshot.stamp(sheet)
+
+        buffer = BytesIO()
+        workbook.save(buffer)
+        self.max_row = sheet.max_row
+        self._compile(buffer.getvalue(), snapshot.merged_ranges)
+
+    def _compile(self, package, merged_ranges):
+        with zipfile.ZipFile(BytesIO(package)) as archive:
+            # 除工作表外的部件原样保留
+            self.parts = [
+                (info.filename, archive.read(info.filename))
+                for info in archive.infolist()
+                if info.filename != SHEET_PART
+            ]
+            sheet_xml = archive.read(SHEET_PART).decode('utf-8')
+
+        match = _SHEET_DATA_RE.search(sheet_xml)
+        self._head = sheet_xml[:match.start()]
+        self._tail = sheet_xml[match.end():]
+
+        # row number -> (row attributes, {column: (cell xml, style id)})
+        self.rows = {}
+        for row_match in _ROW_RE.finditer(match.group(1) or ''):
+            attrs = row_match.group(1) if row_match.group(1) is not None else row_match.group(2)
+            row_num = int(dict(_ATTR_RE.findall(attrs))['r'])
+            cells = {}
+            for cell_xml in _CELL_RE.findall(row_match.group(3) or ''):
+                cell_attrs = dict(_ATTR_RE.findall(cell_xml.split('>', 1)[0]))
+                column = column_index_from_string(coordinate_from_string(cell_attrs['r'])[0])
+                cells[column] = (cell_xml, cell_attrs.get('s'))
+            self.rows[row_num] = (attrs.strip(), cells)
+
+        # 合并区域中非左上角的单元格不能写值（openpyxl 同样会报错）
+        self._merged_cells = set()
+        for merged_range in merged_ranges:
+            min_col, min_row, max_col, max_row = range_boundaries(merged_range)
+            for row in range(min_row, max_row + 1):
+                for column in range(min_col, max_col + 1):
+                    if (row, column) != (min_row, min_col):
+                        self._merged_cells.add((row, column))
+
+    def render(self, rendered, destination, compresslevel=None):
+        """Write the RenderedGroup as an SI file to ``destination`` (path or file object)"""
+        patches = {}
+        for row, column, value in rendered.header_cells:
+            patches[(row, column)] = value
+
+        # 与 fill_table_data 相同：超出模板的行沿用上一行的样式
+        extra_styles = {}
+        max_row = self.max_row
+        for target_row, cells in rendered.table_rows:
+            if target_row >= rendered.extend_from:
+                for column in range(1, rendered.table_width + 1):
+                    extra_styles[(target_row, column)] = self._style_at(target_row - 1, column, extra_styles)
+            max_row = max(max_row, target_row)
+            for column, value in cells:
+                patches[(target_row, column)] = value
+        max_row = max([max_row] + [row for row, _ in patches])
+
+        sheet_xml = self._render_sheet(patches, extra_styles, max_row)
+
+        with zipfile.ZipFile(destination, 'w', zipfile.ZIP_DEFLATED, compresslevel=compresslevel) as archive:
+            for name, data in self.parts:
+                archive.writestr(name, data)
+            archive.writestr(SHEET_PART, sheet_xml)
+
+    def _style_at(self, row, column, extra_styles):
+        if (row, column) in extra_styles:
+            return extra_styles[(row, column)]
+        template_row = self.rows.get(row)
+        if template_row and column in template_row[1]:
+            return template_row[1][column][1]
+        return None
+
+    def _render_sheet(self, patches, extra_styles, max_row):
+        for position in patches:
+            if position in self._merged_cells:
+                raise UnsupportedPatch(f"{_coordinate(*position)} is inside a merged range")
+
+        # row -> {column: style id} for cells that only exist in this SI
+        new_cells = {}
+        for (row, column), style_id in extra_styles.items():
+            new_cells.setdefault(row, {})[column] = style_id
+        for row, column in patches:
+            template_row = self.rows.get(row)
+            if not (template_row and column in template_row[1]):
+                new_cells.setdefault(row, {}).setdefault(column, None)
+
+        parts = []
+        max_column = 1
+        for row in sorted(set(self.rows) | set(new_cells)):
+            attrs, template_cells = self.rows.get(row, (f'r="{row}"', {}))
+            columns = set(template_cells) | set(new_cells.get(row, ()))
+            if columns:
+                max_column = max(max_column, max(columns))
+            cells = []
+            for column in sorted(columns):
+                if (row, column) in patches:
+                    if column in template_cells:
+                        style_id = template_cells[column][1]
+                    else:
+                        style_id = new_cells[row][column]
+                    cells.append(_cell_xml(row, column, style_id, patches[(row, column)]))
+                elif column in template_cells:
+                    cells.append(template_cells[column][0])
+                else:
+                    cells.append(_cell_xml(row, column, new_cells[row][column], None))
+            if cells:
+                parts.append(f'<row {attrs}>{"".join(cells)}</row>')
+            else:
+                parts.append(f'<row {attrs}/>')
+
+        head = _DIMENSION_RE.sub(
+            f'<dimension ref="A1:{get_column_letter(max_column)}{max_row}"/>', self._head, count=1
+        )
+        return f'{head}<sheetData>{"".join(parts)}</sheetData>{self._tail}'.encode('utf-8')
+
+
+def _coordinate(row, column):
+    return f"{get_column_letter(column)}{row}"
+
+
+def _cell_xml(row, column, style_id, value):
+    """Serialize one cell the way openpyxl would, or raise UnsupportedPatch"""
+    attrs = f'r="{_coordinate(row, column)}"'
+    if style_id is not None:
+        attrs += f' s="{style_id}"'
+
+    if value is None:
+        return f'<c {attrs} t="n"/>'
+    if isinstance(value, bool):
+        return f'<c {attrs} t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, float) and not math.isfinite(value):
+        raise UnsupportedPatch("non-finite numbers")
+    if isinstance(value, (int, float, decimal.Decimal)):
+        return f'<c {attrs} t="n"><v>{value}</v></c>'
+    if isinstance(value, str):
+        if value.startswith('=') and len(value) > 1:
+            raise UnsupportedPatch("formula values")
+        if ILLEGAL_CHARACTERS_RE.search(value):
+            raise UnsupportedPatch("illegal characters")
+        space = ' xml:space="preserve"' if value != value.strip() else ''
+        return f'<c {attrs} t="inlineStr"><is><t{space}>{escape(value)}</t></is></c>'
+    if isinstance(value, (datetime.date, datetime.time, datetime.timedelta)):
+        # 日期需要数字格式，交给 openpyxl 处理
+        raise UnsupportedPatch("date and time values")
+    raise UnsupportedPatch(f"values of type {type(value).__name__}")